@@ -0,0 +1,50 @@
+"""
+Snapshot and restore DATA_DIR.
+
+    python backup.py snapshot            # incremental point-in-time snapshot
+    python backup.py list                # available snapshots
+    python backup.py restore <id> [dir]  # restore (default: DATA_DIR)
+    python backup.py restore <id> --clean  # also remove DATA_DIR files not in the snapshot
+
+Stop the bot before restoring into its live DATA_DIR. While the bot is
+running, prefer /backup: the CLI only holds the stats lock, while the bot
+also pauses its own writer during the snapshot.
+"""
+import sys
+from config import DATA_DIR
+from storage import snapshot
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+
+    if command == "snapshot":
+        result = snapshot.take_snapshot()
+        print(f"✅ Snapshot {result['id']}: {result['files']} files, "
+              f"{result['new_objects']} new objects ({result['new_bytes'] // 1024} KB stored)")
+
+    elif command == "list":
+        snapshots = snapshot.list_snapshots()
+        if not snapshots:
+            print("No snapshots yet.")
+        for snapshot_id in snapshots:
+            manifest = snapshot.load_manifest(snapshot_id)
+            size = sum(entry["size"] for entry in manifest["files"].values())
+            print(f"{snapshot_id}  {len(manifest['files']):>6} files  {size // 1024:>8} KB")
+
+    elif command == "restore" and len(sys.argv) > 2:
+        args = [a for a in sys.argv[2:] if a != "--clean"]
+        clean = len(args) < len(sys.argv) - 2
+        target = args[1] if len(args) > 1 else DATA_DIR
+        try:
+            count = snapshot.restore_snapshot(args[0], target, clean=clean)
+        except (OSError, ValueError) as e:
+            print(f"❌ Restore failed: {e}")
+            sys.exit(1)
+        print(f"✅ Restored {count} files from {args[0]} into {target}")
+
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
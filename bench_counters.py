@@ -0,0 +1,119 @@
+"""
+Compare the JSON and Redis counter backends.
+
+    python bench_counters.py [increments] [days]
+
+Redis runs against fakeredis when it is installed (pip install fakeredis),
+otherwise against REDIS_URL (e.g. a local redis-server). Everything is
+written to a temporary DATA_DIR and to a throwaway Redis key prefix, so real
+data is not touched. Both backends must return identical aggregates and
+identical per-day reads (read_days, read_day, including a day with no data);
+the script exits with status 1 if they do not, so it doubles as an offline
+parity check for the Redis backend.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Point config at a scratch directory before anything imports it
+_tmp = tempfile.mkdtemp(prefix="bench_counters_")
+os.environ["DATA_DIR"] = os.path.join(_tmp, "data")
+os.environ["EXPORT_DIR"] = os.path.join(_tmp, "exports")
+os.environ["WORKER_ID"] = ""
+sys.path.append(os.getcwd())
+
+from config import WRITE_BATCH_SIZE, REDIS_URL
+from storage import stats_store, redis_counters
+
+def make_batches(increments: int, days: int):
+    """Increments grouped the way the storage writer commits them."""
+    rng = random.Random(42)
+    dates = [f"2026-01-{d + 1:02d}" for d in range(days)]
+    chats = [str(-1001000000000 - i) for i in range(40)]
+    teachers = [f"T{i:03d}" for i in range(60)]
+
+    batches = []
+    for start in range(0, increments, WRITE_BATCH_SIZE):
+        deltas = {}
+        for _ in range(min(WRITE_BATCH_SIZE, increments - start)):
+            counts = (
+                deltas.setdefault(rng.choice(dates), {})
+                .setdefault(rng.choice(chats), {})
+                .setdefault(rng.choice(teachers), {})
+            )
+            msg_type = rng.choice(stats_store.MESSAGE_TYPES)
+            counts[msg_type] = counts.get(msg_type, 0) + 1
+        batches.append(deltas)
+    return dates, batches
+
+def run(name: str, dates: list, batches: list) -> dict:
+    start = time.perf_counter()
+    for deltas in batches:
+        stats_store.merge_days(deltas)
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    total = {}
+    for day in stats_store.read_days(dates):
+        stats_store.add_day(total, day)
+    read_time = time.perf_counter() - start
+
+    print(f"{name:<6} write {write_time:8.3f}s ({len(batches)} batches)   read {read_time:8.3f}s ({len(dates)} days)")
+    return total
+
+def read_back(dates: list) -> list:
+    """Per-day reads through both entry points, as Counters (the JSON backend zero-fills types)."""
+    empty_date = "2025-12-31"  # never written
+    days = stats_store.read_days(dates + [empty_date])
+    days += [stats_store.read_day(dates[0]), stats_store.read_day(empty_date)]
+    return [stats_store.from_json(day) for day in days]
+
+def redis_client():
+    try:
+        import fakeredis
+        print("Redis: fakeredis")
+        return fakeredis.FakeRedis(decode_responses=True)
+    except ImportError:
+        pass
+    if redis_counters.redis is None:
+        return None
+    print(f"Redis: {REDIS_URL}")
+    return redis_counters.redis.Redis.from_url(REDIS_URL, decode_responses=True)
+
+def main():
+    increments = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    os.makedirs(stats_store.STATS_DIR, exist_ok=True)
+    dates, batches = make_batches(increments, days)
+    print(f"{increments} increments over {days} days, batch size {WRITE_BATCH_SIZE}\n")
+
+    stats_store.set_backend(None)
+    json_total = run("json", dates, batches)
+    json_days = read_back(dates)
+
+    client = redis_client()
+    if client is None:
+        print("redis  skipped (install fakeredis or redis)")
+        return
+
+    redis_counters.KEY_PREFIX = f"bench:{os.getpid()}"
+    stats_store.set_backend(redis_counters.RedisCounters(client))
+    try:
+        redis_total = run("redis", dates, batches)
+        redis_days = read_back(dates)
+    finally:
+        keys = list(client.scan_iter(f"{redis_counters.KEY_PREFIX}:*"))
+        if keys:
+            client.delete(*keys)
+        stats_store.set_backend(None)
+
+    differing = [i for i, (a, b) in enumerate(zip(json_days, redis_days)) if a != b]
+    if json_total != redis_total or differing or len(json_days) != len(redis_days):
+        print(f"\n❌ Backends differ (aggregate match: {json_total == redis_total}, differing reads: {differing})")
+        sys.exit(1)
+    print("\n✅ Aggregates and per-day reads match")
+
+if __name__ == "__main__":
+    main()
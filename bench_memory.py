@@ -0,0 +1,98 @@
+"""
+Measure aggregation memory: per-pair dicts vs Counters.
+
+    python bench_memory.py [chats] [teachers_per_chat] [days]
+
+Builds the same chat -> teacher -> counters aggregate three ways from
+synthetic day data (dicts, Counters.add per pair, and the bulk
+counters.sum_days that stats_store uses) and reports tracemalloc's peak and
+retained size for each, plus the best time of three untraced runs
+(tracing slows allocation-heavy code down unevenly).
+"""
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.getcwd())
+
+from storage.counters import Counters, MESSAGE_TYPES, sum_days
+
+def make_days(chats: int, teachers: int, days: int) -> list:
+    rng = random.Random(7)
+    chat_ids = [str(-1001000000000 - i) for i in range(chats)]
+    teacher_ids = [f"T{i:04d}" for i in range(teachers * 4)]
+    result = []
+    for _ in range(days):
+        day = {}
+        for chat_id in chat_ids:
+            for t_id in rng.sample(teacher_ids, teachers):
+                day.setdefault(chat_id, {})[t_id] = {t: rng.randint(0, 40) for t in MESSAGE_TYPES}
+        result.append(day)
+    return result
+
+def aggregate_dicts(days: list) -> dict:
+    """The pre-Counters aggregation: a fresh six-key dict per pair."""
+    out = {}
+    for day in days:
+        for chat_id, t_stats in day.items():
+            chat_agg = out.setdefault(chat_id, {})
+            for t_id, counters in t_stats.items():
+                agg = chat_agg.get(t_id)
+                if agg is None:
+                    agg = chat_agg[t_id] = {t: 0 for t in MESSAGE_TYPES}
+                for k, v in counters.items():
+                    agg[k] = agg.get(k, 0) + v
+    return out
+
+def aggregate_counters(days: list) -> dict:
+    out = {}
+    for day in days:
+        for chat_id, t_stats in day.items():
+            chat_agg = out.setdefault(chat_id, {})
+            for t_id, counters in t_stats.items():
+                agg = chat_agg.get(t_id)
+                if agg is None:
+                    agg = chat_agg[t_id] = Counters()
+                agg.add(counters)
+    return out
+
+def measure(name: str, func, days: list):
+    elapsed = float("inf")
+    for _ in range(3):  # best of three, the machine may be busy
+        gc.collect()
+        start = time.perf_counter()
+        func(days)
+        elapsed = min(elapsed, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    result = func(days)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pairs = sum(len(t) for t in result.values())
+    print(f"{name:<9} {pairs:>8} pairs   retained {retained / 1024:10.1f} KiB   peak {peak / 1024:10.1f} KiB   {elapsed:6.3f}s")
+    return result
+
+def main():
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    teachers = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    days = int(sys.argv[3]) if len(sys.argv) > 3 else 30
+    print(f"{chats} chats x {teachers} teachers/day x {days} days\n")
+
+    data = make_days(chats, teachers, days)
+    as_dicts = measure("dicts", aggregate_dicts, data)
+    as_counters = measure("Counters", aggregate_counters, data)
+    as_sums = measure("sum_days", sum_days, data)
+
+    same = all(
+        as_counters[c][t].to_dict() == counts and as_sums[c][t].to_dict() == counts
+        for c, t_stats in as_dicts.items()
+        for t, counts in t_stats.items()
+    )
+    print("\n✅ Totals match" if same else "\n❌ Totals differ")
+
+if __name__ == "__main__":
+    main()
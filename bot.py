@@ -6,10 +6,13 @@ from telegram.ext import (
     MessageHandler, 
     CallbackQueryHandler, 
     filters, 
-    ConversationHandler
+    ConversationHandler,
+    InlineQueryHandler
 )
-from config import BOT_TOKEN, PROXY_URL
-from handlers import tracking, admin, registration
+from telegram import Update
+from config import BOT_TOKEN, PROXY_URL, WORKER_ID, SCHEDULER_ENABLED, DEDUPE_SAVE_INTERVAL
+from handlers import tracking, admin, registration, scheduled, pagination, rate_limiter, dedupe
+from storage import writer, async_db, registry_cache
 
 # ============================================================================
 # LOGGING CONFIGURATION - STRICT: ONLY ADMIN ACTIONS AND ERRORS
@@ -58,6 +61,18 @@ async def error_handler(update: object, context) -> None:
         except:
             pass
 
+async def post_init(application) -> None:
+    """Start the storage writer inside the bot's event loop."""
+    dedupe.load()
+    # Load the registry snapshot off the loop before the first update arrives
+    await async_db.run_io(registry_cache.refresh)
+    writer.get_writer().start()
+
+async def post_shutdown(application) -> None:
+    """Commit queued writes (counters are not awaited by handlers) before exit."""
+    await writer.get_writer().stop()
+    dedupe.save(force=True)
+
 def main():
     if not BOT_TOKEN:
         logger.error("BOT_TOKEN not found in .env file")
@@ -66,6 +81,12 @@ def main():
     # Create the Application with increased timeouts for stability
     builder = ApplicationBuilder().token(BOT_TOKEN)
     builder.connect_timeout(30).read_timeout(30)
+    builder.post_init(post_init).post_shutdown(post_shutdown)
+    
+    # Central pacing of all outbound API calls (global, per-group, per-chat)
+    limiter = rate_limiter.build_rate_limiter()
+    if limiter:
+        builder.rate_limiter(limiter)
     
     if PROXY_URL:
         logger.info(f"Using proxy: {PROXY_URL}")
@@ -74,6 +95,8 @@ def main():
     application = builder.build()
     
     logger.info("Bot initializing...")
+    if WORKER_ID:
+        logger.info(f"Worker {WORKER_ID}: writing counters to its own stats shard")
 
     # ========================================================================
     # ADMIN CONVERSATION HANDLER (private chat only)
@@ -95,6 +118,9 @@ def main():
     
     # Global handler for Admin Actions (Approve/Reject)
     application.add_handler(CallbackQueryHandler(registration.handle_registration_callback, pattern="^reg:"))
+    
+    # Report paging (◀ ▶), works after the admin conversation has ended
+    application.add_handler(CallbackQueryHandler(pagination.handle_page_callback, pattern="^pg:"))
 
     # ========================================================================
     # ADMIN CONVERSATION HANDLER (private chat only)
@@ -139,14 +165,24 @@ def main():
     # /sync_groups - manual cleanup (private chat only)
     application.add_handler(CommandHandler("sync_groups", admin.sync_groups, filters=filters.ChatType.PRIVATE))
     
+    # /backup - incremental snapshot of data/ (private chat only)
+    application.add_handler(CommandHandler("backup", admin.backup_command, filters=filters.ChatType.PRIVATE))
+    # /export_raw - per-day rows as gzip CSV or Parquet (private chat only)
+    application.add_handler(CommandHandler("export_raw", admin.export_raw_command, filters=filters.ChatType.PRIVATE))
+    
     # /diag - diagnostics (works anywhere)
     application.add_handler(CommandHandler("diag", admin.diag_command))
+    
+    # @bot <prefix> - admin search over teachers and groups
+    application.add_handler(InlineQueryHandler(admin.inline_search))
 
     # ========================================================================
     # MEMBERSHIP TRACKING
     # ========================================================================
     from telegram.ext import ChatMemberHandler
     application.add_handler(ChatMemberHandler(tracking.handle_my_chat_member, ChatMemberHandler.MY_CHAT_MEMBER))
+    # Users joining/leaving groups keep the membership cache fresh (needs admin rights + allowed_updates)
+    application.add_handler(ChatMemberHandler(tracking.handle_chat_member, ChatMemberHandler.CHAT_MEMBER))
 
     # ========================================================================
     # ACTIVITY TRACKING (groups only)
@@ -159,6 +195,16 @@ def main():
         ),
         group=1
     )
+    # Counted message ids survive a crash, not only a clean shutdown (per worker)
+    if DEDUPE_SAVE_INTERVAL > 0:
+        application.job_queue.run_repeating(dedupe.save_job, interval=DEDUPE_SAVE_INTERVAL, name="dedupe_save")
+
+    # ========================================================================
+    # SCHEDULED REPORTS (JobQueue)
+    # ========================================================================
+    # With several workers only one should send digests and exports
+    if SCHEDULER_ENABLED:
+        scheduled.register_jobs(application)
 
     # ========================================================================
     # ERROR HANDLER
@@ -167,7 +213,8 @@ def main():
 
     logger.info("Bot started successfully")
     try:
-        application.run_polling(drop_pending_updates=True, bootstrap_retries=5)
+        # chat_member updates are only delivered when requested explicitly
+        application.run_polling(drop_pending_updates=True, bootstrap_retries=5, allowed_updates=Update.ALL_TYPES)
     except Exception as e:
         if "ConnectError" in str(e) or "NetworkError" in str(e):
             logger.error("\n" + "="*50 + 
@@ -14,6 +14,70 @@ EXPORT_DIR = os.getenv("EXPORT_DIR", "./exports")
 TZ = os.getenv("TZ", "Asia/Tashkent")
 PROXY_URL = os.getenv("PROXY_URL") # Optional proxy URL (e.g., http://127.0.0.1:1080)
 
+# Scheduled reports (HH:MM in TZ)
+PRECOMPUTE_TIME = os.getenv("PRECOMPUTE_TIME", "00:10") # Off-peak pre-aggregation of standard windows
+DIGEST_TIME = os.getenv("DIGEST_TIME", "21:00") # Daily digest / weekly summary / monthly Excel delivery
+WEEKLY_REPORT_DAY = int(os.getenv("WEEKLY_REPORT_DAY", "1")) # 0=Sunday ... 6=Saturday
+
+# Rendered report cache
+REPORT_CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", "300")) # seconds
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "64"))
+
+# Storage I/O threads (reads; writes always use a single thread)
+STORAGE_READ_WORKERS = int(os.getenv("STORAGE_READ_WORKERS", "4"))
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "500")) # max mutations per group commit
+WRITE_LINGER_MS = int(os.getenv("WRITE_LINGER_MS", "50")) # wait for more mutations before committing
+
+# Horizontal scaling: each worker process writes its own counter shard
+WORKER_ID = os.getenv("WORKER_ID", "").strip() # empty = single process, shared day files
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1" # enable on exactly one worker
+
+# Counter storage: "json" (day files) or "redis" (shared by all workers)
+COUNTER_BACKEND = os.getenv("COUNTER_BACKEND", "json").strip().lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Stats retention: closed months are folded into one archive file each
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "gzip").strip().lower() # gzip, zstd or none
+STATS_RETENTION_DAYS = int(os.getenv("STATS_RETENTION_DAYS", "0")) # 0 = keep forever
+
+# Incremental snapshots of DATA_DIR (/backup, backup.py); keep outside DATA_DIR
+BACKUP_DIR = os.getenv("BACKUP_DIR", "./backups")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "14")) # snapshots kept; older ones are pruned
+
+# Admin lists
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "15")) # teachers/groups per screen
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "10")) # entries in top/bottom leaderboards
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "50000")) # rows per Parquet row group in /export_raw
+EXPORT_MAX_MB = int(os.getenv("EXPORT_MAX_MB", "500")) # EXPORT_DIR size cap, least recently used files go first (0 = no cap)
+EXPORT_MAX_AGE_DAYS = float(os.getenv("EXPORT_MAX_AGE_DAYS", "30")) # exports unused this long are deleted (0 = keep)
+
+# Long report delivery
+PAGER_TTL = int(os.getenv("PAGER_TTL", "3600")) # seconds ◀ ▶ buttons stay usable
+PAGE_SEND_CONCURRENCY = int(os.getenv("PAGE_SEND_CONCURRENCY", "4")) # chats served at once
+PAGE_SEND_INTERVAL = float(os.getenv("PAGE_SEND_INTERVAL", "1.0")) # seconds between pages in one chat
+
+# Outbound Bot API rate limiting (needs python-telegram-bot[rate-limiter])
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3")) # retries after a 429 RetryAfter
+PRIVATE_CHAT_RATE = float(os.getenv("PRIVATE_CHAT_RATE", "1.0")) # messages/second per private chat, 0 = off
+
+# Cached get_chat_member / get_chat results (kept fresh by chat member updates)
+CHAT_CACHE_TTL = int(os.getenv("CHAT_CACHE_TTL", "3600")) # seconds
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "20000"))
+
+# Assignment follows group membership (chat_member updates; the bot must be a group admin)
+AUTO_ASSIGN_ON_JOIN = os.getenv("AUTO_ASSIGN_ON_JOIN", "1") == "1" # teacher joins a group -> assigned
+AUTO_UNASSIGN_ON_LEAVE = os.getenv("AUTO_UNASSIGN_ON_LEAVE", "1") == "1" # teacher leaves/is removed -> unassigned
+
+# Counting policy and deduplication of tracked messages
+EXTRA_MESSAGE_TYPES = [t.strip().lower() for t in os.getenv("EXTRA_MESSAGE_TYPES", "").split(",") if t.strip()] # sticker,animation,poll,location
+TYPE_WEIGHTS = os.getenv("TYPE_WEIGHTS", "") # activity score weights, e.g. "video=3,voice=2,document=2" (others 1)
+REPORT_SORT = os.getenv("REPORT_SORT", "name").strip().lower() # default report order: name, total or score
+ALBUM_COUNTING = os.getenv("ALBUM_COUNTING", "item").strip().lower() # "item" (each photo/video) or "once" per album
+COUNT_EDITED_MESSAGES = os.getenv("COUNT_EDITED_MESSAGES", "0") == "1" # edits are not new messages
+DEDUPE_TTL = int(os.getenv("DEDUPE_TTL", "86400")) # seconds a counted message id is remembered
+DEDUPE_MAX_ENTRIES = int(os.getenv("DEDUPE_MAX_ENTRIES", "50000")) # bounds memory; oldest keys evicted first
+DEDUPE_SAVE_INTERVAL = int(os.getenv("DEDUPE_SAVE_INTERVAL", "60")) # seconds, 0 = only on shutdown
+
 # Ensure directories exist
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(os.path.join(DATA_DIR, "stats"), exist_ok=True)
@@ -0,0 +1,26 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# config reads the environment at import time: point every storage path at a
+# throwaway directory before any test imports the bot's modules
+_TMP = tempfile.mkdtemp(prefix="bot-tests-")
+os.environ["DATA_DIR"] = os.path.join(_TMP, "data")
+os.environ["EXPORT_DIR"] = os.path.join(_TMP, "exports")
+os.environ["WORKER_ID"] = ""
+os.environ["COUNTER_BACKEND"] = "json"
+os.makedirs(os.environ["DATA_DIR"], exist_ok=True)
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def stats_dir():
+    """An empty STATS_DIR for one test."""
+    from config import STATS_DIR
+    shutil.rmtree(STATS_DIR, ignore_errors=True)
+    os.makedirs(STATS_DIR)
+    yield STATS_DIR
+    shutil.rmtree(STATS_DIR, ignore_errors=True)
@@ -1,12 +1,26 @@
+import asyncio
+import heapq
+import html
 import logging
 import os
-from datetime import datetime
-import pandas as pd
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from datetime import timedelta
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ChatType
-from storage import json_db
-from config import ADMIN_IDS, EXPORT_DIR
+from telegram.error import BadRequest, Forbidden
+from storage import json_db, stats_store, report_cache, registry_cache, search_index, async_db, snapshot, message_types, raw_export, export_manager
+from storage.writer import get_writer_stats
+from storage.counters import Counters
+from storage.message_types import MESSAGE_TYPES, get_type
+from handlers.rate_limiter import get_rate_limiter_stats
+from handlers.dedupe import get_dedupe_stats
+from config import ADMIN_IDS, LIST_PAGE_SIZE, REPORT_SORT, LEADERBOARD_SIZE
+from handlers.pagination import paginate_blocks, reply_paged, send_artifact, strip_html
+from handlers import chat_cache
 
 logger = logging.getLogger(__name__)
 
@@ -34,17 +48,35 @@ def is_admin(user_id: int) -> bool:
 # UNIFIED FORMATTING HELPERS
 # ============================================================================
 
-def get_overall_total(counters: dict) -> int:
-    """Calculate sum of all message types."""
-    types = ["text", "photo", "video", "audio", "voice", "document"]
-    return sum(counters.get(t, 0) for t in types)
+def get_overall_total(counters) -> int:
+    """Calculate sum of all message types (Counters or a plain dict)."""
+    if isinstance(counters, Counters):
+        return counters.total()
+    return sum(counters.get(t, 0) for t in MESSAGE_TYPES)
 
 def format_breakdown(counters: dict) -> str:
-    """Return 2-line breakdown with fixed icon order."""
-    # Fixed icon order: 📝 📸 🎥 🎵 🎤 📎
-    line1 = f"📝 {counters.get('text', 0)} | 📸 {counters.get('photo', 0)} | 🎥 {counters.get('video', 0)}"
-    line2 = f"🎵 {counters.get('audio', 0)} | 🎤 {counters.get('voice', 0)} | 📎 {counters.get('document', 0)}"
-    return f"{line1}\n   {line2}"
+    """Return the per-type breakdown, three icons per line in MESSAGE_TYPES order."""
+    # 📝 📸 🎥 / 🎵 🎤 📎 (then any enabled extra types)
+    cells = [f"{get_type(t).icon} {counters.get(t, 0)}" for t in MESSAGE_TYPES]
+    lines = [" | ".join(cells[i:i + 3]) for i in range(0, len(cells), 3)]
+    return "\n   ".join(lines)
+
+def format_score(score: float) -> str:
+    """Activity score without a pointless .0 (weights may be fractional)."""
+    return str(int(score)) if float(score).is_integer() else f"{score:.1f}"
+
+# Report orders, selectable in the reports menu (REPORT_SORT is the default)
+REPORT_SORTS = ("name", "total", "score")
+
+def sort_entities(entries: list, sort: str) -> list:
+    """Sort (name, Counters) pairs by name, or by total/score (highest first, then name)."""
+    if sort == "total":
+        entries.sort(key=lambda x: (-x[1].total(), x[0]))
+    elif sort == "score":
+        entries.sort(key=lambda x: (-x[1].score(), x[0]))
+    else:
+        entries.sort(key=lambda x: x[0])
+    return entries
 
 def format_entity_block(title_line: str, counters: dict) -> str:
     """Return title line + indented breakdown."""
@@ -57,6 +89,15 @@ def format_short_name(full_name: str) -> str:
         return f"{parts[0]} {parts[1]}"
     return full_name
 
+def format_change(prev: int, cur: int) -> tuple:
+    """Return (delta, percent) strings for a previous/current pair."""
+    delta = cur - prev
+    if prev:
+        pct = f"{delta * 100 / prev:+.0f}%"
+    else:
+        pct = "new" if cur else "0%"
+    return f"{delta:+d}", pct
+
 # ============================================================================
 # MAIN MENU
 # ============================================================================
@@ -73,17 +114,24 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # 1. Admin Panel
     if is_admin(user_id):
+        # Deep links from inline search: /start t_<teacher_id> or /start g_<chat_id>
+        if context.args:
+            payload = context.args[0]
+            if payload.startswith("t_"):
+                return await show_teacher_detail(update, context, payload[2:])
+            if payload.startswith("g_"):
+                return await show_group_detail(update, context, payload[2:])
         return await admin_menu(update, context)
     
     # 2. Teacher Panel
-    teacher_id = json_db.find_teacher_by_telegram_id(user_id)
+    teacher_id = await async_db.find_teacher_by_telegram_id(user_id)
     if teacher_id:
-        teacher = json_db.get_teacher(teacher_id)
+        teacher = await async_db.get_teacher(teacher_id)
         if teacher and teacher.get("active", True):
             return await teacher_menu(update, context, teacher_id, teacher)
     
     # 3. Unauthorized / New User
-    if json_db.get_pending_registration(user_id):
+    if await async_db.get_pending_registration(user_id):
         await update.message.reply_text("⏳ Your registration request is pending approval.")
         return ConversationHandler.END
 
@@ -172,13 +220,34 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode='Markdown'
         )
         return await start(update, context)
-    elif data == "m:reports":
+    elif data == "m:reports" or data.startswith("rs:"):
+        if data.startswith("rs:") and data[3:] in REPORT_SORTS:
+            if data[3:] == context.user_data.get("report_sort", REPORT_SORT):
+                # Already selected: editing to the same menu fails with "Message is not modified"
+                return MENU
+            context.user_data["report_sort"] = data[3:]
+        sort = context.user_data.get("report_sort", REPORT_SORT)
         msg = "📊 *Select Report Type:*"
         keyboard = [
+            [
+                InlineKeyboardButton(f"{'✓ ' if sort == s else ''}By {s}", callback_data=f"rs:{s}")
+                for s in REPORT_SORTS
+            ],
             [InlineKeyboardButton("Teachers Report", callback_data="r:t_simple")],
             [InlineKeyboardButton("Teachers Detailed", callback_data="r:t_detail")],
             [InlineKeyboardButton("Group Report", callback_data="r:g_simple")],
             [InlineKeyboardButton("Groups Detailed", callback_data="r:g_detail")],
+            [InlineKeyboardButton("Teachers: vs Previous", callback_data="r:t_compare")],
+            [InlineKeyboardButton("Groups: vs Previous", callback_data="r:g_compare")],
+            [
+                InlineKeyboardButton("🏆 Top Teachers", callback_data="r:t_top"),
+                InlineKeyboardButton("🐢 Least Active", callback_data="r:t_bottom"),
+            ],
+            [
+                InlineKeyboardButton("🏆 Top Groups", callback_data="r:g_top"),
+                InlineKeyboardButton("🐢 Least Active", callback_data="r:g_bottom"),
+            ],
+            [InlineKeyboardButton("💤 Teachers with Zero Activity", callback_data="r:t_zero")],
             [InlineKeyboardButton("« Back", callback_data="m:back")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -187,7 +256,14 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     elif data.startswith("r:"):
         context.user_data["report_type"] = data[2:]
-        await query.message.reply_text("📊 Enter number of days for report (1-365):")
+        if data[2:] in LEADERBOARD_TYPES:
+            await query.message.reply_text(
+                "📊 Enter number of days (1-365), optionally followed by what to rank by:\n"
+                f"{', '.join(LEADERBOARD_METRICS)} (default: total), e.g. `30 video`",
+                parse_mode='Markdown'
+            )
+        else:
+            await query.message.reply_text("📊 Enter number of days for report (1-365):")
         return REPORT_DAYS
     elif data == "m:excel":
         await query.message.reply_text("📥 Enter number of days for Excel export (1-365):")
@@ -245,10 +321,18 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         teacher_id = str(data[4:])
         return await perform_delete_teacher(update, context, teacher_id)
 
-    # Show unassigned groups for adding (aa = add assignment)
+    # Show unassigned groups for adding (aa = add assignment), optional "|cursor"
     elif data.startswith("aa:"):
-        teacher_id = str(data[3:])
-        return await show_unassigned_groups(update, context, teacher_id)
+        teacher_id, _, cursor = data[3:].partition("|")
+        return await show_unassigned_groups(update, context, teacher_id, cursor or None)
+    
+    # List pages: lt = teachers, lg = groups, lr = groups for report
+    elif data.startswith("lt:"):
+        return await list_teachers(update, context, data[3:] or None)
+    elif data.startswith("lg:"):
+        return await list_groups(update, context, data[3:] or None)
+    elif data.startswith("lr:"):
+        return await list_groups_for_report(update, context, data[3:] or None)
     
     # Assignment toggle
     elif data.startswith("a:"):
@@ -287,7 +371,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_pending_registrations(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show pending registration requests."""
-    pending = json_db.load_pending_registrations()
+    pending = await async_db.load_pending_registrations()
     
     if not pending:
         await update.callback_query.message.reply_text("✅ No pending requests found.")
@@ -324,22 +408,48 @@ async def show_pending_registrations(update: Update, context: ContextTypes.DEFAU
         
     return MENU
 
+async def show_screen(update: Update, msg: str, reply_markup, parse_mode=None):
+    """Edit the callback message, or reply when opened by a command/deep link."""
+    if update.callback_query:
+        await update.callback_query.edit_message_text(msg, reply_markup=reply_markup, parse_mode=parse_mode)
+    else:
+        await update.message.reply_text(msg, reply_markup=reply_markup, parse_mode=parse_mode)
+
+async def notify_not_found(update: Update, text: str):
+    """Alert for a missing teacher/group from either a button or a deep link."""
+    if update.callback_query:
+        await update.callback_query.answer(text, show_alert=True)
+    else:
+        await update.message.reply_text(f"❌ {text}")
+
+def nav_row(callback_prefix: str, prev_cursor, next_cursor, start: int) -> list:
+    """◀ ▶ buttons for a cursor-paged list (empty cursor = first page)."""
+    row = []
+    if start > 0:
+        row.append(InlineKeyboardButton("◀", callback_data=f"{callback_prefix}{prev_cursor or ''}"))
+    if next_cursor:
+        row.append(InlineKeyboardButton("▶", callback_data=f"{callback_prefix}{next_cursor}"))
+    return row
+
 # ============================================================================
 # TEACHERS
 # ============================================================================
 
-async def list_teachers(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """List all teachers."""
-    teachers = json_db.load_teachers()
+async def list_teachers(update: Update, context: ContextTypes.DEFAULT_TYPE, cursor: str = None):
+    """List teachers, one page at a time."""
+    snap = await async_db.run_io(registry_cache.get_snapshot)
     
-    if not teachers:
+    if not snap.teacher_ids:
         msg = "No teachers registered yet.\n\nUse *➕ Add Teacher* to add one."
         keyboard = [[InlineKeyboardButton("« Back to Menu", callback_data="m:back")]]
     else:
-        msg = "👨‍🏫 *Teachers:*\n\n"
+        page_ids, start, prev_cursor, next_cursor = snap.page("t", cursor, LIST_PAGE_SIZE)
+        total = len(snap.teacher_ids)
+        msg = f"👨‍🏫 *Teachers* ({start + 1}–{start + len(page_ids)} of {total}):\n\n"
         keyboard = []
         
-        for t_id, data in sorted(teachers.items()):
+        for t_id in page_ids:
+            data = snap.teachers[t_id]
             status = "✅" if data.get("active", True) else "❌"
             msg += f"{status} `{t_id}` - {data['full_name']}\n"
             # Use short callback data
@@ -348,59 +458,66 @@ async def list_teachers(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 callback_data=f"t:{t_id}"
             )])
         
+        nav = nav_row("lt:", prev_cursor, next_cursor, start)
+        if nav:
+            keyboard.append(nav)
+        keyboard.append([InlineKeyboardButton("🔎 Search", switch_inline_query_current_chat="t ")])
         keyboard.append([InlineKeyboardButton("« Back to Menu", callback_data="m:back")])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.callback_query.edit_message_text(msg, reply_markup=reply_markup, parse_mode='Markdown')
+    await show_screen(update, msg, reply_markup, parse_mode='Markdown')
     return MENU
 
-async def list_groups_for_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """List all groups for selection."""
-    query = update.callback_query
-    groups = json_db.load_groups()
+async def list_groups_for_report(update: Update, context: ContextTypes.DEFAULT_TYPE, cursor: str = None):
+    """List enabled groups for selection, one page at a time."""
+    snap = await async_db.run_io(registry_cache.get_snapshot)
     
-    if not groups:
+    if not snap.group_ids:
         msg = "No groups registered yet.\n\nUse *➕ Add Group* for instructions."
         keyboard = [[InlineKeyboardButton("« Back to Menu", callback_data="m:back")]]
     else:
-        msg = "📍 *Select a Group for Report:*\n\n"
-        keyboard = []
-        
         # Only show enabled groups
-        active_groups = {k: v for k, v in groups.items() if v.get("enabled", True)}
+        is_enabled = lambda g_id: snap.groups[g_id].get("enabled", True)
+        page_ids, start, prev_cursor, next_cursor = snap.page("g", cursor, LIST_PAGE_SIZE, is_enabled)
         
-        if not active_groups:
+        if not page_ids:
             msg = "No active groups found."
             keyboard = [[InlineKeyboardButton("« Back to Menu", callback_data="m:back")]]
         else:
-            for chat_id_str, data in sorted(active_groups.items(), key=lambda x: x[1]['title']):
+            msg = "📍 *Select a Group for Report:*\n\n"
+            keyboard = []
+            for chat_id_str in page_ids:
                 keyboard.append([InlineKeyboardButton(
-                    f"🏫 {data['title'][:30]}",
+                    f"🏫 {snap.groups[chat_id_str]['title'][:30]}",
                     callback_data=f"rg:{chat_id_str}"
                 )])
             
+            nav = nav_row("lr:", prev_cursor, next_cursor, start)
+            if nav:
+                keyboard.append(nav)
             keyboard.append([InlineKeyboardButton("« Back to Menu", callback_data="m:back")])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(msg, reply_markup=reply_markup, parse_mode='Markdown')
+    await show_screen(update, msg, reply_markup, parse_mode='Markdown')
     return REPORT_GROUP_SELECT
 
 async def show_teacher_detail(update: Update, context: ContextTypes.DEFAULT_TYPE, teacher_id: str):
     """Show teacher details and stats."""
-    teacher = json_db.get_teacher(teacher_id)
+    teacher = await async_db.get_teacher(teacher_id)
     if not teacher:
-        await update.callback_query.answer("Teacher not found", show_alert=True)
+        await notify_not_found(update, "Teacher not found")
         return await list_teachers(update, context)
     
     # Get stats for last 7 days
-    stats = json_db.get_teacher_stats_summary(teacher_id, days=7)
-    groups = json_db.load_groups()
+    stats = await async_db.get_teacher_stats_summary(teacher_id, days=7)
+    groups = await async_db.load_groups()
     
     
     msg = f"👨‍🏫 *{teacher['full_name']}*\n"
     msg += f"ID: `{teacher_id}`\n"
     msg += f"Telegram ID: `{teacher['telegram_user_id']}`\n"
     msg += f"Status: {'✅ Active' if teacher.get('active', True) else '❌ Inactive'}\n\n"
+    msg += f"📊 Last 7 days: {stats.total()} messages\n   {format_breakdown(stats)}\n\n"
     msg += "Choose an action:"
     
     keyboard = [
@@ -412,12 +529,12 @@ async def show_teacher_detail(update: Update, context: ContextTypes.DEFAULT_TYPE
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.callback_query.edit_message_text(msg, reply_markup=reply_markup, parse_mode='Markdown')
+    await show_screen(update, msg, reply_markup, parse_mode='Markdown')
     return MENU
 
 async def start_edit_teacher_name(update: Update, context: ContextTypes.DEFAULT_TYPE, teacher_id: str):
     """Ask for new teacher name."""
-    teacher = json_db.get_teacher(teacher_id)
+    teacher = await async_db.get_teacher(teacher_id)
     if not teacher:
         return await list_teachers(update, context)
         
@@ -442,14 +559,14 @@ async def handle_edit_teacher_name(update: Update, context: ContextTypes.DEFAULT
         return await start(update, context)
         
     new_name = update.message.text.strip()
-    json_db.update_teacher_name(teacher_id, new_name)
+    await async_db.update_teacher_name(teacher_id, new_name)
     
     await update.message.reply_text(f"✅ Teacher name updated to: **{new_name}**", parse_mode='Markdown')
     return await start(update, context)
 
 async def confirm_delete_teacher(update: Update, context: ContextTypes.DEFAULT_TYPE, teacher_id: str):
     """Ask for confirmation before deleting a teacher."""
-    teacher = json_db.get_teacher(teacher_id)
+    teacher = await async_db.get_teacher(teacher_id)
     if not teacher:
         return await list_teachers(update, context)
         
@@ -470,7 +587,7 @@ async def confirm_delete_teacher(update: Update, context: ContextTypes.DEFAULT_T
 
 async def perform_delete_teacher(update: Update, context: ContextTypes.DEFAULT_TYPE, teacher_id: str):
     """Execute deletion."""
-    success, msg = json_db.delete_teacher(teacher_id)
+    success, msg = await async_db.delete_teacher(teacher_id)
     if success:
         await update.callback_query.answer(msg, show_alert=True)
         return await list_teachers(update, context)
@@ -480,7 +597,7 @@ async def perform_delete_teacher(update: Update, context: ContextTypes.DEFAULT_T
 
 async def show_teacher_groups(update: Update, context: ContextTypes.DEFAULT_TYPE, teacher_id: str):
     """Show groups assigned to a teacher."""
-    teacher = json_db.get_teacher(teacher_id)
+    teacher = await async_db.get_teacher(teacher_id)
     if not teacher:
         return await list_teachers(update, context)
         
@@ -488,8 +605,8 @@ async def show_teacher_groups(update: Update, context: ContextTypes.DEFAULT_TYPE
     msg += "*Assigned Groups:*"
     
     keyboard = []
-    all_groups = json_db.load_groups()
-    assigned_groups = json_db.get_teacher_groups(teacher_id)
+    all_groups = await async_db.load_groups()
+    assigned_groups = await async_db.get_teacher_groups(teacher_id)
     
     has_groups = False
     if assigned_groups:
@@ -515,7 +632,7 @@ async def show_teacher_groups(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def ask_teacher_report_days(update: Update, context: ContextTypes.DEFAULT_TYPE, teacher_id: str):
     """Ask for days for teacher report."""
-    teacher = json_db.get_teacher(teacher_id)
+    teacher = await async_db.get_teacher(teacher_id)
     if not teacher:
         return await list_teachers(update, context)
         
@@ -554,7 +671,7 @@ async def handle_teacher_report_days(update: Update, context: ContextTypes.DEFAU
 
 async def toggle_assignment(update: Update, context: ContextTypes.DEFAULT_TYPE, teacher_id: str, chat_id_str: str):
     """Toggle teacher assignment to a group."""
-    success, message = json_db.toggle_assignment(teacher_id, chat_id_str)
+    success, message = await async_db.toggle_assignment(teacher_id, chat_id_str)
     
     # Check if we were in "Add Group" mode or "Show Details" mode
     # If we just added a group (message was "Include assignment"), we might want to return to detail or stay in add mode.
@@ -562,27 +679,32 @@ async def toggle_assignment(update: Update, context: ContextTypes.DEFAULT_TYPE,
     await update.callback_query.answer(message)
     return await show_teacher_detail(update, context, teacher_id)
 
-async def show_unassigned_groups(update: Update, context: ContextTypes.DEFAULT_TYPE, teacher_id: str):
-    """Show list of groups NOT assigned to the teacher."""
-    all_groups = json_db.load_groups()
-    assigned_groups = json_db.get_teacher_groups(teacher_id)
+async def show_unassigned_groups(update: Update, context: ContextTypes.DEFAULT_TYPE, teacher_id: str, cursor: str = None):
+    """Show groups NOT assigned to the teacher, one page at a time."""
+    snap = await async_db.run_io(registry_cache.get_snapshot)
+    assigned_groups = set(snap.teacher_groups(teacher_id))
     
     msg = "➕ *Assign to New Group*\n\nSelect a group to add:"
     keyboard = []
     
     # Filter only unassigned groups
-    unassigned = {k: v for k, v in all_groups.items() if k not in assigned_groups}
+    page_ids, start, prev_cursor, next_cursor = snap.page(
+        "g", cursor, LIST_PAGE_SIZE, lambda g_id: g_id not in assigned_groups
+    )
     
-    if not unassigned:
+    if not page_ids:
          msg = "✅ All registered groups are already assigned to this teacher."
          keyboard.append([InlineKeyboardButton("« Back", callback_data=f"t:{teacher_id}")])
     else:
-        for chat_id_str, g_data in sorted(unassigned.items(), key=lambda x: x[1]['title']):
+        for chat_id_str in page_ids:
             # Callback uses same logic (toggle), so it will ADD it
             keyboard.append([InlineKeyboardButton(
-                f"➕ {g_data['title'][:30]}",
+                f"➕ {snap.groups[chat_id_str]['title'][:30]}",
                 callback_data=f"a:{teacher_id}|{chat_id_str}"
             )])
+        nav = nav_row(f"aa:{teacher_id}|", prev_cursor, next_cursor, start)
+        if nav:
+            keyboard.append(nav)
         keyboard.append([InlineKeyboardButton("« Back", callback_data=f"t:{teacher_id}")])
             
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -607,7 +729,7 @@ async def add_teacher_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ADD_T_ID
     
     # Check if already exists
-    if json_db.get_teacher(teacher_id):
+    if await async_db.get_teacher(teacher_id):
         await update.message.reply_text(f"❌ Teacher ID '{teacher_id}' already exists!\n\nTry a different ID:")
         return ADD_T_ID
     
@@ -677,7 +799,7 @@ async def add_teacher_telegram_id(update: Update, context: ContextTypes.DEFAULT_
         return ADD_T_TELEGRAM_ID
     
     # Check if already used
-    existing = json_db.find_teacher_by_telegram_id(telegram_user_id)
+    existing = await async_db.find_teacher_by_telegram_id(telegram_user_id)
     if existing:
         await update.message.reply_text(
             f"❌ This Telegram ID is already assigned to teacher '{existing}'!\n\n"
@@ -689,7 +811,7 @@ async def add_teacher_telegram_id(update: Update, context: ContextTypes.DEFAULT_
     teacher_id = context.user_data["new_teacher_id"]
     full_name = context.user_data["new_teacher_name"]
     
-    success, message = json_db.add_teacher(teacher_id, full_name, telegram_user_id)
+    success, message = await async_db.add_teacher(teacher_id, full_name, telegram_user_id)
     
     if success:
         await update.message.reply_text(
@@ -711,18 +833,21 @@ async def add_teacher_telegram_id(update: Update, context: ContextTypes.DEFAULT_
 # GROUPS
 # ============================================================================
 
-async def list_groups(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """List all groups."""
-    groups = json_db.load_groups()
+async def list_groups(update: Update, context: ContextTypes.DEFAULT_TYPE, cursor: str = None):
+    """List groups, one page at a time."""
+    snap = await async_db.run_io(registry_cache.get_snapshot)
     
-    if not groups:
+    if not snap.group_ids:
         msg = "No groups registered yet.\n\nUse *➕ Add Group* for instructions."
         keyboard = [[InlineKeyboardButton("« Back to Menu", callback_data="m:back")]]
     else:
-        msg = "🏫 Groups:\n\n"
+        page_ids, start, prev_cursor, next_cursor = snap.page("g", cursor, LIST_PAGE_SIZE)
+        total = len(snap.group_ids)
+        msg = f"🏫 Groups ({start + 1}–{start + len(page_ids)} of {total}):\n\n"
         keyboard = []
         
-        for chat_id_str, data in sorted(groups.items(), key=lambda x: x[1]['title']):
+        for chat_id_str in page_ids:
+            data = snap.groups[chat_id_str]
             status = "✅" if data.get("enabled", True) else "❌"
             # Removing markdown format to prevent errors with special chars in titles
             msg += f"{status} {data['title']} (ID: {chat_id_str})\n"
@@ -731,18 +856,23 @@ async def list_groups(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 callback_data=f"g:{chat_id_str}"
             )])
         
+        nav = nav_row("lg:", prev_cursor, next_cursor, start)
+        if nav:
+            keyboard.append(nav)
+        keyboard.append([InlineKeyboardButton("🔎 Search", switch_inline_query_current_chat="g ")])
         keyboard.append([InlineKeyboardButton("« Back to Menu", callback_data="m:back")])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     # Removing parse_mode to be safe
-    await update.callback_query.edit_message_text(msg, reply_markup=reply_markup)
+    await show_screen(update, msg, reply_markup)
     return MENU
 
 async def show_group_detail(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id_str: str):
     """Show group details."""
-    group = json_db.get_group(chat_id_str)
+    snap = await async_db.run_io(registry_cache.get_snapshot)
+    group = snap.group(chat_id_str)
     if not group:
-        await update.callback_query.answer("Group not found", show_alert=True)
+        await notify_not_found(update, "Group not found")
         return await list_groups(update, context)
     
     status = "✅ Enabled" if group.get("enabled", True) else "❌ Disabled"
@@ -761,12 +891,12 @@ async def show_group_detail(update: Update, context: ContextTypes.DEFAULT_TYPE,
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.callback_query.edit_message_text(msg, reply_markup=reply_markup, parse_mode='Markdown')
+    await show_screen(update, msg, reply_markup, parse_mode='Markdown')
     return MENU
 
 async def start_edit_group_title(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id_str: str):
     """Ask for new group title."""
-    group = json_db.get_group(chat_id_str)
+    group = await async_db.get_group(chat_id_str)
     if not group:
          return await list_groups(update, context)
 
@@ -791,7 +921,7 @@ async def handle_edit_group_title(update: Update, context: ContextTypes.DEFAULT_
         return await start(update, context)
         
     new_title = update.message.text.strip()
-    json_db.update_group_title(chat_id_str, new_title)
+    await async_db.update_group_title(chat_id_str, new_title)
     
     await update.message.reply_text(f"✅ Group title updated to: **{new_title}**", parse_mode='Markdown')
     
@@ -801,7 +931,7 @@ async def handle_edit_group_title(update: Update, context: ContextTypes.DEFAULT_
 
 async def confirm_delete_group(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id_str: str):
     """Ask for confirmation before deleting a group."""
-    group = json_db.get_group(chat_id_str)
+    group = await async_db.get_group(chat_id_str)
     if not group:
         return await list_groups(update, context)
         
@@ -822,7 +952,7 @@ async def confirm_delete_group(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def perform_delete_group(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id_str: str):
     """Execute deletion."""
-    success, msg = json_db.delete_group(chat_id_str)
+    success, msg = await async_db.delete_group(chat_id_str)
     if success:
         await update.callback_query.answer(msg, show_alert=True)
         return await list_groups(update, context)
@@ -832,7 +962,7 @@ async def perform_delete_group(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def show_group_settings(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id_str: str):
     """Show group settings (enable/disable)."""
-    group = json_db.get_group(chat_id_str)
+    group = await async_db.get_group(chat_id_str)
     if not group:
          return await list_groups(update, context)
     
@@ -853,7 +983,7 @@ async def show_group_settings(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def toggle_group_enabled(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id_str: str):
     """Toggle group enabled status."""
-    success, message = json_db.toggle_group_enabled(chat_id_str)
+    success, message = await async_db.toggle_group_enabled(chat_id_str)
     await update.callback_query.answer(message)
     return await show_group_detail(update, context, chat_id_str)
 
@@ -875,7 +1005,7 @@ async def confirm_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Bot must be admin in the group
     try:
-        bot_member = await context.bot.get_chat_member(update.effective_chat.id, context.bot.id)
+        bot_member = await chat_cache.get_chat_member(context.bot, update.effective_chat.id, context.bot.id)
         if bot_member.status not in ["administrator", "creator"]:
             await update.message.reply_text(
                 "❌ Please promote me to admin first!\n\n"
@@ -891,7 +1021,7 @@ async def confirm_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     title = update.effective_chat.title or f"Group {chat_id}"
     
-    success, message = json_db.add_group(chat_id, title)
+    success, message = await async_db.add_group(chat_id, title)
     
     if success:
         logger.info(f"ADMIN {update.effective_user.id} registered group {chat_id} ({title})")
@@ -915,17 +1045,24 @@ async def handle_report_days(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("❌ Please enter a number:")
         return REPORT_DAYS
         
+    rtype = context.user_data.get("report_type", "t_simple")
+    parts = update.message.text.split()
     try:
-        days = int(update.message.text.strip())
+        days = int(parts[0])
         if not (1 <= days <= 365):
             raise ValueError()
-    except ValueError:
+    except (ValueError, IndexError):
         await update.message.reply_text("❌ Please enter a number between 1 and 365:")
         return REPORT_DAYS
     
-    rtype = context.user_data.get("report_type", "t_simple")
+    metric = parts[1].lower() if len(parts) > 1 else "total"
+    if rtype in LEADERBOARD_TYPES and metric not in LEADERBOARD_METRICS:
+        await update.message.reply_text(f"❌ Rank by one of: {', '.join(LEADERBOARD_METRICS)}")
+        return REPORT_DAYS
     
-    if rtype == "t_simple":
+    if rtype in LEADERBOARD_TYPES:
+        await send_report(update, rtype, days, metric=metric)
+    elif rtype == "t_simple":
         await gen_teachers_simple(update, context, days)
     elif rtype == "t_detail":
         await gen_teachers_detail(update, context, days)
@@ -933,6 +1070,10 @@ async def handle_report_days(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await gen_groups_simple(update, context, days)
     elif rtype == "g_detail":
         await gen_groups_detail(update, context, days)
+    elif rtype == "t_compare":
+        await gen_teachers_compare(update, context, days)
+    elif rtype == "g_compare":
+        await gen_groups_compare(update, context, days)
     else:
         # Default
         await gen_teachers_simple(update, context, days)
@@ -940,152 +1081,298 @@ async def handle_report_days(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await update.message.reply_text("Use /start to return to menu.")
     return ConversationHandler.END
 
-async def gen_teachers_simple(update, context, days):
-    """Teachers report: T/r | Name | XS"""
-    stats = json_db.aggregate_stats(days)
-    teachers = json_db.load_teachers()
-    
-    data_list = []
-    
+def _teacher_totals(stats: dict, teachers: dict) -> list:
+    """(short name, Counters) for every active teacher, summed over all groups."""
+    entries = []
     for t_id, t_data in teachers.items():
         if not t_data.get('active', True): continue
         
-        total = 0
+        agg_counters = Counters()
         for chat_id in stats:
             if t_id in stats[chat_id]:
-                total += get_overall_total(stats[chat_id][t_id])
-                
-        name = format_short_name(t_data['full_name'])
-        data_list.append((name, total))
+                agg_counters.add(stats[chat_id][t_id])
+        entries.append((format_short_name(t_data['full_name']), agg_counters))
+    return entries
+
+def _group_totals(stats: dict, groups: dict) -> list:
+    """(title, Counters) for every enabled group, summed over its teachers."""
+    entries = []
+    for g_id, g_data in groups.items():
+        if not g_data.get('enabled', True): continue
         
-    data_list.sort(key=lambda x: x[0])
+        agg_counters = Counters()
+        for t_counters in stats.get(g_id, {}).values():
+            agg_counters.add(t_counters)
+        entries.append((g_data['title'], agg_counters))
+    return entries
+
+def render_teachers_simple(days: int, stats: dict, teachers: dict, sort: str = "name") -> list:
+    """Teachers report: T/r | Name | XS | Score"""
+    data_list = sort_entities(_teacher_totals(stats, teachers), sort)
     
-    msg = f"📊 <b>Teachers Report (Last {days} days)</b>\n\n"
-    msg += "<pre>"
-    msg += "T/r |             FISH             | XS \n"
-    msg += "----+------------------------------+----\n"
+    header = f"📊 <b>Teachers Report (Last {days} days)</b>\n\n"
+    prefix = "<pre>"
+    prefix += "T/r |             FISH             | XS   | Score\n"
+    prefix += "----+------------------------------+------+------\n"
     
-    for i, (name, total) in enumerate(data_list, 1):
-        n_pad = name[:30].ljust(28)
-        msg += f"{i:<3} | {n_pad} | {total:>4}\n"
+    rows = []
+    for i, (name, counters) in enumerate(data_list, 1):
+        n_pad = html.escape(name[:30].ljust(28), quote=False)
+        rows.append(f"{i:<3} | {n_pad} | {counters.total():>4} | {format_score(counters.score()):>5}\n")
     
-    msg += "</pre>"
-        
-    try:
-        await update.message.reply_text(msg, parse_mode='HTML')
-    except Exception as e:
-        logger.error(f"Error sending report: {e}")
-        clean_msg = msg.replace("<pre>", "").replace("</pre>", "").replace("<b>", "").replace("</b>", "")
-        await update.message.reply_text(clean_msg)
+    return paginate_blocks(rows, header, prefix, "</pre>")
 
-async def gen_teachers_detail(update, context, days):
+def render_teachers_detail(days: int, stats: dict, teachers: dict, sort: str = "name") -> list:
     """Teachers Detailed report."""
-    stats = json_db.aggregate_stats(days)
-    teachers = json_db.load_teachers()
+    data_list = sort_entities(_teacher_totals(stats, teachers), sort)
+    
+    header = f"📊 <b>Teachers Detailed Report (Last {days} days)</b>\n\n"
+    blocks = []
+    for i, (name, counters) in enumerate(data_list, 1):
+        blocks.append(
+            f"{i}. 👨‍🏫 <b>{html.escape(name, quote=False)}</b> — {counters.total()} (score {format_score(counters.score())})\n"
+            f"   {format_breakdown(counters)}\n\n"
+        )
+    return paginate_blocks(blocks, header)
+
+def render_groups_simple(days: int, stats: dict, groups: dict, sort: str = "name") -> list:
+    """Group report: T/r | GR name | XS | Score"""
+    data_list = sort_entities(_group_totals(stats, groups), sort)
     
-    data_list = []
+    header = f"📊 <b>Groups Report (Last {days} days)</b>\n\n"
+    prefix = "<pre>"
+    prefix += "T/r |           GR name              | XS   | Score\n"
+    prefix += "----+--------------------------------+------+------\n"
     
-    for t_id, t_data in teachers.items():
-        if not t_data.get('active', True): continue
-        
-        agg_counters = {
-            "text": 0, "photo": 0, "video": 0,
-            "audio": 0, "voice": 0, "document": 0
-        }
-        
-        for chat_id in stats:
-            if t_id in stats[chat_id]:
-                for k, v in stats[chat_id][t_id].items():
-                    agg_counters[k] += v
-        
-        total = get_overall_total(agg_counters)
-        name = format_short_name(t_data['full_name'])
-        data_list.append((name, total, agg_counters))
-        
-    data_list.sort(key=lambda x: x[0])
+    rows = []
+    for i, (title, counters) in enumerate(data_list, 1):
+        t_pad = html.escape(title[:30].ljust(30), quote=False)
+        rows.append(f"{i:<3} | {t_pad} | {counters.total():>4} | {format_score(counters.score()):>5}\n")
     
-    msg = f"📊 <b>Teachers Detailed Report (Last {days} days)</b>\n\n"
-    for i, (name, total, counters) in enumerate(data_list, 1):
-        msg += f"{i}. 👨‍🏫 <b>{name}</b> — {total}\n"
-        msg += f"   {format_breakdown(counters)}\n\n"
-        
-    try:
-        await update.message.reply_text(msg, parse_mode='HTML')
-    except:
-        await update.message.reply_text(msg.replace('<b>','').replace('</b>',''))
+    return paginate_blocks(rows, header, prefix, "</pre>")
+
+def render_groups_detail(days: int, stats: dict, groups: dict, sort: str = "name") -> list:
+    """Groups detailed report."""
+    data_list = sort_entities(_group_totals(stats, groups), sort)
+    
+    header = f"📊 <b>Groups Detailed Report (Last {days} days)</b>\n\n"
+    blocks = []
+    for i, (title, counters) in enumerate(data_list, 1):
+        blocks.append(
+            f"{i}. <b>{html.escape(title, quote=False)}</b> - {counters.total()} (score {format_score(counters.score())})\n"
+            f"   {format_breakdown(counters)}\n\n"
+        )
+    return paginate_blocks(blocks, header)
+
+# ============================================================================
+# LEADERBOARDS
+# ============================================================================
+
+LEADERBOARD_TYPES = ("t_top", "t_bottom", "g_top", "g_bottom", "t_zero")
+LEADERBOARD_METRICS = ("total", "score") + MESSAGE_TYPES
+_EMPTY = Counters()  # shared zero counters, never modified
+
+def metric_value(counters, metric: str):
+    if metric == "total":
+        return counters.total()
+    if metric == "score":
+        return counters.score()
+    return counters[metric]
+
+def rank_entities(totals: dict, snap, level: str, metric: str, k: int, largest: bool = True) -> list:
+    """
+    Top (or bottom) k active teachers / enabled groups as (value, name, Counters),
+    selected with a heap instead of sorting everyone. `totals` maps teacher ids
+    (level "t") or group ids to their Counters (stats_store.entity_totals).
+    Entities without activity count as zero, so they can appear at the bottom.
+    Ties are broken by name.
+    """
+    if level == "t":
+        candidates = (
+            (format_short_name(t_data['full_name']), totals.get(t_id, _EMPTY))
+            for t_id, t_data in snap.teachers.items() if t_data.get('active', True)
+        )
+    else:
+        candidates = (
+            (g_data['title'], totals.get(g_id, _EMPTY))
+            for g_id, g_data in snap.groups.items() if g_data.get('enabled', True)
+        )
+
+    entries = ((metric_value(c, metric), name, c) for name, c in candidates)
+    if largest:
+        return heapq.nsmallest(k, entries, key=lambda e: (-e[0], e[1]))
+    return heapq.nsmallest(k, entries, key=lambda e: (e[0], e[1]))
+
+def render_leaderboard(title: str, label: str, metric: str, entries: list, largest: bool = True) -> list:
+    """Render (value, name, Counters) rows as a paged <pre> table; medals only on top boards."""
+    header = f"📊 <b>{title}</b>\n\n"
+    prefix = "<pre>"
+    prefix += f"#   | {label.center(28)} | {metric[:6].capitalize():>6}\n"
+    prefix += "----+------------------------------+-------\n"
+
+    lines = []
+    for i, (value, name, _) in enumerate(entries, 1):
+        medal = {1: "🥇", 2: "🥈", 3: "🥉"}.get(i, "") if largest and value else ""
+        n_pad = html.escape(name[:28].ljust(28), quote=False)
+        lines.append(f"{i:<3} | {n_pad} | {format_score(value):>6} {medal}\n")
+    if not lines:
+        lines.append("(nothing to rank)\n")
+    return paginate_blocks(lines, header, prefix, "</pre>")
+
+def find_zero_activity(days: int, snap) -> list:
+    """
+    Active teachers with assignments who sent nothing in any of their enabled
+    groups during the window, as (name, teacher_id, assigned group count).
+    """
+    assigned = {}
+    for t_id, t_data in snap.teachers.items():
+        if not t_data.get('active', True):
+            continue
+        groups = [g for g in snap.teacher_groups(t_id) if snap.group(g) and snap.group(g).enabled]
+        if groups:
+            assigned[t_id] = groups
+    pairs = {(g, t_id) for t_id, groups in assigned.items() for g in groups}
+    # Only rows in an assigned group count, summed per teacher
+    totals = stats_store.entity_totals(days, lambda g, t: t if (g, t) in pairs else None)
+
+    rows = [
+        (format_short_name(snap.teachers[t_id]['full_name']), t_id, len(groups))
+        for t_id, groups in assigned.items()
+        if not get_overall_total(totals.get(t_id, _EMPTY))
+    ]
+    rows.sort()
+    return rows
+
+def render_zero_activity(days: int, rows: list) -> list:
+    header = f"💤 <b>Teachers with Zero Activity (Last {days} days)</b>\n"
+    header += "<i>Active teachers with no messages in any assigned group</i>\n\n"
+    if not rows:
+        return [header + "✅ Every assigned teacher was active."]
+    lines = [f"{i}. {html.escape(name, quote=False)} (<code>{t_id}</code>) — {n} group{'s' if n != 1 else ''}\n"
+             for i, (name, t_id, n) in enumerate(rows, 1)]
+    return paginate_blocks(lines, header)
+
+def _render_leaderboard(rtype: str, days: int, metric: str, snap) -> list:
+    if rtype == "t_zero":
+        return render_zero_activity(days, find_zero_activity(days, snap))
+    level, largest = rtype[0], rtype.endswith("_top")
+    # Per-entity totals straight from the day files, without the chat -> teacher map
+    totals = stats_store.entity_totals(days, (lambda g, t: t) if level == "t" else (lambda g, t: g))
+    entries = rank_entities(totals, snap, level, metric, LEADERBOARD_SIZE, largest)
+    who = "Teachers" if level == "t" else "Groups"
+    which = "Top" if largest else "Least active"
+    return render_leaderboard(
+        f"{which} {len(entries)} {who} by {metric} (Last {days} days)",
+        "FISH" if level == "t" else "GR name", metric, entries, largest
+    )
+
+def report_key(rtype: str, days: int, sort: str = REPORT_SORT, metric: str = "total") -> tuple:
+    return ("report", rtype, days, sort, metric, stats_store.today_date())
+
+def render_report(rtype: str, days: int, sort: str = REPORT_SORT, metric: str = "total") -> list:
+    """Render any of the r:* report types to HTML pages (memoized)."""
+    windows = 2 if rtype in ("t_compare", "g_compare") else 1
+    key = report_key(rtype, days, sort, metric) + (stats_store.data_key(days, windows),)
+    return report_cache.get_or_compute(key, lambda: _render_report(rtype, days, sort, metric))
+
+def _render_report(rtype: str, days: int, sort: str = REPORT_SORT, metric: str = "total") -> list:
+    snap = registry_cache.get_snapshot()
+    if rtype in LEADERBOARD_TYPES:
+        return _render_leaderboard(rtype, days, metric, snap)
+    if rtype in ("t_compare", "g_compare"):
+        current, previous = stats_store.aggregate_windows(days, 2)
+        if rtype == "t_compare":
+            teacher_rows, _ = build_comparison(current, previous, snap.teachers, {})
+            return render_comparison_table(f"Teachers: last {days} days vs previous {days}", "FISH", teacher_rows)
+        _, group_rows = build_comparison(current, previous, {}, snap.groups)
+        return render_comparison_table(f"Groups: last {days} days vs previous {days}", "GR name", group_rows)
+
+    stats = stats_store.aggregate_stats(days)
+    if rtype == "t_detail":
+        return render_teachers_detail(days, stats, snap.teachers, sort)
+    elif rtype == "g_simple":
+        return render_groups_simple(days, stats, snap.groups, sort)
+    elif rtype == "g_detail":
+        return render_groups_detail(days, stats, snap.groups, sort)
+    return render_teachers_simple(days, stats, snap.teachers, sort)
+
+async def send_report(update, rtype: str, days: int, sort: str = REPORT_SORT, metric: str = "total"):
+    """Send a report as one message with ◀ ▶ paging over the cached pages."""
+    pages = await async_db.run_io(render_report, rtype, days, sort, metric)
+    await reply_paged(update.message, pages, 'HTML', report_key(rtype, days, sort, metric))
+
+def _report_sort(context) -> str:
+    return context.user_data.get("report_sort", REPORT_SORT)
+
+async def gen_teachers_simple(update, context, days):
+    """Teachers report: T/r | Name | XS | Score"""
+    await send_report(update, "t_simple", days, _report_sort(context))
+
+async def gen_teachers_detail(update, context, days):
+    """Teachers Detailed report."""
+    await send_report(update, "t_detail", days, _report_sort(context))
 
 async def gen_groups_simple(update, context, days):
-    """Group report: T/r | GR name | XS"""
-    stats = json_db.aggregate_stats(days)
-    groups = json_db.load_groups()
-    
-    data_list = []
-    
-    for g_id, g_data in groups.items():
-        if not g_data.get('enabled', True): continue
-        
-        total = 0
-        if g_id in stats:
-            for t_counters in stats[g_id].values():
-                total += get_overall_total(t_counters)
-                
-        title = g_data['title']
-        data_list.append((title, total))
-        
-    data_list.sort(key=lambda x: x[0])
-    
-    msg = f"📊 <b>Groups Report (Last {days} days)</b>\n\n"
-    msg += "<pre>"
-    msg += "T/r |           GR name              | XS \n"
-    msg += "----+--------------------------------+----\n"
-    
-    for i, (title, total) in enumerate(data_list, 1):
-        t_pad = title[:30].ljust(30)
-        msg += f"{i:<3} | {t_pad} | {total:>4}\n"
-    
-    msg += "</pre>"
-        
-    try:
-        await update.message.reply_text(msg, parse_mode='HTML')
-    except:
-        clean_msg = msg.replace("<pre>", "").replace("</pre>", "").replace("<b>", "").replace("</b>", "")
-        await update.message.reply_text(clean_msg)
+    """Group report: T/r | GR name | XS | Score"""
+    await send_report(update, "g_simple", days, _report_sort(context))
 
 async def gen_groups_detail(update, context, days):
     """Groups detailed report."""
-    stats = json_db.aggregate_stats(days)
-    groups = json_db.load_groups()
-    
-    data_list = []
-    
+    await send_report(update, "g_detail", days, _report_sort(context))
+
+def build_comparison(current: dict, previous: dict, teachers: dict, groups: dict) -> tuple:
+    """
+    Collapse two aggregated windows into per-teacher and per-group totals.
+    Returns (teacher_rows, group_rows), each a name-sorted list of
+    (id, name, previous_total, current_total).
+    """
+    t_totals = {}
+    g_totals = {}
+    for idx, stats in enumerate((previous, current)):
+        for chat_id, t_stats in stats.items():
+            for t_id, counters in t_stats.items():
+                total = get_overall_total(counters)
+                t_totals.setdefault(t_id, [0, 0])[idx] += total
+                g_totals.setdefault(chat_id, [0, 0])[idx] += total
+
+    teacher_rows = []
+    for t_id, t_data in teachers.items():
+        if not t_data.get('active', True): continue
+        prev, cur = t_totals.get(t_id, (0, 0))
+        teacher_rows.append((t_id, format_short_name(t_data['full_name']), prev, cur))
+
+    group_rows = []
     for g_id, g_data in groups.items():
         if not g_data.get('enabled', True): continue
-        
-        agg_counters = {
-            "text": 0, "photo": 0, "video": 0,
-            "audio": 0, "voice": 0, "document": 0
-        }
-        
-        if g_id in stats:
-            for t_counters in stats[g_id].values():
-                for k, v in t_counters.items():
-                    agg_counters[k] += v
-                    
-        total = get_overall_total(agg_counters)
-        title = g_data['title']
-        data_list.append((title, total, agg_counters))
-        
-    data_list.sort(key=lambda x: x[0])
-    
-    msg = f"📊 <b>Groups Detailed Report (Last {days} days)</b>\n\n"
-    for i, (title, total, counters) in enumerate(data_list, 1):
-        msg += f"{i}. <b>{title}</b> - {total}\n"
-        msg += f"   {format_breakdown(counters)}\n\n"
-        
-    try:
-        await update.message.reply_text(msg, parse_mode='HTML')
-    except:
-        await update.message.reply_text(msg.replace('<b>','').replace('</b>',''))
+        prev, cur = g_totals.get(g_id, (0, 0))
+        group_rows.append((g_id, g_data['title'], prev, cur))
+
+    teacher_rows.sort(key=lambda x: x[1])
+    group_rows.sort(key=lambda x: x[1])
+    return teacher_rows, group_rows
+
+def render_comparison_table(title: str, label: str, rows: list) -> list:
+    """Render (id, name, prev, cur) rows as a paged <pre> table."""
+    header = f"📊 <b>{title}</b>\n\n"
+    prefix = "<pre>"
+    prefix += f"T/r | {label.center(20)} | Old  | New  |  Δ   |   %  \n"
+    prefix += "----+----------------------+------+------+------+------\n"
+
+    lines = []
+    for i, (_, name, prev, cur) in enumerate(rows, 1):
+        delta, pct = format_change(prev, cur)
+        n_pad = html.escape(name[:20].ljust(20), quote=False)
+        lines.append(f"{i:<3} | {n_pad} | {prev:>4} | {cur:>4} | {delta:>4} | {pct:>5}\n")
+
+    return paginate_blocks(lines, header, prefix, "</pre>")
+
+async def gen_teachers_compare(update, context, days):
+    """Teachers report: current window vs the previous one."""
+    await send_report(update, "t_compare", days)
+
+async def gen_groups_compare(update, context, days):
+    """Groups report: current window vs the previous one."""
+    await send_report(update, "g_compare", days)
 
 async def handle_report_group_days(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle report group days input."""
@@ -1110,51 +1397,50 @@ async def handle_report_group_days(update: Update, context: ContextTypes.DEFAULT
     await update.message.reply_text("Use /start to return to menu.")
     return ConversationHandler.END
 
-async def generate_group_report(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id_str: str, days: int):
-    """Generate report for a specific group."""
-    logger.info(f"ADMIN {update.effective_user.id} generated {days}-day group report for {chat_id_str}")
-    
-    stats = json_db.aggregate_stats(days)
-    teachers = json_db.load_teachers()
-    groups = json_db.load_groups()
+def group_report_key(chat_id_str: str, days: int) -> tuple:
+    return ("group_report", chat_id_str, days, stats_store.today_date())
+
+def render_group_report(chat_id_str: str, days: int) -> list:
+    """Render the per-group report (Markdown pages, memoized)."""
+    key = group_report_key(chat_id_str, days) + (stats_store.data_key(days),)
+    return report_cache.get_or_compute(key, lambda: _render_group_report(chat_id_str, days))
+
+def _render_group_report(chat_id_str: str, days: int) -> list:
+    stats = stats_store.aggregate_stats(days)
+    snap = registry_cache.get_snapshot()
     
-    group_data = groups.get(chat_id_str)
+    group_data = snap.group(chat_id_str)
     if not group_data:
-        await update.message.reply_text("❌ Group not found.")
-        return
+        return ["❌ Group not found."]
         
     group_stats = stats.get(chat_id_str, {})
     if not group_stats:
-        await update.message.reply_text(f"📊 No activity in *{group_data['title']}* for the last {days} days.", parse_mode='Markdown')
-        return
+        return [f"📊 No activity in *{group_data['title']}* for the last {days} days."]
     
-    msg = f"📊 *Report by Group:* {group_data['title']}\n"
-    msg += f"📅 *Period:* Last {days} days\n\n"
-    msg += "👨‍🏫 *Teachers in this group:*\n"
+    header = f"📊 *Report by Group:* {group_data['title']}\n"
+    header += f"📅 *Period:* Last {days} days\n\n"
+    header += "👨‍🏫 *Teachers in this group:*\n"
     
-    # Get assigned teachers for this group
-    assigned_teachers = []
-    for t_id in teachers:
-        if json_db.is_teacher_assigned(t_id, chat_id_str):
-            assigned_teachers.append(t_id)
-            
-    has_activity = False
-    for t_id in assigned_teachers:
+    blocks = []
+    for t_id in snap.teachers_in_group(chat_id_str):
         if t_id not in group_stats:
             continue
             
-        has_activity = True
-        name = teachers[t_id]["full_name"]
+        name = snap.teachers[t_id]["full_name"]
         c = group_stats[t_id]
         total = get_overall_total(c)
         
-        msg += f"\n{format_entity_block(f'👨‍🏫 {name} — {total}', c)}\n"
+        blocks.append(f"\n{format_entity_block(f'👨‍🏫 {name} — {total}', c)}\n")
         
-    if not has_activity:
-        await update.message.reply_text(f"📊 No teacher activity in *{group_data['title']}* for the last {days} days.", parse_mode='Markdown')
-        return
-        
-    await update.message.reply_text(msg, parse_mode='Markdown')
+    if not blocks:
+        return [f"📊 No teacher activity in *{group_data['title']}* for the last {days} days."]
+    return paginate_blocks(blocks, header)
+
+async def generate_group_report(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id_str: str, days: int):
+    """Generate report for a specific group."""
+    logger.info(f"ADMIN {update.effective_user.id} generated {days}-day group report for {chat_id_str}")
+    pages = await async_db.run_io(render_group_report, chat_id_str, days)
+    await reply_paged(update.message, pages, 'Markdown', group_report_key(chat_id_str, days))
 
 # ============================================================================
 # EXCEL EXPORT
@@ -1178,53 +1464,154 @@ async def handle_excel_days(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("\nUse /start to return to menu.")
     return ConversationHandler.END
 
+def build_excel_report(days: int, end=None):
+    """
+    Excel report for the `days`-long window ending at `end` (default: today),
+    as an export_manager Artifact, or None if there is no activity. Identical
+    requests at unchanged data reuse the existing file (or its file_id).
+    """
+    end_date = end or stats_store.today_date()
+    dates = [d for window in stats_store.window_dates(days, 2, end_date) for d in window]
+    return export_manager.get_or_build(
+        "excel", (days, end_date.strftime("%Y-%m-%d")), dates,
+        lambda path: _build_excel_report(days, end_date, path), "xlsx"
+    )
+
+_BOLD = Font(bold=True)
+
+def _sheet(wb, title: str, header: list):
+    """Add a write-only sheet with a bold, frozen header row."""
+    ws = wb.create_sheet(title)
+    ws.freeze_panes = "A2"
+    cells = []
+    for value in header:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.font = _BOLD
+        cells.append(cell)
+    ws.append(cells)
+    return ws
+
+def _finish_sheet(ws, columns: int, rows: int):
+    """Header filters (sort/filter buttons) over the written range."""
+    if rows:
+        ws.auto_filter.ref = f"A1:{get_column_letter(columns)}{rows + 1}"
+
+def _type_cells(counters) -> list:
+    return [counters[t] for t in MESSAGE_TYPES] + [counters.total(), counters.score()]
+
+def _build_excel_report(days: int, end, filepath: str) -> bool:
+    """
+    One pass over the days of the window and the one before it feeds every
+    sheet: Report (teacher x group rows), Teachers, Groups, Matrix (teacher x
+    group totals), Daily and Comparison. Rows are streamed to a write-only
+    workbook, so memory holds the aggregates, not the spreadsheet.
+    """
+    snap = registry_cache.get_snapshot()
+    teachers, groups = snap.teachers, snap.groups
+    
+    stats, prev_stats, daily = {}, {}, []
+    for w, dates in enumerate(stats_store.window_dates(days, 2, end)):
+        target = stats if w == 0 else prev_stats
+        for date_str, day_stats in stats_store.iter_days(dates):
+            stats_store.add_day(target, day_stats)
+            if w == 0:
+                day_total = Counters()
+                active_teachers = set()
+                for t_stats in day_stats.values():
+                    for t_id, counters in t_stats.items():
+                        day_total.add(counters)
+                        active_teachers.add(t_id)
+                daily.append((date_str, day_total, len(active_teachers), len(day_stats)))
+    
+    if not stats:
+        return False
+    
+    end_date = end
+    from_date = (end_date - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    to_date = end_date.strftime("%Y-%m-%d")
+    labels = [get_type(t).label for t in MESSAGE_TYPES] + ["Total", "Score"]
+    
+    t_names = {t_id: t_data.get("full_name", t_id) for t_id, t_data in teachers.items()}
+    g_titles = {g_id: g_data.get("title", g_id) for g_id, g_data in groups.items()}
+    teacher_totals = {}  # t_id -> [Counters, groups with activity]
+    group_totals = {}    # chat_id -> [Counters, teachers with activity]
+    
+    wb = Workbook(write_only=True)
+    
+    # Report: one row per (teacher, group) pair, as before
+    header = ["TeacherID", "FullName", "ChatID", "GroupTitle"] + labels + ["FromDate", "ToDate"]
+    ws = _sheet(wb, "Report", header)
+    rows = 0
+    for chat_id, t_stats in stats.items():
+        g_title = g_titles.get(chat_id, chat_id)
+        g_entry = group_totals.setdefault(chat_id, [Counters(), 0])
+        for t_id, counters in t_stats.items():
+            ws.append([t_id, t_names.get(t_id, t_id), chat_id, g_title] + _type_cells(counters) + [from_date, to_date])
+            rows += 1
+            t_entry = teacher_totals.setdefault(t_id, [Counters(), 0])
+            t_entry[0].add(counters)
+            t_entry[1] += 1
+            g_entry[0].add(counters)
+            g_entry[1] += 1
+    _finish_sheet(ws, len(header), rows)
+    
+    # Teachers / Groups: totals per entity, most active first
+    for title, id_label, name_label, count_label, totals, names in (
+        ("Teachers", "TeacherID", "FullName", "Groups", teacher_totals, t_names),
+        ("Groups", "ChatID", "GroupTitle", "Teachers", group_totals, g_titles),
+    ):
+        header = [id_label, name_label] + labels + [count_label]
+        ws = _sheet(wb, title, header)
+        ordered = sorted(totals.items(), key=lambda item: (-item[1][0].total(), names.get(item[0], item[0])))
+        for entity_id, (counters, count) in ordered:
+            ws.append([entity_id, names.get(entity_id, entity_id)] + _type_cells(counters) + [count])
+        _finish_sheet(ws, len(header), len(ordered))
+    
+    # Matrix: teacher x group message totals (pivot)
+    chat_ids = sorted(group_totals, key=lambda g: g_titles.get(g, g))
+    teacher_ids = sorted(teacher_totals, key=lambda t: t_names.get(t, t))
+    header = ["FullName"] + [g_titles.get(g, g) for g in chat_ids] + ["Total"]
+    ws = _sheet(wb, "Matrix", header)
+    for t_id in teacher_ids:
+        row = [stats[g][t_id].total() if t_id in stats[g] else None for g in chat_ids]
+        ws.append([t_names.get(t_id, t_id)] + row + [teacher_totals[t_id][0].total()])
+    ws.append(["Total"] + [group_totals[g][0].total() for g in chat_ids] + [sum(e[0].total() for e in group_totals.values())])
+    
+    # Daily: activity per day, oldest first
+    header = ["Date"] + labels + ["ActiveTeachers", "ActiveGroups"]
+    ws = _sheet(wb, "Daily", header)
+    for date_str, counters, active_teachers, active_groups in reversed(daily):
+        ws.append([date_str] + _type_cells(counters) + [active_teachers, active_groups])
+    _finish_sheet(ws, len(header), len(daily))
+    
+    # Comparison: requested window vs the one before it
+    header = ["Level", "ID", "Name", "Previous", "Current", "Delta", "ChangePct"]
+    ws = _sheet(wb, "Comparison", header)
+    teacher_rows, group_rows = build_comparison(stats, prev_stats, teachers, groups)
+    rows = 0
+    for level, entries in (("Teacher", teacher_rows), ("Group", group_rows)):
+        for entity_id, name, prev, cur in entries:
+            ws.append([level, entity_id, name, prev, cur, cur - prev,
+                       round((cur - prev) * 100 / prev, 1) if prev else None])
+            rows += 1
+    _finish_sheet(ws, len(header), rows)
+    
+    wb.save(filepath)
+    return True
+
 async def generate_excel_report(update: Update, context: ContextTypes.DEFAULT_TYPE, days: int):
     """Generate Excel report."""
     logger.info(f"ADMIN {update.effective_user.id} generated {days}-day Excel report")
     
-    stats = json_db.aggregate_stats(days)
-    teachers = json_db.load_teachers()
-    groups = json_db.load_groups()
+    await update.message.reply_text("📥 Generating Excel report...")
     
-    if not stats:
+    artifact = await async_db.build_export(build_excel_report, days)
+    if not artifact:
         await update.message.reply_text(f"📥 No activity in the last {days} days.")
         return
     
-    await update.message.reply_text("📥 Generating Excel report...")
-    
-    rows = []
-    end_date = datetime.now(json_db.local_tz)
-    from_date = (end_date - pd.Timedelta(days=days-1)).strftime("%Y-%m-%d")
-    to_date = end_date.strftime("%Y-%m-%d")
-    
-    for chat_id, t_stats in stats.items():
-        g_title = groups.get(chat_id, {}).get("title", chat_id)
-        for t_id, counters in t_stats.items():
-            t_name = teachers.get(t_id, {}).get("full_name", t_id)
-            rows.append({
-                "TeacherID": t_id,
-                "FullName": t_name,
-                "ChatID": chat_id,
-                "GroupTitle": g_title,
-                "Text": counters["text"],
-                "Photo": counters["photo"],
-                "Video": counters["video"],
-                "Audio": counters["audio"],
-                "Voice": counters["voice"],
-                "Document": counters["document"],
-                "Total": sum(counters.values()),
-                "FromDate": from_date,
-                "ToDate": to_date
-            })
-    
-    df = pd.DataFrame(rows)
-    filename = f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    filepath = os.path.join(EXPORT_DIR, filename)
-    
-    df.to_excel(filepath, index=False)
-    
-    with open(filepath, 'rb') as f:
-        await update.message.reply_document(document=f, filename=filename)
+    filename = f"report_{days}d_{stats_store.today_date().strftime('%Y%m%d')}.xlsx"
+    await send_artifact(context.bot, update.effective_chat.id, artifact, filename)
 
 # ============================================================================
 # DIAGNOSTICS
@@ -1232,12 +1619,33 @@ async def generate_excel_report(update: Update, context: ContextTypes.DEFAULT_TY
 
 async def show_diagnostics(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show system diagnostics."""
-    diag = json_db.get_diagnostics()
+    diag = await async_db.get_diagnostics()
     
     msg = "🔍 *System Diagnostics*\n\n"
     msg += f"👨‍🏫 Teachers: {diag['teachers_count']} ({diag['active_teachers']} active)\n"
     msg += f"🏫 Groups: {diag['groups_count']} ({diag['enabled_groups']} enabled)\n"
-    msg += f"📊 Stats files: {diag['stats_files']}\n\n"
+    files = await async_db.run_io(stats_store.storage_summary)
+    msg += f"📊 Stats files: {files['day_files']} days + {files['archived_months']} monthly archives ({files['archive_bytes'] // 1024} KB)\n"
+    
+    cache = report_cache.get_cache_stats()
+    msg += f"🗄 Report cache: {cache['entries']} entries ({cache['hits']} hits / {cache['misses']} misses)\n"
+    
+    w = get_writer_stats()
+    msg += f"✍️ Writer: {w['queued']} queued, {w['commands']} writes in {w['batches']} batches\n"
+    if w['unsaved']:
+        msg += f"⚠️ {w['unsaved']} increments not yet saved (commit failing, retried each batch)\n"
+    
+    ex = await async_db.run_io(export_manager.get_export_stats)
+    msg += f"📦 Exports: {ex['files']} files ({ex['bytes'] // 1024} KB), {ex['file_ids']} reusable uploads\n"
+    
+    dd = get_dedupe_stats()
+    msg += f"♻️ Dedupe: {dd['keys']} keys, {dd['duplicates']} duplicates skipped (albums: {dd['albums']})\n"
+    
+    rl = get_rate_limiter_stats()
+    if rl:
+        msg += f"🚦 API queue: {rl['pending']} waiting (peak {rl['peak']}), {rl['sent']} sent, {rl['failed']} rate-limited\n\n"
+    else:
+        msg += "🚦 API rate limiter: off\n\n"
     
     if diag['teachers']:
         msg += "*Teachers:*\n"
@@ -1278,7 +1686,7 @@ async def diag_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     diag_text += f"- Title: `{chat.title}`\n\n"
     
     if is_group:
-        group_data = json_db.get_group(chat_id_str)
+        group_data = await async_db.get_group(chat_id_str)
         diag_text += f"🏫 *Group Status:*\n"
         diag_text += f"- Registered: `{'✅ Yes' if group_data else '❌ No'}`\n"
         if group_data:
@@ -1291,26 +1699,61 @@ async def diag_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     diag_text += f"- Name: {user.full_name}\n"
     diag_text += f"- ID: `{user.id}`\n"
     
-    teacher_id = json_db.find_teacher_by_telegram_id(user.id)
+    teacher_id = await async_db.find_teacher_by_telegram_id(user.id)
     diag_text += f"- Recognized as teacher: `{'✅ ' + teacher_id if teacher_id else '❌ No'}`\n"
     
     if teacher_id:
-        assigned = json_db.is_teacher_assigned(teacher_id, chat_id_str)
+        assigned = await async_db.is_teacher_assigned(teacher_id, chat_id_str)
         diag_text += f"- Assigned to this group: `{'✅ Yes' if assigned else '❌ No'}`\n"
     
-    # Message type detection test
-    msg_type = "unknown"
-    if msg.photo: msg_type = "photo"
-    elif msg.video: msg_type = "video"
-    elif msg.audio: msg_type = "audio"
-    elif msg.voice: msg_type = "voice"
-    elif msg.document: msg_type = "document"
-    elif msg.text: msg_type = "text"
+    # Message type detection test (same rules as tracking)
+    msg_type = message_types.classify(msg) or "not counted"
     
     diag_text += f"\n📝 *Last Message Type:* `{msg_type}`"
     
     await update.message.reply_text(diag_text, parse_mode='Markdown')
 
+# ============================================================================
+# INLINE SEARCH
+# ============================================================================
+
+async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Admin-only fuzzy inline search: `@bot <text>`, `@bot t <text>` (teachers)
+    or `@bot g <text>` (groups). Matches names, titles and IDs, tolerating
+    typos. Results deep-link into the detail screens.
+    """
+    query = update.inline_query
+    if not query or not is_admin(query.from_user.id):
+        return
+    
+    text = query.query.strip()
+    kind = None
+    if text[:2].lower() in ("t ", "g "):
+        kind, text = text[0].lower(), text[2:].strip()
+    
+    index = await async_db.run_io(search_index.get_index)
+    matches = index.search(text, kind) if text else []
+    
+    results = []
+    for m_kind, entity_id, label in matches:
+        if m_kind == "t":
+            title = f"👨‍🏫 {label}"
+            description = f"ID: {entity_id}"
+        else:
+            title = f"🏫 {label}"
+            description = f"Chat ID: {entity_id}"
+        link = f"https://t.me/{context.bot.username}?start={m_kind}_{entity_id}"
+        results.append(InlineQueryResultArticle(
+            id=f"{m_kind}:{entity_id}",
+            title=title,
+            description=description,
+            input_message_content=InputTextMessageContent(f"{title}\n{description}"),
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Open", url=link)]])
+        ))
+    
+    await query.answer(results, cache_time=0, is_personal=True)
+
 # ============================================================================
 # CANCEL
 # ============================================================================
@@ -1321,6 +1764,11 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("❌ Cancelled. Use /start to return to menu.")
     return ConversationHandler.END
 
+# Probes in flight at once during /sync_groups
+SYNC_CONCURRENCY = 8
+# BadRequest texts that mean the bot is no longer in the chat
+_GONE_MESSAGES = ("chat not found", "kicked", "not a member")
+
 async def sync_groups(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manually sync bot membership across all registered groups."""
     if not update.effective_user or not is_admin(update.effective_user.id):
@@ -1328,34 +1776,109 @@ async def sync_groups(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text("🔄 Syncing groups... Please wait.")
     
-    groups = json_db.load_groups()
-    total = 0
-    removed = 0
-    
-    for chat_id_str, data in groups.items():
-        # Only check enabled groups
-        if not data.get("enabled", True):
-            continue
-            
-        total += 1
-        try:
-            # Attempt to get chat info - requires bot to be in the chat
-            await context.bot.get_chat(int(chat_id_str))
-        except Exception as e:
-            # If forbidden or not found, bot was likely removed or group deleted
-            removed += 1
-            json_db.deactivate_group(chat_id_str)
-            json_db.remove_group_from_assignments(chat_id_str)
-            logger.info(f"SYNC_REMOVED_GROUP {chat_id_str} (Error: {e})")
+    groups = await async_db.load_groups()
+    # Only check enabled groups
+    enabled = [chat_id_str for chat_id_str, data in groups.items() if data.get("enabled", True)]
+    total = len(enabled)
+    
+    semaphore = asyncio.Semaphore(SYNC_CONCURRENCY)
+    
+    async def probe(chat_id_str):
+        """'removed', 'ok' or 'unknown' (transient errors never deactivate a group)."""
+        async with semaphore:
+            try:
+                # Attempt to get chat info - requires bot to be in the chat.
+                # Always ask Telegram: this is the fallback for removals whose
+                # my_chat_member update was missed, so a cached entry proves nothing
+                chat_cache.forget_chat(chat_id_str)
+                await chat_cache.get_chat(context.bot, chat_id_str)
+                return "ok"
+            except (Forbidden, BadRequest) as e:
+                if isinstance(e, BadRequest) and not any(m in e.message.lower() for m in _GONE_MESSAGES):
+                    logger.warning(f"SYNC_UNKNOWN {chat_id_str}: {e}")
+                    return "unknown"
+                # Bot was removed or the group deleted
+                await async_db.deactivate_group(chat_id_str)
+                await async_db.remove_group_from_assignments(chat_id_str)
+                logger.info(f"SYNC_REMOVED_GROUP {chat_id_str} (Error: {e})")
+                return "removed"
+            except Exception as e:
+                # Timeouts, network errors, exhausted RetryAfter: leave the group alone
+                logger.warning(f"SYNC_UNKNOWN {chat_id_str}: {e}")
+                return "unknown"
+    
+    results = await asyncio.gather(*(probe(chat_id_str) for chat_id_str in enabled))
+    removed = results.count("removed")
+    unknown = results.count("unknown")
             
     await update.message.reply_text(
         f"✅ *Sync Complete!*\n\n"
         f"📊 Active groups checked: `{total}`\n"
         f"❌ Groups removed/cleaned: `{removed}`\n"
-        f"🟢 Still healthy: `{total - removed}`",
+        f"⚠️ Could not check (left as is): `{unknown}`\n"
+        f"🟢 Still healthy: `{total - removed - unknown}`",
+        parse_mode='Markdown'
+    )
+
+async def backup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Take an incremental snapshot of the data directory."""
+    if not update.effective_user or not is_admin(update.effective_user.id):
+        return
+    
+    await update.message.reply_text("💾 Taking snapshot...")
+    try:
+        # On the writer thread: no write can interleave with the copy
+        result = await async_db.run_write(snapshot.take_snapshot)
+    except Exception as e:
+        logger.error(f"Backup failed: {e}")
+        await update.message.reply_text(f"❌ Backup failed: {e}")
+        return
+    
+    logger.info(f"ADMIN {update.effective_user.id} took snapshot {result['id']}")
+    await update.message.reply_text(
+        f"✅ *Snapshot taken*\n\n"
+        f"🆔 `{result['id']}`\n"
+        f"📁 Files: `{result['files']}` ({result['total_bytes'] // 1024} KB)\n"
+        f"🆕 Stored now: `{result['new_objects']}` files ({result['new_bytes'] // 1024} KB)\n\n"
+        f"Restore with `python backup.py restore {result['id']}` (bot stopped).",
         parse_mode='Markdown'
     )
 
+# Bot API limit for documents sent by bots
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+async def export_raw_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/export_raw [csv|parquet] [FROM] [TO]: raw daily rows for BI tools (default: csv, last 30 days)."""
+    if not update.effective_user or not is_admin(update.effective_user.id):
+        return
+    
+    args = list(context.args or [])
+    fmt = args.pop(0).lower() if args and args[0].lower() in raw_export.FORMATS else "csv"
+    today = stats_store.today_date()
+    date_to = args[1] if len(args) > 1 else today.strftime("%Y-%m-%d")
+    date_from = args[0] if args else (today - timedelta(days=29)).strftime("%Y-%m-%d")
+    
+    await update.message.reply_text(f"📤 Exporting {date_from} .. {date_to} as {fmt}...")
+    try:
+        artifact = await async_db.build_export(raw_export.export_raw, fmt, date_from, date_to)
+    except (ValueError, RuntimeError) as e:
+        await update.message.reply_text(
+            f"❌ {e}\n\nUsage: `/export_raw [csv|parquet] [YYYY-MM-DD] [YYYY-MM-DD]`",
+            parse_mode='Markdown'
+        )
+        return
+    
+    if not artifact:
+        await update.message.reply_text(f"📤 No activity between {date_from} and {date_to}.")
+        return
+    
+    logger.info(f"ADMIN {update.effective_user.id} exported raw rows ({fmt}, {date_from}..{date_to})")
+    if not artifact.file_id and os.path.getsize(artifact.path) > MAX_UPLOAD_BYTES:
+        await update.message.reply_text(f"📤 Written to `{artifact.path}` (too large to send here).", parse_mode='Markdown')
+        return
+    filename = f"raw_{date_from}_{date_to}.{raw_export.file_suffix(fmt)}"
+    await send_artifact(context.bot, update.effective_chat.id, artifact, filename)
+
 async def handle_mystat_days(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle MyStat days input."""
     if not update.message.text:
@@ -1371,7 +1894,7 @@ async def handle_mystat_days(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return MYSTAT_DAYS
     
     user_id = update.effective_user.id
-    teacher_id = json_db.find_teacher_by_telegram_id(user_id)
+    teacher_id = await async_db.find_teacher_by_telegram_id(user_id)
     if not teacher_id:
         await update.message.reply_text("❌ Error: Teacher profile not found.")
         return ConversationHandler.END
@@ -1379,17 +1902,17 @@ async def handle_mystat_days(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await generate_mystat_report(update, context, teacher_id, days)
     
     # Show menu again
-    teacher = json_db.get_teacher(teacher_id)
+    teacher = await async_db.get_teacher(teacher_id)
     return await teacher_menu(update, context, teacher_id, teacher)
 
 async def generate_mystat_report(update: Update, context: ContextTypes.DEFAULT_TYPE, teacher_id: str, days: int):
     """Generate statistic report for a specific teacher."""
     logger.info(f"TEACHER {teacher_id} generated self-stat report for {days} days")
     
-    stats = json_db.aggregate_stats(days)
-    all_groups = json_db.load_groups()
+    stats = await async_db.aggregate_stats(days)
+    all_groups = await async_db.load_groups()
     # Get ALL assigned groups even if no stats
-    assigned_groups_ids = json_db.get_teacher_groups(teacher_id)
+    assigned_groups_ids = await async_db.get_teacher_groups(teacher_id)
     
     msg = f"📊 <b>My Statistics</b>\n"
     msg += f"📅 <b>Period:</b> Last {days} days\n\n"
@@ -1409,19 +1932,14 @@ async def generate_mystat_report(update: Update, context: ContextTypes.DEFAULT_T
         msg += "⚠️ No groups assigned."
     else:
         for i, (chat_id_str, title) in enumerate(groups_list, 1):
-            counters = {
-                "text": 0, "photo": 0, "video": 0,
-                "audio": 0, "voice": 0, "document": 0
-            }
-            
+            counters = Counters()
             if chat_id_str in stats and teacher_id in stats[chat_id_str]:
-                for k, v in stats[chat_id_str][teacher_id].items():
-                    counters[k] += v
+                counters.add(stats[chat_id_str][teacher_id])
             
-            total = get_overall_total(counters)
+            total = counters.total()
             overall_total += total
             
-            msg += f"{i}. <b>{title}</b> — {total}\n"
+            msg += f"{i}. <b>{html.escape(title, quote=False)}</b> — {total}\n"
             msg += f"   {format_breakdown(counters)}\n\n"
             
     msg += f"\n🏆 <b>Total: {overall_total}</b>"
@@ -1430,4 +1948,4 @@ async def generate_mystat_report(update: Update, context: ContextTypes.DEFAULT_T
         await update.message.reply_text(msg, parse_mode='HTML')
     except Exception as e:
         logger.error(f"Error sending mystat: {e}")
-        await update.message.reply_text(msg.replace('<b>','').replace('</b>',''))
+        await update.message.reply_text(strip_html(msg))
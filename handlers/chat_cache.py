@@ -0,0 +1,66 @@
+import logging
+from telegram import ChatMemberUpdated
+from telegram.constants import ChatMemberStatus
+from storage.report_cache import ReportCache
+from config import CHAT_CACHE_TTL, CHAT_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+# (chat_id, user_id) -> ChatMember; chat_id -> ChatFullInfo
+_members = ReportCache(CHAT_CACHE_TTL, CHAT_CACHE_MAX_ENTRIES)
+_chats = ReportCache(CHAT_CACHE_TTL, CHAT_CACHE_MAX_ENTRIES)
+
+ACTIVE_STATUSES = (ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+
+def is_active(member) -> bool:
+    """Member/admin/owner, or restricted but still in the chat."""
+    if member.status in ACTIVE_STATUSES:
+        return True
+    return member.status == ChatMemberStatus.RESTRICTED and getattr(member, "is_member", False)
+
+# ============================================================================
+# CACHED LOOKUPS
+# ============================================================================
+
+async def get_chat_member(bot, chat_id: int, user_id: int):
+    """bot.get_chat_member() served from the cache when fresh. Errors are not cached."""
+    key = (int(chat_id), int(user_id))
+    member = _members.get(key)
+    if member is None:
+        member = await bot.get_chat_member(chat_id=key[0], user_id=key[1])
+        _members.put(key, member)
+    return member
+
+async def get_chat(bot, chat_id: int):
+    """bot.get_chat() served from the cache when fresh. Errors are not cached."""
+    chat_id = int(chat_id)
+    chat = _chats.get(chat_id)
+    if chat is None:
+        chat = await bot.get_chat(chat_id)
+        _chats.put(chat_id, chat)
+    return chat
+
+async def is_member(bot, chat_id: int, user_id: int) -> bool:
+    """True if the user is a member/admin/owner of the chat (False on API errors)."""
+    try:
+        member = await get_chat_member(bot, chat_id, user_id)
+    except Exception as e:
+        logger.warning(f"Could not check membership for {user_id} in {chat_id}: {e}")
+        return False
+    return is_active(member)
+
+# ============================================================================
+# UPDATES
+# ============================================================================
+
+def remember(change: ChatMemberUpdated):
+    """Store the new membership from a chat_member / my_chat_member update."""
+    chat_id = change.chat.id
+    member = change.new_chat_member
+    _members.put((chat_id, member.user.id), member)
+
+def forget_chat(chat_id: int):
+    """Drop everything cached for a chat (e.g. after the bot was removed)."""
+    chat_id = int(chat_id)
+    _chats.discard(chat_id)
+    _members.discard_where(lambda key: key[0] == chat_id)
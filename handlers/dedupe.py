@@ -0,0 +1,118 @@
+"""
+Ingest-side deduplication for track_activity.
+
+Keeps a bounded LRU of recently counted keys with a TTL: (chat_id,
+message_id) for every counted message, and (chat_id, media_group_id) for
+albums when ALBUM_COUNTING is "once". A message seen again (an update
+replayed after a crash or restart) is not counted twice. The keys are
+saved to DATA_DIR on shutdown and every DEDUPE_SAVE_INTERVAL seconds, and
+loaded back on start.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from storage import async_db
+from config import DATA_DIR, WORKER_ID, ALBUM_COUNTING, DEDUPE_TTL, DEDUPE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+DEDUPE_FILE = os.path.join(DATA_DIR, f"dedupe{'.' + WORKER_ID if WORKER_ID else ''}.json")
+
+class RecentKeys:
+    """Bounded set of keys, each forgotten after `ttl` seconds (oldest evicted first)."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> expires_at (wall clock, survives restarts)
+        self._lock = threading.Lock()
+        self.dirty = False
+        self.duplicates = 0
+
+    def add(self, key) -> bool:
+        """Remember `key`; False if it was already seen within the TTL."""
+        now = time.time()
+        with self._lock:
+            expires_at = self._data.get(key)
+            if expires_at is not None and expires_at >= now:
+                self.duplicates += 1
+                return False
+            self._data[key] = now + self.ttl
+            self._data.move_to_end(key)
+            # Entries are in insertion order, so expired ones are at the front
+            while self._data and (len(self._data) > self.max_entries or next(iter(self._data.values())) < now):
+                self._data.popitem(last=False)
+            self.dirty = True
+            return True
+
+    def dump(self) -> list:
+        now = time.time()
+        with self._lock:
+            self.dirty = False
+            return [[list(key), expires_at] for key, expires_at in self._data.items() if expires_at >= now]
+
+    def load(self, entries: list):
+        now = time.time()
+        with self._lock:
+            for key, expires_at in entries[-self.max_entries:]:
+                if expires_at >= now:
+                    self._data[tuple(key)] = expires_at
+
+    def __len__(self):
+        return len(self._data)
+
+_recent = RecentKeys(DEDUPE_TTL, DEDUPE_MAX_ENTRIES)
+
+# ============================================================================
+# POLICY
+# ============================================================================
+
+def should_count(chat_id: int, message_id: int, media_group_id: str = None, edit_date=None) -> bool:
+    """
+    True the first time a message (or, with ALBUM_COUNTING=once, an album) is
+    seen. Edits are keyed by their edit_date, so each edit counts at most once.
+    """
+    key = (chat_id, message_id) if edit_date is None else (chat_id, message_id, int(edit_date.timestamp()))
+    if not _recent.add(key):
+        return False
+    if media_group_id and ALBUM_COUNTING == "once":
+        return _recent.add((chat_id, media_group_id))
+    return True
+
+def get_dedupe_stats() -> dict:
+    return {"keys": len(_recent), "duplicates": _recent.duplicates, "albums": ALBUM_COUNTING}
+
+# ============================================================================
+# PERSISTENCE
+# ============================================================================
+
+def load():
+    """Restore the keys saved by the previous run (if any)."""
+    try:
+        with open(DEDUPE_FILE, 'r', encoding='utf-8') as f:
+            _recent.load(json.load(f))
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to read {DEDUPE_FILE}: {e}")
+        return
+    logger.info(f"Loaded {len(_recent)} dedupe keys")
+
+def save(force: bool = False):
+    """Write the live keys to disk (skipped when nothing changed)."""
+    if not (_recent.dirty or force):
+        return
+    tmp_path = f"{DEDUPE_FILE}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_recent.dump(), f)
+        os.replace(tmp_path, DEDUPE_FILE)
+    except OSError as e:
+        logger.error(f"Failed to save dedupe keys: {e}")
+
+async def save_job(context):
+    """JobQueue callback: periodic save, off the event loop."""
+    await async_db.run_io(save)
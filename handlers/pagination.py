@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import html
+import logging
+import re
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import MessageLimit
+from telegram.ext import ContextTypes
+from telegram.error import BadRequest
+from storage import async_db, export_manager
+from storage.report_cache import ReportCache, data_version
+from config import PAGER_TTL, PAGE_SEND_CONCURRENCY, PAGE_SEND_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Leave room for the pager footer and for entity parsing differences
+PAGE_LIMIT = MessageLimit.MAX_TEXT_LENGTH - 96
+
+# token -> (pages, parse_mode); pages are kept only as long as the pager is usable
+_pagers = ReportCache(PAGER_TTL, 256)
+
+# ============================================================================
+# PAGE BUILDING
+# ============================================================================
+
+_TAG = re.compile(r"<(/?)([a-zA-Z]+)[^>]*>")
+
+def text_length(text: str) -> int:
+    """Length as Telegram counts it (UTF-16 code units; most emoji take two)."""
+    return len(text.encode("utf-16-le")) // 2
+
+def _truncate_html(block: str, room: int) -> str:
+    """
+    Cut an oversized block to `room` UTF-16 units without breaking markup:
+    at the last line break that fits, never inside a tag or an entity, with
+    any tags left open closed again.
+    """
+    room = max(room - 32, 1)  # space for the closing tags
+    units = 0
+    for end, char in enumerate(block):
+        units += 2 if ord(char) > 0xFFFF else 1
+        if units > room:
+            break
+    else:
+        end = len(block)
+    cut = block[:end]
+    if "\n" in cut[:-1]:
+        cut = cut[:cut.rindex("\n", 0, len(cut) - 1) + 1]
+    if cut.rfind("<") > cut.rfind(">"):
+        cut = cut[:cut.rfind("<")]
+    if cut.rfind("&") > cut.rfind(";"):
+        cut = cut[:cut.rfind("&")]
+
+    open_tags = []
+    for closing, name in _TAG.findall(cut):
+        if not closing:
+            open_tags.append(name)
+        elif name in open_tags:
+            del open_tags[len(open_tags) - 1 - open_tags[::-1].index(name)]
+    return cut + "".join(f"</{name}>" for name in reversed(open_tags))
+
+def paginate_blocks(blocks, header: str = "", prefix: str = "", suffix: str = "", limit: int = PAGE_LIMIT) -> list:
+    """
+    Pack text blocks into pages that fit one Telegram message.
+
+    Every page is `header + prefix + blocks + suffix`, so tables keep their
+    column header and <pre> wrapper on each page. Sizes are measured in
+    UTF-16 units, as Telegram does. A single block longer than the limit is
+    truncated at a line break, keeping its HTML well-formed.
+    """
+    fixed = text_length(header) + text_length(prefix) + text_length(suffix)
+    room = max(limit - fixed, 1)
+
+    pages = []
+    current = []
+    size = 0
+    for block in blocks:
+        length = text_length(block)
+        if length > room:
+            block = _truncate_html(block, room)
+            length = text_length(block)
+        if current and size + length > room:
+            pages.append(header + prefix + "".join(current) + suffix)
+            current = []
+            size = 0
+        current.append(block)
+        size += length
+
+    pages.append(header + prefix + "".join(current) + suffix)
+    return pages
+
+def strip_html(msg: str) -> str:
+    """Plain-text fallback for HTML reports: drop every tag, then decode the entities."""
+    return html.unescape(_TAG.sub("", msg))
+
+# ============================================================================
+# SENDING
+# ============================================================================
+
+async def _send_page(bot, chat_id: int, page: str, parse_mode: str):
+    try:
+        await bot.send_message(chat_id=chat_id, text=page, parse_mode=parse_mode)
+    except Exception as e:
+        logger.error(f"Error sending report page to {chat_id}: {e}")
+        await bot.send_message(chat_id=chat_id, text=strip_html(page))
+
+async def send_pages(bot, chat_ids, pages: list, parse_mode: str = 'HTML'):
+    """
+    Send every page to every chat.
+
+    Pages go out in order within a chat, spaced by PAGE_SEND_INTERVAL to stay
+    under Telegram's per-chat limit; at most PAGE_SEND_CONCURRENCY chats are
+    served at once.
+    """
+    semaphore = asyncio.Semaphore(PAGE_SEND_CONCURRENCY)
+
+    async def send_chat(chat_id):
+        async with semaphore:
+            for i, page in enumerate(pages):
+                if i:
+                    await asyncio.sleep(PAGE_SEND_INTERVAL)
+                try:
+                    await _send_page(bot, chat_id, page, parse_mode)
+                except Exception as e:
+                    logger.error(f"Failed to deliver report to {chat_id}: {e}")
+                    return
+
+    await asyncio.gather(*(send_chat(chat_id) for chat_id in chat_ids))
+
+async def send_artifact(bot, chat_id: int, artifact, filename: str, caption: str = None):
+    """
+    Send an export artifact. One uploaded before goes out by file_id (no
+    upload); otherwise the file is uploaded and its file_id recorded.
+    Returns the artifact with the file_id filled in, for further recipients.
+    """
+    if artifact.file_id:
+        try:
+            await bot.send_document(chat_id=chat_id, document=artifact.file_id, caption=caption)
+            return artifact
+        except BadRequest as e:
+            logger.warning(f"Stored file_id for {artifact.key} rejected, uploading again: {e}")
+            await async_db.run_io(export_manager.forget_file_id, artifact.key)
+            artifact = artifact._replace(file_id=None)
+            if artifact.path is None:
+                raise
+
+    with open(artifact.path, 'rb') as f:
+        message = await bot.send_document(chat_id=chat_id, document=f, filename=filename, caption=caption)
+    if message.document:
+        await async_db.run_io(export_manager.record_file_id, artifact.key, message.document.file_id)
+        artifact = artifact._replace(file_id=message.document.file_id)
+    return artifact
+
+def _pager_markup(token: str, index: int, total: int):
+    if total <= 1:
+        return None
+    buttons = []
+    if index > 0:
+        buttons.append(InlineKeyboardButton("◀", callback_data=f"pg:{token}:{index - 1}"))
+    buttons.append(InlineKeyboardButton(f"{index + 1}/{total}", callback_data="pg:noop"))
+    if index < total - 1:
+        buttons.append(InlineKeyboardButton("▶", callback_data=f"pg:{token}:{index + 1}"))
+    return InlineKeyboardMarkup([buttons])
+
+async def reply_paged(message, pages: list, parse_mode: str = 'HTML', key: tuple = None):
+    """
+    Reply with the first page and ◀ ▶ buttons for the rest.
+
+    `key` identifies the already-computed result; the pages are looked up by
+    its token when a button is pressed, so paging never re-renders.
+    """
+    token = None
+    if len(pages) > 1:
+        token = hashlib.sha1(repr((key or pages[0], data_version())).encode('utf-8')).hexdigest()[:16]
+        _pagers.put(token, (pages, parse_mode))
+
+    markup = _pager_markup(token, 0, len(pages))
+    try:
+        await message.reply_text(pages[0], parse_mode=parse_mode, reply_markup=markup)
+    except Exception as e:
+        logger.error(f"Error sending report: {e}")
+        await message.reply_text(strip_html(pages[0]), reply_markup=markup)
+
+async def handle_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle ◀ ▶ presses: pg:<token>:<page>."""
+    query = update.callback_query
+    parts = query.data.split(":")
+    if len(parts) != 3:
+        await query.answer()
+        return
+
+    _, token, index_str = parts
+    entry = _pagers.get(token)
+    if entry is None:
+        await query.answer("⌛ This report has expired. Please generate it again.", show_alert=True)
+        return
+
+    pages, parse_mode = entry
+    try:
+        index = min(max(int(index_str), 0), len(pages) - 1)
+    except ValueError:
+        await query.answer()
+        return
+
+    await query.answer()
+    markup = _pager_markup(token, index, len(pages))
+    try:
+        await query.edit_message_text(pages[index], parse_mode=parse_mode, reply_markup=markup)
+    except Exception as e:
+        if "message is not modified" not in str(e).lower():
+            logger.error(f"Error showing report page: {e}")
+            await query.edit_message_text(strip_html(pages[index]), reply_markup=markup)
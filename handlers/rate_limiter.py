@@ -0,0 +1,97 @@
+import logging
+from telegram.error import RetryAfter
+from telegram.ext import AIORateLimiter
+from config import RATE_LIMIT_MAX_RETRIES, PRIVATE_CHAT_RATE
+from storage.report_cache import ReportCache
+
+try:
+    from aiolimiter import AsyncLimiter
+except ImportError:
+    AsyncLimiter = None
+
+logger = logging.getLogger(__name__)
+
+# Per-chat limiters are dropped after this long (or beyond the size cap); a
+# fresh one only allows the same short burst an idle chat would have anyway
+PRIVATE_LIMITER_TTL = 600
+PRIVATE_LIMITER_MAX_CHATS = 10000
+
+# ============================================================================
+# OUTBOUND RATE LIMITER
+# ============================================================================
+
+class QueuedRateLimiter(AIORateLimiter):
+    """
+    AIORateLimiter (global 30/s, 20/min per group, retry on RetryAfter) plus a
+    per-chat limit for private chats and counters for /diag.
+
+    Every Bot API call the application makes passes through here, so bulk
+    sends (admin notifications, pending request lists, group probes) can
+    simply be fired concurrently and are paced centrally.
+    """
+
+    def __init__(self, private_chat_rate: float = PRIVATE_CHAT_RATE, **kwargs):
+        super().__init__(**kwargs)
+        self._private_chat_rate = private_chat_rate
+        self._private_limiters = ReportCache(PRIVATE_LIMITER_TTL, PRIVATE_LIMITER_MAX_CHATS)
+        self.pending = 0
+        self.peak = 0
+        self.sent = 0
+        self.failed = 0
+
+    def _private_limiter(self, chat_id):
+        if not self._private_chat_rate or not isinstance(chat_id, int) or chat_id <= 0:
+            return None
+        limiter = self._private_limiters.get(chat_id)
+        if limiter is None:
+            # Same average rate, but short bursts (reply + follow-up) are not delayed
+            limiter = AsyncLimiter(self._private_chat_rate * 3, 3)
+            self._private_limiters.put(chat_id, limiter)
+        return limiter
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        self.pending += 1
+        self.peak = max(self.peak, self.pending)
+        try:
+            chat_id = data.get("chat_id")
+            try:
+                chat_id = int(chat_id)
+            except (TypeError, ValueError):
+                pass
+
+            limiter = self._private_limiter(chat_id)
+            if limiter is not None:
+                async with limiter:
+                    result = await super().process_request(callback, args, kwargs, endpoint, data, rate_limit_args)
+            else:
+                result = await super().process_request(callback, args, kwargs, endpoint, data, rate_limit_args)
+            self.sent += 1
+            return result
+        except RetryAfter:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+
+_limiter = None
+
+def build_rate_limiter():
+    """Create the limiter, or return None if the rate-limiter extra is not installed."""
+    global _limiter
+    try:
+        _limiter = QueuedRateLimiter(max_retries=RATE_LIMIT_MAX_RETRIES)
+    except RuntimeError as e:
+        logger.warning(f"Rate limiter disabled: {e}")
+        _limiter = None
+    return _limiter
+
+def get_rate_limiter_stats():
+    """Counters for diagnostics, or None when the limiter is disabled."""
+    if _limiter is None:
+        return None
+    return {
+        "pending": _limiter.pending,
+        "peak": _limiter.peak,
+        "sent": _limiter.sent,
+        "failed": _limiter.failed,
+    }
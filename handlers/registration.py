@@ -1,7 +1,9 @@
+import asyncio
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, MessageHandler, filters, CallbackQueryHandler
-from storage import json_db
+from storage import async_db, membership
+from handlers import chat_cache
 from config import ADMIN_IDS
 
 logger = logging.getLogger(__name__)
@@ -19,7 +21,7 @@ async def start_registration(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.answer()
     
     # Double check if already pending
-    pending = json_db.get_pending_registration(user.id)
+    pending = await async_db.get_pending_registration(user.id)
     if pending:
         msg = (
             "⏳ Your registration request is pending approval.\n"
@@ -56,7 +58,7 @@ async def handle_name_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return WAIT_NAME
         
     # Save pending request
-    json_db.add_pending_registration(user.id, full_name)
+    await async_db.add_pending_registration(user.id, full_name)
     
     # Notify User
     await update.message.reply_text(
@@ -82,7 +84,7 @@ async def handle_name_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"🔗 Username: @{user.username if user.username else 'None'}"
     )
     
-    for admin_id in ADMIN_IDS:
+    async def notify(admin_id):
         try:
             await context.bot.send_message(
                 chat_id=admin_id,
@@ -92,6 +94,9 @@ async def handle_name_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         except Exception as e:
             logger.error(f"Failed to send request to admin {admin_id}: {e}")
+    
+    # Fired together; the application's rate limiter paces them
+    await asyncio.gather(*(notify(admin_id) for admin_id in ADMIN_IDS))
             
     return ConversationHandler.END
 
@@ -119,7 +124,7 @@ async def handle_registration_callback(update: Update, context: ContextTypes.DEF
         return
 
     # Load pending data
-    pending = json_db.get_pending_registration(user_id)
+    pending = await async_db.get_pending_registration(user_id)
     if not pending and action == "ap": # Only matter if approving, if rejecting and already gone, fine
         await query.answer("❌ Request expired or already processed.", show_alert=True)
         await query.edit_message_text(f"{query.message.text}\n\n⚠️ *Expired/Processed*", parse_mode='Markdown')
@@ -129,35 +134,28 @@ async def handle_registration_callback(update: Update, context: ContextTypes.DEF
         full_name = pending["full_name"]
         
         # transform name to teacher ID
-        teacher_id = json_db.generate_teacher_id()
+        teacher_id = await async_db.generate_teacher_id()
         
         # Add to DB
-        success, msg = json_db.add_teacher(teacher_id, full_name, user_id)
+        success, msg = await async_db.add_teacher(teacher_id, full_name, user_id)
         
         if success:
             # Remove from pending
-            json_db.remove_pending_registration(user_id)
-            
-            # Check memberships in all enabled groups
-            groups = json_db.load_groups()
-            assigned_count = 0
+            await async_db.remove_pending_registration(user_id)
             
-            for chat_id_str, g_data in groups.items():
-                if not g_data.get("enabled", True):
-                    continue
-                    
-                try:
-                    # Check if user is member
-                    member = await context.bot.get_chat_member(chat_id=int(chat_id_str), user_id=user_id)
-                    from telegram.constants import ChatMemberStatus
-                    
-                    if member.status in [ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER]:
-                        json_db.toggle_assignment(teacher_id, chat_id_str)
-                        # Ensure it was Added (toggle adds if not present)
-                        assigned_count += 1
-                        
-                except Exception as e:
-                    logger.warning(f"Could not check membership for {user_id} in {chat_id_str}: {e}")
+            # Membership from the roster (chat_member updates); only groups where
+            # this user was never seen are probed (cached; the rate limiter paces misses)
+            groups = await async_db.load_groups()
+            enabled = [chat_id_str for chat_id_str, g_data in groups.items() if g_data.get("enabled", True)]
+            known = await async_db.run_io(membership.known_chats, user_id)
+            unknown = [chat_id_str for chat_id_str in enabled if chat_id_str not in known]
+            checks = await asyncio.gather(*(chat_cache.is_member(context.bot, chat_id_str, user_id) for chat_id_str in unknown))
+            member_of = [chat_id_str for chat_id_str in enabled if known.get(chat_id_str)]
+            member_of += [chat_id_str for chat_id_str, ok in zip(unknown, checks) if ok]
+
+            # One commit for all groups; already-assigned groups stay assigned
+            await async_db.assign_groups(teacher_id, member_of)
+            assigned_count = len(member_of)
 
             # Notify Admin
             status_msg = f"✅ *Approved* by {update.effective_user.first_name}\n"
@@ -184,7 +182,7 @@ async def handle_registration_callback(update: Update, context: ContextTypes.DEF
             await query.answer(f"Error: {msg}", show_alert=True)
             
     elif action == "rj": # Reject
-        json_db.remove_pending_registration(user_id)
+        await async_db.remove_pending_registration(user_id)
         
         await query.edit_message_text(
             f"{query.message.text}\n\n❌ *Rejected* by {update.effective_user.first_name}",
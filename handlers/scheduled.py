@@ -0,0 +1,121 @@
+import logging
+import os
+import shutil
+from datetime import time, timedelta
+from zoneinfo import ZoneInfo
+from telegram.ext import ContextTypes
+from storage import stats_store, async_db, report_cache, export_manager
+from config import ADMIN_IDS, EXPORT_DIR, TZ, PRECOMPUTE_TIME, DIGEST_TIME, WEEKLY_REPORT_DAY
+from handlers.admin import render_report, build_excel_report
+from handlers.pagination import send_pages, send_artifact
+
+logger = logging.getLogger(__name__)
+
+DIGEST_DIR = os.path.join(EXPORT_DIR, "digests")
+
+def _parse_time(value: str) -> time:
+    """Parse HH:MM into a time in the configured timezone."""
+    hour, minute = value.split(":")
+    return time(int(hour), int(minute), tzinfo=ZoneInfo(TZ))
+
+def _write_digest(name: str, pages: list):
+    os.makedirs(DIGEST_DIR, exist_ok=True)
+    with open(os.path.join(DIGEST_DIR, f"{name}.html"), 'w', encoding='utf-8') as f:
+        f.write("\n\n".join(pages))
+
+def _copy_to_digests(path: str, filename: str):
+    os.makedirs(DIGEST_DIR, exist_ok=True)
+    shutil.copyfile(path, os.path.join(DIGEST_DIR, filename))
+
+async def _save_digest(name: str, pages: list):
+    """Keep a copy of every delivered digest under EXPORT_DIR/digests (off the event loop)."""
+    try:
+        await async_db.run_io(_write_digest, name, pages)
+    except Exception as e:
+        logger.error(f"Failed to save digest {name}: {e}")
+
+# ============================================================================
+# JOBS
+# ============================================================================
+
+async def archive_stats():
+    """Fold closed months into archives and apply the retention policy."""
+    try:
+        # Through the storage writer, so no counter commit runs concurrently
+        summary = await async_db.run_write(stats_store.compact_stats)
+    except Exception as e:
+        logger.error(f"Failed to archive stats: {e}")
+        return
+    if any(summary.values()):
+        logger.info(
+            f"Stats retention: archived {summary['archived_days']} days into {summary['archived_months']} months, "
+            f"pruned {summary['pruned_days']} days and {summary['pruned_months']} months"
+        )
+        report_cache.bump_stats_version()
+
+async def precompute_reports(context: ContextTypes.DEFAULT_TYPE):
+    """Archive old stats, pre-aggregate the standard report windows and evict old exports (runs off-peak)."""
+    # Archive first so the pre-aggregates are built from the final layout
+    await archive_stats()
+    for days in stats_store.STANDARD_WINDOWS:
+        try:
+            await async_db.run_io(stats_store.precompute_windows, days)
+        except Exception as e:
+            logger.error(f"Failed to precompute {days}-day window: {e}")
+    try:
+        await async_db.run_io(export_manager.evict)
+    except Exception as e:
+        logger.error(f"Failed to evict exports: {e}")
+
+async def daily_digest(context: ContextTypes.DEFAULT_TYPE):
+    """Send today's teachers report to all admins."""
+    pages = await async_db.run_io(render_report, "t_simple", 1)
+    await _save_digest(f"daily_{stats_store.today_date()}", pages)
+    await send_pages(context.bot, ADMIN_IDS, pages)
+
+async def weekly_summary(context: ContextTypes.DEFAULT_TYPE):
+    """Send this week vs last week for teachers and groups."""
+    pages = await async_db.run_io(render_report, "t_compare", 7)
+    pages += await async_db.run_io(render_report, "g_compare", 7)
+    await _save_digest(f"weekly_{stats_store.today_date()}", pages)
+    await send_pages(context.bot, ADMIN_IDS, pages)
+
+async def monthly_export(context: ContextTypes.DEFAULT_TYPE):
+    """Send the Excel report for the previous calendar month (runs on day 1)."""
+    last_day = stats_store.today_date() - timedelta(days=1)
+    artifact = await async_db.build_export(build_excel_report, last_day.day, end=last_day)
+    if not artifact:
+        await send_pages(context.bot, ADMIN_IDS, [f"📥 No activity in {last_day.strftime('%Y-%m')}."])
+        return
+
+    filename = f"monthly_{last_day.strftime('%Y-%m')}.xlsx"
+    if artifact.path:
+        # Keep a copy that outlives export eviction; on the export worker, after the build
+        try:
+            await async_db.run_export(_copy_to_digests, artifact.path, filename)
+        except Exception as e:
+            logger.error(f"Failed to keep a copy of {filename}: {e}")
+
+    # The first admin gets the upload, the rest the same file_id
+    for admin_id in ADMIN_IDS:
+        try:
+            artifact = await send_artifact(context.bot, admin_id, artifact, filename)
+        except Exception as e:
+            logger.error(f"Failed to send monthly export to admin {admin_id}: {e}")
+
+def register_jobs(application):
+    """Schedule report jobs on the application's JobQueue."""
+    job_queue = application.job_queue
+    if job_queue is None:
+        logger.error("JobQueue not available, scheduled reports disabled")
+        return
+
+    precompute_at = _parse_time(PRECOMPUTE_TIME)
+    digest_at = _parse_time(DIGEST_TIME)
+
+    job_queue.run_daily(precompute_reports, time=precompute_at, name="precompute_reports")
+    # Also warm the pre-aggregates right after a restart
+    job_queue.run_once(precompute_reports, when=10, name="precompute_reports_startup")
+    job_queue.run_daily(daily_digest, time=digest_at, name="daily_digest")
+    job_queue.run_daily(weekly_summary, time=digest_at, days=(WEEKLY_REPORT_DAY,), name="weekly_summary")
+    job_queue.run_monthly(monthly_export, when=digest_at, day=1, name="monthly_export")
@@ -2,10 +2,36 @@ import logging
 from telegram import Update, ChatMemberUpdated
 from telegram.ext import ContextTypes
 from telegram.constants import ChatType, ChatMemberStatus
-from storage import json_db
+from storage import json_db, async_db, registry_cache, message_types
+from handlers import chat_cache, dedupe
+from config import AUTO_ASSIGN_ON_JOIN, AUTO_UNASSIGN_ON_LEAVE, COUNT_EDITED_MESSAGES
 
 logger = logging.getLogger(__name__)
 
+def resolve_tracked_teacher(chat_id_str: str, user_id: int):
+    """Return the teacher_id whose messages count in this chat, or None."""
+    snap = registry_cache.get_snapshot()
+
+    # 1. Check if group is registered and enabled
+    group = snap.group(chat_id_str)
+    if not group or not group.enabled:
+        return None
+    
+    # 2. Check if user is a registered teacher
+    teacher_id = snap.find_teacher_by_telegram_id(user_id)
+    if not teacher_id:
+        return None
+    
+    # 3. Check if teacher is active
+    teacher = snap.teacher(teacher_id)
+    if not teacher or not teacher.active:
+        return None
+    
+    # 4. Check if teacher is assigned to this group
+    if not snap.is_assigned(teacher_id, chat_id_str):
+        return None
+    return teacher_id
+
 async def track_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Track teacher activity in groups SILENTLY.
@@ -14,6 +40,7 @@ async def track_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
     - Group is registered and enabled
     - Sender is a registered and active teacher
     - Teacher is assigned to this group
+    - Message was not counted already (dedupe, album policy)
     
     NO LOGS - completely silent operation.
     """
@@ -24,54 +51,35 @@ async def track_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
         return
     
+    # Edits are not new messages unless configured otherwise
+    edited = update.edited_message is not None
+    if edited and not COUNT_EDITED_MESSAGES:
+        return
+    
     message = update.effective_message
     chat_id = update.effective_chat.id
     chat_id_str = str(chat_id)
     user_id = update.effective_user.id
     
-    # 1. Check if group is registered and enabled
-    group = json_db.get_group(chat_id_str)
-    if not group or not group.get("enabled", True):
-        return
-    
-    # 2. Check if user is a registered teacher
-    teacher_id = json_db.find_teacher_by_telegram_id(user_id)
+    # 1-4. Registered/enabled group, active teacher, assigned (in-memory snapshot, no I/O)
+    teacher_id = resolve_tracked_teacher(chat_id_str, user_id)
     if not teacher_id:
         return
     
-    # 3. Check if teacher is active
-    teacher = json_db.get_teacher(teacher_id)
-    if not teacher or not teacher.get("active", True):
-        return
-    
-    # 4. Check if teacher is assigned to this group
-    if not json_db.is_teacher_assigned(teacher_id, chat_id_str):
-        return
-    
     # 5. Determine message type
-    # We check media first because media messages often have a caption which is technically text
-    msg_type = None
+    msg_type = message_types.classify(message)
     
-    if message.photo:
-        msg_type = "photo"
-    elif message.video or message.video_note:
-        msg_type = "video"
-    elif message.audio:
-        msg_type = "audio"
-    elif message.voice:
-        msg_type = "voice"
-    elif message.document:
-        msg_type = "document"
-    elif message.text:
-        # Check if it's not just a command that somehow passed filters
-        if not message.text.startswith('/'):
-            msg_type = "text"
+    # 6. Count each message (or album, per ALBUM_COUNTING) once, even if the update is replayed
+    if msg_type and not dedupe.should_count(
+        chat_id, message.message_id, message.media_group_id, message.edit_date if edited else None
+    ):
+        return
     
-    # 6. Increment counter SILENTLY
+    # 7. Increment counter SILENTLY
     if msg_type:
         today_str = json_db.get_today_str()
         try:
-            json_db.increment_counter(today_str, chat_id_str, teacher_id, msg_type)
+            async_db.increment_counter(today_str, chat_id_str, teacher_id, msg_type)
             # NO LOGGING - silent operation
         except Exception as e:
             # Only log errors
@@ -91,11 +99,52 @@ async def handle_my_chat_member(update: Update, context: ContextTypes.DEFAULT_TY
     
     # If the bot was removed (left or kicked)
     if new_status in [ChatMemberStatus.LEFT, ChatMemberStatus.KICKED]:
-        json_db.deactivate_group(chat_id_str)
-        json_db.remove_group_from_assignments(chat_id_str)
+        chat_cache.forget_chat(chat.id)
+        await async_db.deactivate_group(chat_id_str)
+        await async_db.remove_group_from_assignments(chat_id_str)
+        await async_db.forget_group_membership(chat_id_str)
         logger.info(f"BOT_REMOVED_FROM_GROUP {chat_id_str} ({chat_title})")
         
     # If the bot was added (member or admin)
     elif new_status in [ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR]:
+        chat_cache.remember(result)
         # Log as requested
         logger.info(f"BOT_ADDED_TO_GROUP {chat_id_str} ({chat_title})")
+
+async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Follow users joining and leaving groups: keep the membership cache and
+    roster current, and assign/unassign registered teachers in tracked groups.
+    """
+    result = update.chat_member
+    if not result:
+        return
+    chat_cache.remember(result)
+
+    was_member = chat_cache.is_active(result.old_chat_member)
+    is_member = chat_cache.is_active(result.new_chat_member)
+    if was_member == is_member:
+        return  # role change only
+
+    user = result.new_chat_member.user
+    if user.is_bot:
+        return
+    chat_id_str = str(result.chat.id)
+    await async_db.record_membership(chat_id_str, user.id, is_member)
+
+    snap = registry_cache.get_snapshot()
+    # Same rule as counting and registration approval: only enabled groups
+    group = snap.group(chat_id_str)
+    if not group or not group.enabled:
+        return
+    teacher_id = snap.find_teacher_by_telegram_id(user.id)
+    if not teacher_id:
+        return
+
+    assigned = snap.is_assigned(teacher_id, chat_id_str)
+    if is_member and AUTO_ASSIGN_ON_JOIN and not assigned:
+        await async_db.set_assignment(teacher_id, chat_id_str, True)
+        logger.info(f"AUTO_ASSIGN {teacher_id} -> {chat_id_str}")
+    elif not is_member and AUTO_UNASSIGN_ON_LEAVE and assigned:
+        await async_db.set_assignment(teacher_id, chat_id_str, False)
+        logger.info(f"AUTO_UNASSIGN {teacher_id} -x {chat_id_str}")
@@ -0,0 +1,216 @@
+"""
+Rebuild stats from a Telegram Desktop chat export (JSON format).
+
+    python import_history.py result.json [--chat-id ID] [--from YYYY-MM-DD] [--to YYYY-MM-DD] [--dry-run]
+
+Counts the messages of registered teachers exactly as track_activity would
+(group registered and enabled, teacher active and assigned, same message
+types) and adds them to the stats store, dated in the configured TZ. The
+export is streamed one message at a time, so memory use does not grow with
+its size; counts are merged in batches.
+
+Use --from/--to to import only the period the bot was not counting, so
+live counts are not added twice. The chat id is read from the export
+(supergroups get the -100 prefix); pass --chat-id if the group is
+registered under a different id.
+
+Counts always go to the shared day files under the stats lock, never to a
+worker shard (even with WORKER_ID set), so the import can run next to live
+workers. A running bot picks the new counts up after REPORT_CACHE_TTL;
+restart it to see them at once.
+"""
+import argparse
+import json
+import sys
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from config import TZ, WRITE_BATCH_SIZE
+from storage import stats_store, registry_cache, message_types
+from handlers.tracking import resolve_tracked_teacher
+
+CHUNK_SIZE = 1 << 20
+_WHITESPACE = " \t\r\n"
+
+local_tz = ZoneInfo(TZ)
+
+# ============================================================================
+# STREAMING PARSER
+# ============================================================================
+
+class _Stream:
+    """Incremental reader for a top-level JSON object with one large array."""
+
+    def __init__(self, f):
+        self._f = f
+        self._buf = ""
+        self._pos = 0
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        chunk = self._f.read(CHUNK_SIZE)
+        if not chunk:
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character ("" at end of file)."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in export, got {self.peek()!r}")
+        self._pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value, reading more input as needed."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self._buf) and not isinstance(value, (dict, list, str)) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+def iter_export(f, header: dict):
+    """
+    Yield the messages of a single-chat export one by one. Other top-level
+    fields (name, type, id) are stored in `header` as they are read.
+    """
+    stream = _Stream(f)
+    stream.expect("{")
+    while stream.peek() != "}":
+        key = stream.value()
+        stream.expect(":")
+        if key == "messages":
+            stream.expect("[")
+            while stream.peek() != "]":
+                yield stream.value()
+                if stream.peek() == ",":
+                    stream.expect(",")
+            stream.expect("]")
+        else:
+            header[key] = stream.value()
+        if stream.peek() == ",":
+            stream.expect(",")
+
+# ============================================================================
+# MAPPING
+# ============================================================================
+
+def export_chat_id(header: dict) -> str:
+    """Bot API chat id for the exported chat."""
+    chat_id = int(header["id"])
+    if header.get("type", "").endswith(("supergroup", "channel")):
+        return f"-100{chat_id}"
+    return str(-chat_id)
+
+def sender_id(entry: dict):
+    """Telegram user id from "from_id" ("user123456"), or None for channels/anonymous admins."""
+    from_id = entry.get("from_id") or ""
+    if not from_id.startswith("user"):
+        return None
+    try:
+        return int(from_id[4:])
+    except ValueError:
+        return None
+
+def local_date(entry: dict) -> str:
+    """Message date in TZ. Old exports without date_unixtime keep their local time as is."""
+    if entry.get("date_unixtime"):
+        return datetime.fromtimestamp(int(entry["date_unixtime"]), local_tz).strftime("%Y-%m-%d")
+    return entry["date"][:10]
+
+# ============================================================================
+# IMPORT
+# ============================================================================
+
+def import_export(path: str, chat_id_str: str = None, date_from: str = None, date_to: str = None,
+                  dry_run: bool = False, batch_size: int = WRITE_BATCH_SIZE * 20) -> dict:
+    summary = {"messages": 0, "counted": 0, "skipped": 0, "days": set(), "chat_id": chat_id_str}
+    deltas = {}
+    pending = 0
+
+    def flush():
+        nonlocal deltas, pending
+        if deltas and not dry_run:
+            stats_store.merge_days(deltas, shared=True)
+        deltas = {}
+        pending = 0
+
+    registry_cache.refresh()
+    header = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for entry in iter_export(f, header):
+            summary["messages"] += 1
+            if chat_id_str is None:
+                if "id" not in header:
+                    raise ValueError("Export has no chat id before its messages; pass --chat-id")
+                chat_id_str = summary["chat_id"] = export_chat_id(header)
+
+            msg_type = message_types.classify_export(entry)
+            user_id = sender_id(entry)
+            date_str = local_date(entry) if msg_type else None
+            if (
+                not msg_type or user_id is None
+                or (date_from and date_str < date_from) or (date_to and date_str > date_to)
+            ):
+                summary["skipped"] += 1
+                continue
+
+            teacher_id = resolve_tracked_teacher(chat_id_str, user_id)
+            if not teacher_id:
+                summary["skipped"] += 1
+                continue
+
+            counts = deltas.setdefault(date_str, {}).setdefault(chat_id_str, {}).setdefault(teacher_id, {})
+            counts[msg_type] = counts.get(msg_type, 0) + 1
+            summary["counted"] += 1
+            summary["days"].add(date_str)
+            pending += 1
+            if pending >= batch_size:
+                flush()
+    flush()
+
+    if summary["counted"] and not dry_run:
+        for days in stats_store.STANDARD_WINDOWS:
+            stats_store.precompute_windows(days)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a Telegram Desktop JSON chat export into the stats.")
+    parser.add_argument("export", help="path to result.json")
+    parser.add_argument("--chat-id", help="registered chat id (default: derived from the export)")
+    parser.add_argument("--from", dest="date_from", help="first date to import (YYYY-MM-DD, in TZ)")
+    parser.add_argument("--to", dest="date_to", help="last date to import (YYYY-MM-DD, in TZ)")
+    parser.add_argument("--dry-run", action="store_true", help="count only, do not write")
+    args = parser.parse_args()
+
+    print(f"🔄 Importing {args.export}...")
+    try:
+        summary = import_export(args.export, args.chat_id, args.date_from, args.date_to, args.dry_run)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"❌ Import failed: {e}")
+        sys.exit(1)
+
+    days = sorted(summary["days"])
+    span = f" ({days[0]} .. {days[-1]})" if days else ""
+    print(f"Chat {summary['chat_id']}: {summary['messages']} messages read, "
+          f"{summary['skipped']} skipped, {summary['counted']} counted on {len(days)} days{span}")
+    print("ℹ️ Dry run, nothing written." if args.dry_run else "✅ Stats updated.")
+
+if __name__ == "__main__":
+    main()
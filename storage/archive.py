@@ -0,0 +1,167 @@
+"""
+Monthly stats archives.
+
+One file per closed month (stats/archive/YYYY-MM.stats) holding every day
+of that month as a separately compressed JSON member, followed by a JSON
+index of date -> (offset, length) and a fixed footer. The index also records
+the day files that were folded in (size and mtime), so a day file left
+behind by an interrupted compaction is recognised and not counted twice. Reading one day seeks
+to its member and decompresses only that, so archived months stay
+queryable without unpacking the whole file.
+"""
+import gzip
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+from config import STATS_DIR, ARCHIVE_COMPRESSION
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.path.join(STATS_DIR, "archive")
+ARCHIVE_SUFFIX = ".stats"
+_MAGIC = b"TSA1"
+_FOOTER = struct.Struct("<Q4s")  # index offset, magic
+
+# ============================================================================
+# CODECS
+# ============================================================================
+
+def _codec(name: str):
+    if name == "zstd":
+        if zstandard is None:
+            raise RuntimeError("ARCHIVE_COMPRESSION=zstd requires the 'zstandard' package")
+        return zstandard.ZstdCompressor(level=10).compress, zstandard.ZstdDecompressor().decompress
+    if name == "gzip":
+        return (lambda data: gzip.compress(data, compresslevel=9)), gzip.decompress
+    return (lambda data: data), (lambda data: data)
+
+def default_codec() -> str:
+    """Configured codec, falling back to gzip when zstandard is missing."""
+    if ARCHIVE_COMPRESSION == "zstd" and zstandard is None:
+        logger.warning("zstandard not installed, archiving with gzip")
+        return "gzip"
+    return ARCHIVE_COMPRESSION if ARCHIVE_COMPRESSION in ("zstd", "gzip", "none") else "gzip"
+
+# ============================================================================
+# WRITE
+# ============================================================================
+
+def archive_path(month: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"{month}{ARCHIVE_SUFFIX}")
+
+def write_archive(month: str, days: dict, codec: str = None, folded: dict = None):
+    """
+    Write (or replace) the archive for `month` from date -> day counters.
+    `folded` is date -> {path relative to STATS_DIR: [size, mtime_ns]} of the
+    day files merged into this version.
+    """
+    codec = codec or default_codec()
+    compress, _ = _codec(codec)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = archive_path(month)
+    tmp_path = f"{path}.tmp"
+
+    index = {}
+    with open(tmp_path, 'wb') as f:
+        for date_str in sorted(days):
+            member = compress(json.dumps(days[date_str], ensure_ascii=False).encode('utf-8'))
+            index[date_str] = [f.tell(), len(member)]
+            f.write(member)
+        index_offset = f.tell()
+        f.write(json.dumps({"codec": codec, "days": index, "folded": folded or {}}).encode('utf-8'))
+        f.write(_FOOTER.pack(index_offset, _MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    with _index_lock:
+        _indexes.pop(month, None)
+
+# ============================================================================
+# READ
+# ============================================================================
+
+# month -> ((mtime_ns, size), index dict); archives change only on compaction
+_indexes = {}
+_index_lock = threading.Lock()
+
+def _load_index(month: str):
+    path = archive_path(month)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    with _index_lock:
+        cached = _indexes.get(month)
+        if cached and cached[0] == key:
+            return cached[1]
+
+    try:
+        with open(path, 'rb') as f:
+            f.seek(-_FOOTER.size, os.SEEK_END)
+            index_offset, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+            if magic != _MAGIC:
+                raise ValueError("bad archive footer")
+            f.seek(index_offset)
+            index = json.loads(f.read(st.st_size - _FOOTER.size - index_offset))
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to read archive index {path}: {e}")
+        return None
+
+    with _index_lock:
+        _indexes[month] = (key, index)
+    return index
+
+def archived_dates(month: str) -> list:
+    index = _load_index(month)
+    return sorted(index["days"]) if index else []
+
+def read_day(date_str: str) -> dict:
+    """One archived day, or {} if its month (or the day) is not archived."""
+    month = date_str[:7]
+    index = _load_index(month)
+    if not index or date_str not in index["days"]:
+        return {}
+    offset, length = index["days"][date_str]
+    _, decompress = _codec(index["codec"])
+    try:
+        with open(archive_path(month), 'rb') as f:
+            f.seek(offset)
+            return json.loads(decompress(f.read(length)))
+    except (OSError, ValueError, RuntimeError, EOFError, zlib.error) as e:
+        logger.error(f"Failed to read {date_str} from archive: {e}")
+        return {}
+
+def folded(date_str: str) -> dict:
+    """Day files already merged into the archived day: relative path -> [size, mtime_ns]."""
+    index = _load_index(date_str[:7])
+    if not index:
+        return {}
+    return index.get("folded", {}).get(date_str, {})
+
+def read_month(month: str) -> dict:
+    """All archived days of a month: date -> day counters."""
+    return {date_str: read_day(date_str) for date_str in archived_dates(month)}
+
+def list_months() -> list:
+    try:
+        names = os.listdir(ARCHIVE_DIR)
+    except OSError:
+        return []
+    return sorted(n[:-len(ARCHIVE_SUFFIX)] for n in names if n.endswith(ARCHIVE_SUFFIX))
+
+def delete_month(month: str):
+    try:
+        os.remove(archive_path(month))
+    except FileNotFoundError:
+        pass
+    with _index_lock:
+        _indexes.pop(month, None)
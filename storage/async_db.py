@@ -0,0 +1,162 @@
+"""
+Awaitable versions of the json_db functions used by async handlers.
+
+Blocking file I/O and filelock waits run on dedicated threads instead of the
+event loop. Reads share a small pool; every write goes through the single
+storage writer (storage/writer.py), which batches and orders them. Write
+helpers also refresh the search index.
+"""
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from config import STORAGE_READ_WORKERS
+from storage import json_db, stats_store, search_index, writer, membership
+from storage.writer import Increment, SetAssignment, Call
+
+logger = logging.getLogger(__name__)
+
+_read_executor = ThreadPoolExecutor(max_workers=STORAGE_READ_WORKERS, thread_name_prefix="storage-read")
+# Big exports get their own thread so they never hold up report reads
+_export_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+
+async def run_io(func, *args, **kwargs):
+    """Run any blocking storage/report function on the read pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_read_executor, functools.partial(func, *args, **kwargs))
+
+def schedule_io(func, *args, **kwargs):
+    """Start a blocking function on the read pool without waiting for it (from the event loop)."""
+    return asyncio.get_running_loop().run_in_executor(_read_executor, functools.partial(func, *args, **kwargs))
+
+async def run_export(func, *args, **kwargs):
+    """Run an export builder on the export worker (one at a time)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_export_executor, functools.partial(func, *args, **kwargs))
+
+async def build_export(func, *args, **kwargs):
+    """
+    run_export() for export_manager builders. If the artifact's file vanished
+    before it could be sent (and there is no file_id to fall back on), it is
+    built once more.
+    """
+    artifact = await run_export(func, *args, **kwargs)
+    if artifact and not artifact.file_id and not os.path.exists(artifact.path):
+        artifact = await run_export(func, *args, **kwargs)
+    return artifact
+
+async def run_write(func, *args, **kwargs):
+    """Run a blocking mutation through the storage writer."""
+    return await writer.get_writer().submit(Call(functools.partial(func, *args, **kwargs), (), False))
+
+def _reader(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_io(func, *args, **kwargs)
+    return wrapper
+
+# ============================================================================
+# READS
+# ============================================================================
+
+load_teachers = _reader(json_db.load_teachers)
+load_groups = _reader(json_db.load_groups)
+load_teacher_groups = _reader(json_db.load_teacher_groups)
+get_teacher = _reader(json_db.get_teacher)
+get_group = _reader(json_db.get_group)
+get_teacher_groups = _reader(json_db.get_teacher_groups)
+is_teacher_assigned = _reader(json_db.is_teacher_assigned)
+find_teacher_by_telegram_id = _reader(json_db.find_teacher_by_telegram_id)
+get_teacher_stats_summary = _reader(stats_store.teacher_summary)
+get_pending_registration = _reader(json_db.get_pending_registration)
+load_pending_registrations = _reader(json_db.load_pending_registrations)
+generate_teacher_id = _reader(json_db.generate_teacher_id)
+get_diagnostics = _reader(json_db.get_diagnostics)
+aggregate_stats = _reader(stats_store.aggregate_stats)
+aggregate_windows = _reader(stats_store.aggregate_windows)
+
+# ============================================================================
+# WRITES
+# ============================================================================
+
+def _consume_exception(future):
+    # The writer logs failed commits; callers that don't await must not leave
+    # "exception was never retrieved" behind
+    if not future.cancelled():
+        future.exception()
+
+def increment_counter(date_str: str, chat_id_str: str, teacher_id: str, msg_type: str):
+    """
+    Queue one increment; it is committed with the next batch. Returns the
+    future, which fails if that commit fails (the count is retried later).
+    """
+    future = writer.get_writer().submit(Increment(date_str, chat_id_str, teacher_id, msg_type))
+    future.add_done_callback(_consume_exception)
+    return future
+
+async def _registry_write(func, *args):
+    return await writer.get_writer().submit(Call(func, args, True))
+
+async def add_teacher(teacher_id: str, full_name: str, telegram_user_id: int):
+    result = await _registry_write(json_db.add_teacher, teacher_id, full_name, telegram_user_id)
+    await run_io(search_index.index_teacher, teacher_id)
+    return result
+
+async def update_teacher_name(teacher_id: str, new_name: str):
+    result = await _registry_write(json_db.update_teacher_name, teacher_id, new_name)
+    await run_io(search_index.index_teacher, teacher_id)
+    return result
+
+async def delete_teacher(teacher_id: str):
+    result = await _registry_write(json_db.delete_teacher, teacher_id)
+    await run_io(search_index.index_teacher, teacher_id)
+    return result
+
+async def add_group(chat_id: int, title: str):
+    result = await _registry_write(json_db.add_group, chat_id, title)
+    await run_io(search_index.index_group, str(chat_id))
+    return result
+
+async def update_group_title(chat_id_str: str, new_title: str):
+    result = await _registry_write(json_db.update_group_title, chat_id_str, new_title)
+    await run_io(search_index.index_group, chat_id_str)
+    return result
+
+async def delete_group(chat_id_str: str):
+    result = await _registry_write(json_db.delete_group, chat_id_str)
+    await run_io(search_index.index_group, chat_id_str)
+    return result
+
+async def toggle_group_enabled(chat_id_str: str):
+    return await _registry_write(json_db.toggle_group_enabled, chat_id_str)
+
+async def toggle_assignment(teacher_id: str, chat_id_str: str):
+    return await writer.get_writer().submit(SetAssignment(teacher_id, chat_id_str, None))
+
+async def assign_groups(teacher_id: str, chat_ids: list):
+    """Assign a teacher to several groups in one commit (no-op where already assigned)."""
+    w = writer.get_writer()
+    futures = [w.submit(SetAssignment(teacher_id, chat_id_str, True)) for chat_id_str in chat_ids]
+    return await asyncio.gather(*futures)
+
+async def set_assignment(teacher_id: str, chat_id_str: str, assigned: bool):
+    return await writer.get_writer().submit(SetAssignment(teacher_id, chat_id_str, assigned))
+
+async def deactivate_group(chat_id_str: str):
+    return await _registry_write(json_db.deactivate_group, chat_id_str)
+
+async def remove_group_from_assignments(chat_id_str: str):
+    return await _registry_write(json_db.remove_group_from_assignments, chat_id_str)
+
+async def record_membership(chat_id_str: str, user_id: int, is_member: bool):
+    return await run_write(membership.record, chat_id_str, user_id, is_member)
+
+async def forget_group_membership(chat_id_str: str):
+    return await run_write(membership.forget_chat, chat_id_str)
+
+async def add_pending_registration(telegram_id: int, full_name: str):
+    return await run_write(json_db.add_pending_registration, telegram_id, full_name)
+
+async def remove_pending_registration(telegram_id: int):
+    return await run_write(json_db.remove_pending_registration, telegram_id)
@@ -0,0 +1,186 @@
+"""
+Export artifacts in EXPORT_DIR: content-addressed, reused, evicted.
+
+An artifact is named after a hash of its parameters and a fingerprint of
+the data it was built from (stats files of its dates, registry files), so
+an identical request at unchanged data finds the existing file instead of
+building a new one. The manifest (EXPORT_DIR/exports.json) also keeps the
+Telegram file_id of every uploaded artifact: resending it costs no upload,
+and still works after the local file has been evicted.
+
+Eviction drops least recently used files beyond EXPORT_MAX_MB and anything
+(files and manifest entries) unused for EXPORT_MAX_AGE_DAYS. Files used in
+the last IN_USE_SECONDS are never evicted: they may be on their way to a
+chat, and a single export larger than the cap must survive until it is
+sent. Files written before the manager existed (report_*.xlsx and the like)
+age out the same way.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+from config import EXPORT_DIR, EXPORT_MAX_MB, EXPORT_MAX_AGE_DAYS
+from storage import stats_store, registry_cache, report_cache
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = os.path.join(EXPORT_DIR, "exports.json")
+
+# path is None when only the file_id is left (file evicted)
+Artifact = namedtuple("Artifact", "key path file_id")
+
+# Without files to fingerprint (Redis backend) artifacts are reused only
+# within this process, at the same in-memory data version
+_BOOT_ID = uuid.uuid4().hex
+
+# Grace period between handing out an artifact and sending it
+IN_USE_SECONDS = 900
+
+_lock = threading.Lock()
+
+# ============================================================================
+# MANIFEST
+# ============================================================================
+
+def _load() -> dict:
+    try:
+        with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to read {MANIFEST_FILE}: {e}")
+        return {}
+
+def _save(manifest: dict):
+    tmp_path = f"{MANIFEST_FILE}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, MANIFEST_FILE)
+
+def artifact_key(kind: str, params: tuple, dates: list) -> str:
+    """Hash of the request and of the data behind it."""
+    data = stats_store.fingerprint(dates)
+    if data is None:
+        data = (_BOOT_ID, report_cache.data_version())
+    raw = repr((kind, params, data, registry_cache.registry_mtimes()))
+    return f"{kind}_{hashlib.sha256(raw.encode('utf-8')).hexdigest()[:24]}"
+
+# ============================================================================
+# BUILD / REUSE
+# ============================================================================
+
+def get_or_build(kind: str, params: tuple, dates: list, build, ext: str):
+    """
+    Return the Artifact for this request, calling `build(path)` only when
+    neither the file nor a file_id exists. `build` returns False/None when
+    there is nothing to export, in which case None is returned.
+    """
+    key = artifact_key(kind, params, dates)
+    path = os.path.join(EXPORT_DIR, f"{key}.{ext}")
+
+    with _lock:
+        manifest = _load()
+        entry = manifest.get(key)
+        if entry is not None and (entry.get("file_id") or os.path.exists(path)):
+            entry["last_used"] = time.time()
+            _save(manifest)
+            return Artifact(key, path if os.path.exists(path) else None, entry.get("file_id"))
+
+    tmp_path = f"{path}.tmp"
+    try:
+        if not build(tmp_path):
+            return None
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    with _lock:
+        manifest = _load()
+        now = time.time()
+        manifest[key] = {"kind": kind, "file": os.path.basename(path), "file_id": None,
+                         "created": now, "last_used": now}
+        _save(manifest)
+    evict()
+    return Artifact(key, path, None)
+
+def record_file_id(key: str, file_id: str):
+    """Remember the Telegram file_id of an uploaded artifact."""
+    with _lock:
+        manifest = _load()
+        if key in manifest:
+            manifest[key]["file_id"] = file_id
+            _save(manifest)
+
+def forget_file_id(key: str):
+    """Drop a file_id Telegram no longer accepts."""
+    record_file_id(key, None)
+
+# ============================================================================
+# EVICTION
+# ============================================================================
+
+def evict(max_bytes: int = EXPORT_MAX_MB * 1024 * 1024, max_age_days: float = EXPORT_MAX_AGE_DAYS) -> dict:
+    """Apply the age and size limits; returns counts for logging."""
+    summary = {"files": 0, "bytes": 0, "entries": 0}
+    now = time.time()
+    max_age = max_age_days * 86400 if max_age_days > 0 else None
+
+    with _lock:
+        manifest = _load()
+        managed = {entry["file"]: key for key, entry in manifest.items()}
+
+        # Top-level files only; precomputed/ and digests/ are managed elsewhere
+        files = []
+        for name in os.listdir(EXPORT_DIR):
+            path = os.path.join(EXPORT_DIR, name)
+            if path == MANIFEST_FILE or name.endswith(".tmp") or not os.path.isfile(path):
+                continue
+            st = os.stat(path)
+            key = managed.get(name)
+            last_used = manifest[key]["last_used"] if key else st.st_mtime
+            files.append((last_used, name, st.st_size))
+
+        def remove(name, size):
+            os.remove(os.path.join(EXPORT_DIR, name))
+            summary["files"] += 1
+            summary["bytes"] += size
+
+        files.sort()
+        total = sum(size for _, _, size in files)
+        for last_used, name, size in files:
+            if now - last_used < IN_USE_SECONDS:
+                continue
+            if (max_age and now - last_used > max_age) or (max_bytes > 0 and total > max_bytes):
+                remove(name, size)
+                total -= size
+
+        if max_age:
+            for key in [k for k, e in manifest.items() if now - e["last_used"] > max_age]:
+                del manifest[key]
+                summary["entries"] += 1
+        _save(manifest)
+
+    if summary["files"] or summary["entries"]:
+        logger.info(
+            f"Export eviction: removed {summary['files']} files ({summary['bytes'] // 1024} KB), "
+            f"{summary['entries']} manifest entries"
+        )
+    return summary
+
+def get_export_stats() -> dict:
+    """Counters for diagnostics."""
+    with _lock:
+        manifest = _load()
+    files = [e for e in manifest.values() if os.path.exists(os.path.join(EXPORT_DIR, e["file"]))]
+    return {
+        "artifacts": len(manifest),
+        "files": len(files),
+        "bytes": sum(os.path.getsize(os.path.join(EXPORT_DIR, e["file"])) for e in files),
+        "file_ids": sum(1 for e in manifest.values() if e.get("file_id")),
+    }
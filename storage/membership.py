@@ -0,0 +1,150 @@
+"""
+Membership roster built from chat_member updates.
+
+The Bot API cannot list a group's members, but a bot with admin rights is
+told about every join and leave. Each observed change is recorded here as
+user_id -> chat_id -> [is_member, timestamp], so registration approval can
+look membership up instead of probing every group with get_chat_member.
+Users the bot has never seen change membership in a group (e.g. they joined
+before the bot was promoted) are simply not in the roster for that group.
+
+Like the dedupe keys and counter shards, every worker keeps its own file
+(DATA_DIR/membership[.WORKER_ID].json) and readers merge all of them, the
+newest observation winning. Changes are kept in memory and written once per
+storage writer batch (see flush), not once per update.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from config import DATA_DIR, WORKER_ID
+
+logger = logging.getLogger(__name__)
+
+MEMBERSHIP_FILE = os.path.join(DATA_DIR, f"membership{'.' + WORKER_ID if WORKER_ID else ''}.json")
+
+_lock = threading.Lock()
+_own = None     # this worker's part: {"users": {user: {chat: [is_member, ts]}}, "forgotten": {chat: ts}}
+_dirty = False
+_others = {}    # path -> ((mtime_ns, size), part) for the other workers' files
+
+def _parse(data: dict) -> dict:
+    if "users" not in data:
+        # Single-file format from before the per-worker split: user -> chat -> bool
+        return {"users": {u: {c: [m, 0] for c, m in chats.items()} for u, chats in data.items()}, "forgotten": {}}
+    return {"users": data.get("users", {}), "forgotten": data.get("forgotten", {})}
+
+def _read(path: str) -> dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return _parse(json.load(f))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to read {path}: {e}")
+    return {"users": {}, "forgotten": {}}
+
+def _own_part() -> dict:
+    global _own
+    if _own is None:
+        _own = _read(MEMBERSHIP_FILE)
+    return _own
+
+def _other_parts() -> list:
+    """The other workers' parts, re-read only when their file changed."""
+    parts = []
+    try:
+        names = os.listdir(DATA_DIR)
+    except OSError:
+        return parts
+    for name in sorted(names):
+        path = os.path.join(DATA_DIR, name)
+        if not (name.startswith("membership") and name.endswith(".json")) or path == MEMBERSHIP_FILE:
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        key = (st.st_mtime_ns, st.st_size)
+        cached = _others.get(path)
+        if cached is None or cached[0] != key:
+            cached = _others[path] = (key, _read(path))
+        parts.append(cached[1])
+    return parts
+
+# ============================================================================
+# READS
+# ============================================================================
+
+def known_chats(user_id: int) -> dict:
+    """chat_id str -> is_member for every group where this user was seen (by any worker)."""
+    user = str(user_id)
+    with _lock:
+        parts = [_own_part()] + _other_parts()
+        forgotten = {}
+        for part in parts:
+            for chat_id_str, ts in part["forgotten"].items():
+                forgotten[chat_id_str] = max(ts, forgotten.get(chat_id_str, ts))
+        latest = {}
+        for part in parts:
+            for chat_id_str, (is_member, ts) in part["users"].get(user, {}).items():
+                if chat_id_str in forgotten and ts <= forgotten[chat_id_str]:
+                    continue
+                if chat_id_str not in latest or ts > latest[chat_id_str][1]:
+                    latest[chat_id_str] = (is_member, ts)
+    return {chat_id_str: is_member for chat_id_str, (is_member, _) in latest.items()}
+
+# ============================================================================
+# WRITES (run on the storage writer)
+# ============================================================================
+
+def record(chat_id_str: str, user_id: int, is_member: bool) -> bool:
+    """Record a membership change; returns False if it was already known."""
+    global _dirty
+    with _lock:
+        chats = _own_part()["users"].setdefault(str(user_id), {})
+        if chats.get(chat_id_str, [None])[0] == is_member:
+            return False
+        chats[chat_id_str] = [is_member, time.time()]
+        _dirty = True
+    return True
+
+def forget_chat(chat_id_str: str) -> int:
+    """Drop a group from the roster (the bot left it); returns this worker's entries removed."""
+    global _dirty
+    with _lock:
+        part = _own_part()
+        removed = 0
+        for user_id in list(part["users"]):
+            if part["users"][user_id].pop(chat_id_str, None) is not None:
+                removed += 1
+                if not part["users"][user_id]:
+                    del part["users"][user_id]
+        # Hides the other workers' older entries for this chat too
+        part["forgotten"][chat_id_str] = time.time()
+        _dirty = True
+    return removed
+
+def flush():
+    """Write this worker's part if it changed (the storage writer calls this after each batch)."""
+    global _dirty
+    with _lock:
+        if not _dirty:
+            return
+        snapshot = {
+            "users": {u: {c: list(e) for c, e in chats.items()} for u, chats in _own["users"].items()},
+            "forgotten": dict(_own["forgotten"]),
+        }
+        _dirty = False
+    tmp_path = f"{MEMBERSHIP_FILE}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, MEMBERSHIP_FILE)
+    except OSError:
+        with _lock:
+            _dirty = True  # retried after the next batch
+        raise
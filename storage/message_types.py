@@ -0,0 +1,125 @@
+"""
+Message type schema: the single definition of what gets counted and how.
+
+Each type names the Message attributes that identify it live and the
+fields that identify it in a Telegram Desktop export, plus its icon and
+column label. The counter layout (MESSAGE_TYPES), the classifiers and the
+report formatting are all derived from TYPES, so adding a type is one
+entry here (and, for the optional ones, one name in EXTRA_MESSAGE_TYPES).
+TYPE_WEIGHTS sets how much each type adds to the activity score.
+
+Day files and Redis store counts by type name, so enabling a type later
+needs no migration; older days simply have no count for it.
+"""
+import logging
+from collections import namedtuple
+from config import EXTRA_MESSAGE_TYPES, TYPE_WEIGHTS
+
+logger = logging.getLogger(__name__)
+
+# attrs: live Message attributes; export_media / export_keys: export
+# "media_type" values and top-level keys; fallback: what the message counts
+# as while the type is disabled (an animation also carries a document).
+MessageType = namedtuple("MessageType", "name icon label attrs export_media export_keys fallback")
+
+# Classification order: the first matching type wins. Media comes before
+# text because media messages often have a caption which is technically text.
+TYPES = (
+    MessageType("animation", "🎞", "Animation", ("animation",), ("animation",), (), "document"),
+    MessageType("sticker", "🏷", "Sticker", ("sticker",), ("sticker",), (), None),
+    MessageType("photo", "📸", "Photo", ("photo",), (), ("photo",), None),
+    MessageType("video", "🎥", "Video", ("video", "video_note"), ("video_file", "video_message"), (), None),
+    MessageType("audio", "🎵", "Audio", ("audio",), ("audio_file",), (), None),
+    MessageType("voice", "🎤", "Voice", ("voice",), ("voice_message",), (), None),
+    MessageType("document", "📎", "Document", ("document",), (), ("file",), None),
+    MessageType("poll", "📊", "Poll", ("poll",), (), ("poll",), None),
+    MessageType("location", "🗺", "Location", ("location", "venue"), (), ("location_information",), None),
+    MessageType("text", "📝", "Text", ("text",), (), (), None),
+)
+
+CORE_TYPES = ("text", "photo", "video", "audio", "voice", "document")
+OPTIONAL_TYPES = tuple(t.name for t in TYPES if t.name not in CORE_TYPES)
+
+_BY_NAME = {t.name: t for t in TYPES}
+_ENABLED = set(CORE_TYPES) | {name for name in EXTRA_MESSAGE_TYPES if name in OPTIONAL_TYPES}
+
+# Counter layout: core types first (fixed positions), then enabled extras
+MESSAGE_TYPES = CORE_TYPES + tuple(name for name in OPTIONAL_TYPES if name in _ENABLED)
+
+def get_type(name: str) -> MessageType:
+    return _BY_NAME[name]
+
+def _parse_weights(spec: str) -> dict:
+    """Parse "video=3,voice=2" into {type: weight}; bad entries are logged and skipped."""
+    weights = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        name = name.strip().lower()
+        try:
+            if name not in _BY_NAME:
+                raise ValueError(f"unknown type {name!r}")
+            weights[name] = float(value)
+        except ValueError as e:
+            logger.warning(f"Ignoring TYPE_WEIGHTS entry {item.strip()!r}: {e}")
+    return weights
+
+_weights = _parse_weights(TYPE_WEIGHTS)
+
+# Score weight per counter slot (MESSAGE_TYPES order); unlisted types weigh 1
+WEIGHTS = tuple(_weights.get(name, 1.0) for name in MESSAGE_TYPES)
+
+# ============================================================================
+# DISPATCH TABLES (built once at import)
+# ============================================================================
+
+# (attribute, type) in classification order; text is handled separately
+_LIVE_TABLE = tuple(
+    (attr, t.name)
+    for t in TYPES if t.name in _ENABLED and t.name != "text"
+    for attr in t.attrs
+)
+
+def _resolve(t: MessageType):
+    """Counted type for a schema entry: itself if enabled, else its fallback."""
+    return t.name if t.name in _ENABLED else t.fallback
+
+_EXPORT_MEDIA = {media: _resolve(t) for t in TYPES for media in t.export_media}
+_EXPORT_KEYS = tuple((key, _resolve(t)) for t in TYPES for key in t.export_keys)
+
+# ============================================================================
+# CLASSIFIERS
+# ============================================================================
+
+def classify(message):
+    """Counter type for a live Message, or None if it is not counted."""
+    for attr, name in _LIVE_TABLE:
+        if getattr(message, attr, None):
+            return name
+    # Check if it's not just a command that somehow passed filters
+    text = message.text
+    if text and not text.startswith('/'):
+        return "text"
+    return None
+
+def _export_text(text) -> str:
+    """Exports store formatted text as a list of strings and entity dicts."""
+    if isinstance(text, list):
+        return "".join(part if isinstance(part, str) else part.get("text", "") for part in text)
+    return text or ""
+
+def classify_export(entry: dict):
+    """Counter type for one message of a Telegram Desktop JSON export, or None."""
+    if entry.get("type") != "message":
+        return None  # joins, pins and other service messages
+    media_type = entry.get("media_type")
+    if media_type in _EXPORT_MEDIA:
+        return _EXPORT_MEDIA[media_type]
+    for key, name in _EXPORT_KEYS:
+        if key in entry:
+            return name
+    text = _export_text(entry.get("text"))
+    if text and not text.startswith('/'):
+        return "text"
+    return None
@@ -0,0 +1,112 @@
+"""
+Raw per-(date, chat, teacher) exports for BI tools.
+
+Rows are produced day by day from the stats store and written as they
+come: gzip CSV always works, Parquet needs the optional pyarrow package and
+is written in row groups of EXPORT_CHUNK_ROWS. Memory stays flat however
+long the date range is. Files are stored and reused by export_manager.
+"""
+import csv
+import gzip
+import logging
+from datetime import date, timedelta
+from config import EXPORT_CHUNK_ROWS
+from storage import stats_store, registry_cache, export_manager
+from storage.message_types import MESSAGE_TYPES
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "parquet")
+COLUMNS = ("date", "chat_id", "group_title", "teacher_id", "full_name") + MESSAGE_TYPES + ("total",)
+
+# ============================================================================
+# ROWS
+# ============================================================================
+
+def date_range(date_from: str, date_to: str) -> list:
+    """Inclusive list of YYYY-MM-DD strings."""
+    start, end = date.fromisoformat(date_from), date.fromisoformat(date_to)
+    if end < start:
+        raise ValueError("end date is before start date")
+    return [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end - start).days + 1)]
+
+def iter_rows(dates: list):
+    """One tuple per (date, chat, teacher) with activity, in COLUMNS order."""
+    snap = registry_cache.get_snapshot()
+    for date_str, day_stats in stats_store.iter_days(dates):
+        for chat_id, t_stats in sorted(day_stats.items()):
+            group = snap.group(chat_id)
+            title = group.title if group else ""
+            for t_id, counters in sorted(t_stats.items()):
+                teacher = snap.teacher(t_id)
+                counts = [counters.get(t, 0) for t in MESSAGE_TYPES]
+                yield (date_str, chat_id, title, t_id, teacher.full_name if teacher else "", *counts, sum(counts))
+
+# ============================================================================
+# WRITERS
+# ============================================================================
+
+def write_csv_gz(path: str, rows) -> int:
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+def _parquet_schema():
+    text_columns = {"date", "chat_id", "group_title", "teacher_id", "full_name"}
+    return pyarrow.schema([(c, pyarrow.string() if c in text_columns else pyarrow.int64()) for c in COLUMNS])
+
+def write_parquet(path: str, rows, chunk_rows: int = EXPORT_CHUNK_ROWS) -> int:
+    if pyarrow is None:
+        raise RuntimeError("Parquet export requires the 'pyarrow' package")
+    schema = _parquet_schema()
+    count = 0
+    with pyarrow.parquet.ParquetWriter(path, schema, compression="zstd") as writer:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                writer.write_table(pyarrow.Table.from_pylist([dict(zip(COLUMNS, r)) for r in chunk], schema))
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            writer.write_table(pyarrow.Table.from_pylist([dict(zip(COLUMNS, r)) for r in chunk], schema))
+            count += len(chunk)
+    return count
+
+# ============================================================================
+# EXPORT
+# ============================================================================
+
+def export_raw(fmt: str, date_from: str, date_to: str):
+    """
+    Export date_from..date_to (inclusive) through the export manager.
+    Returns the Artifact (reused when the same range was exported at the same
+    data), or None when there are no rows.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format {fmt!r}, use one of {', '.join(FORMATS)}")
+    if fmt == "parquet" and pyarrow is None:
+        raise RuntimeError("Parquet export requires the 'pyarrow' package")
+    dates = date_range(date_from, date_to)
+    write = write_csv_gz if fmt == "csv" else write_parquet
+
+    def build(path: str) -> int:
+        count = write(path, iter_rows(dates))
+        logger.info(f"Raw export {date_from}..{date_to} ({fmt}): {count} rows")
+        return count
+
+    return export_manager.get_or_build("raw", (fmt, date_from, date_to), dates, build, file_suffix(fmt))
+
+def file_suffix(fmt: str) -> str:
+    return "csv.gz" if fmt == "csv" else "parquet"
@@ -0,0 +1,81 @@
+"""
+Redis counter backend (COUNTER_BACKEND=redis).
+
+Keys:
+  stats:{date}:{chat_id}:{teacher_id}   hash: message type -> count (HINCRBY)
+  stats:{date}:keys                     set of "{chat_id}:{teacher_id}" written that day
+
+The per-day set lets a day be read with SMEMBERS plus pipelined HGETALL
+instead of a SCAN over the keyspace. HINCRBY is atomic on the server, so any
+number of bot processes can share one Redis without file shards or locks.
+"""
+import logging
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "stats"
+
+def _hash_key(date_str: str, chat_id_str: str, teacher_id: str) -> str:
+    return f"{KEY_PREFIX}:{date_str}:{chat_id_str}:{teacher_id}"
+
+def _index_key(date_str: str) -> str:
+    return f"{KEY_PREFIX}:{date_str}:keys"
+
+class RedisCounters:
+    """Same merge_days/read_day/read_days interface as the JSON day files."""
+
+    def __init__(self, client):
+        # `client` must decode responses (str, not bytes); fakeredis works too
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str):
+        if redis is None:
+            raise RuntimeError("COUNTER_BACKEND=redis requires the 'redis' package (pip install redis)")
+        return cls(redis.Redis.from_url(url, decode_responses=True))
+
+    def merge_days(self, deltas: dict):
+        """Apply date -> chat_id -> teacher_id -> {type: n} in one pipeline round trip."""
+        pipe = self.client.pipeline(transaction=False)
+        for date_str, chats in deltas.items():
+            members = []
+            for chat_id_str, teachers in chats.items():
+                for teacher_id, counts in teachers.items():
+                    key = _hash_key(date_str, chat_id_str, teacher_id)
+                    for msg_type, n in counts.items():
+                        pipe.hincrby(key, msg_type, n)
+                    members.append(f"{chat_id_str}:{teacher_id}")
+            if members:
+                pipe.sadd(_index_key(date_str), *members)
+        pipe.execute()
+
+    def read_days(self, dates: list) -> list:
+        """Return one chat_id -> teacher_id -> counters dict per date, in two round trips."""
+        pipe = self.client.pipeline(transaction=False)
+        for date_str in dates:
+            pipe.smembers(_index_key(date_str))
+        members_per_day = pipe.execute()
+
+        pipe = self.client.pipeline(transaction=False)
+        slots = []
+        for i, members in enumerate(members_per_day):
+            for member in members:
+                # Chat IDs never contain ':', so the first one separates the pair
+                chat_id_str, teacher_id = member.split(":", 1)
+                pipe.hgetall(_hash_key(dates[i], chat_id_str, teacher_id))
+                slots.append((i, chat_id_str, teacher_id))
+        hashes = pipe.execute() if slots else []
+
+        days = [{} for _ in dates]
+        for (i, chat_id_str, teacher_id), counters in zip(slots, hashes):
+            if counters:
+                days[i].setdefault(chat_id_str, {})[teacher_id] = {k: int(v) for k, v in counters.items()}
+        return days
+
+    def read_day(self, date_str: str) -> dict:
+        return self.read_days([date_str])[0]
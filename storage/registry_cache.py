@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from config import TEACHERS_FILE, GROUPS_FILE, TEACHER_GROUPS_FILE
+from storage import json_db, report_cache
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# RECORDS
+# ============================================================================
+
+class _Record:
+    """
+    Compact read-only registry entry.
+
+    Supports `record["field"]` and `record.get("field", default)` so code
+    written against the json_db dicts keeps working unchanged.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+class TeacherRecord(_Record):
+    __slots__ = ("teacher_id", "full_name", "telegram_user_id", "active", "created_at")
+
+    def __init__(self, teacher_id: str, data: dict):
+        self.teacher_id = teacher_id
+        self.full_name = data.get("full_name", teacher_id)
+        self.telegram_user_id = data.get("telegram_user_id")
+        self.active = data.get("active", True)
+        self.created_at = data.get("created_at")
+
+class GroupRecord(_Record):
+    __slots__ = ("chat_id", "title", "enabled", "created_at")
+
+    def __init__(self, chat_id_str: str, data: dict):
+        self.chat_id = data.get("chat_id", chat_id_str)
+        self.title = data.get("title", chat_id_str)
+        self.enabled = data.get("enabled", True)
+        self.created_at = data.get("created_at")
+
+# ============================================================================
+# SNAPSHOT
+# ============================================================================
+
+class RegistrySnapshot:
+    """
+    Immutable view of teachers, groups and assignments at one registry version.
+
+    Built once after each registry change and swapped in whole, so a report
+    reads one consistent registry without touching disk. Teachers are
+    ordered by ID and groups by title, matching the admin lists; list cursors
+    are entity IDs, so a page stays stable when entries are added elsewhere.
+    """
+
+    def __init__(self, version: int, teachers: dict, groups: dict, teacher_groups: dict):
+        self.version = version
+        self.teachers = {t_id: TeacherRecord(t_id, data) for t_id, data in teachers.items()}
+        self.groups = {g_id: GroupRecord(g_id, data) for g_id, data in groups.items()}
+        self.assignments = {t_id: tuple(g_ids) for t_id, g_ids in teacher_groups.items()}
+
+        self.teacher_ids = sorted(self.teachers)
+        self.group_ids = [g_id for g_id, _ in sorted(self.groups.items(), key=lambda x: x[1].title)]
+        self._positions = {
+            "t": {t_id: i for i, t_id in enumerate(self.teacher_ids)},
+            "g": {g_id: i for i, g_id in enumerate(self.group_ids)},
+        }
+
+        self._by_telegram_id = {}
+        for t_id, teacher in self.teachers.items():
+            if teacher.telegram_user_id is not None:
+                self._by_telegram_id.setdefault(int(teacher.telegram_user_id), t_id)
+
+        self._assigned = set()
+        group_teachers = {}
+        for t_id in self.teacher_ids:
+            for g_id in self.assignments.get(t_id, ()):
+                self._assigned.add((t_id, g_id))
+                group_teachers.setdefault(g_id, []).append(t_id)
+        self._group_teachers = {g_id: tuple(t_ids) for g_id, t_ids in group_teachers.items()}
+
+    # ------------------------------------------------------------------ lookups
+
+    def teacher(self, teacher_id: str):
+        return self.teachers.get(teacher_id)
+
+    def group(self, chat_id_str: str):
+        return self.groups.get(chat_id_str)
+
+    def teacher_groups(self, teacher_id: str) -> tuple:
+        return self.assignments.get(teacher_id, ())
+
+    def teachers_in_group(self, chat_id_str: str) -> tuple:
+        """Assigned teacher IDs, in teacher ID order."""
+        return self._group_teachers.get(chat_id_str, ())
+
+    def is_assigned(self, teacher_id: str, chat_id_str: str) -> bool:
+        return (teacher_id, chat_id_str) in self._assigned
+
+    def find_teacher_by_telegram_id(self, telegram_user_id: int):
+        return self._by_telegram_id.get(int(telegram_user_id))
+
+    # ------------------------------------------------------------------ paging
+
+    def _ids(self, kind: str) -> list:
+        return self.teacher_ids if kind == "t" else self.group_ids
+
+    def page(self, kind: str, cursor: str = None, size: int = 15, predicate=None) -> tuple:
+        """
+        Return (ids, start, prev_cursor, next_cursor) for one page.
+
+        `cursor` is the ID of the first entry to show (None = first page).
+        `predicate(id)` filters entries, e.g. only unassigned groups.
+        """
+        ids = self._ids(kind)
+        start = self._positions[kind].get(cursor, 0) if cursor else 0
+
+        items = []
+        pos = start
+        while pos < len(ids) and len(items) < size:
+            if predicate is None or predicate(ids[pos]):
+                items.append(ids[pos])
+            pos += 1
+
+        next_cursor = None
+        while pos < len(ids):
+            if predicate is None or predicate(ids[pos]):
+                next_cursor = ids[pos]
+                break
+            pos += 1
+
+        prev_cursor = None
+        back = start - 1
+        found = 0
+        while back >= 0 and found < size:
+            if predicate is None or predicate(ids[back]):
+                prev_cursor = ids[back]
+                found += 1
+            back -= 1
+
+        return items, start, prev_cursor, next_cursor
+
+# ============================================================================
+# CURRENT SNAPSHOT
+# ============================================================================
+
+# Seconds between mtime checks for edits made by other processes (e.g. mass_assign.py)
+EXTERNAL_CHECK_INTERVAL = 2.0
+
+_lock = threading.Lock()
+_snapshot = None
+_snapshot_mtimes = None
+_checked_at = 0.0
+
+def registry_mtimes() -> tuple:
+    mtimes = []
+    for path in (TEACHERS_FILE, GROUPS_FILE, TEACHER_GROUPS_FILE):
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            mtimes.append(0)
+    return tuple(mtimes)
+
+def refresh() -> RegistrySnapshot:
+    """Rebuild the snapshot from disk if the version or the files changed, and swap it in."""
+    global _snapshot, _snapshot_mtimes, _checked_at
+    with _lock:
+        # Read the version first: a change committed while loading bumps it again
+        version = report_cache.registry_version()
+        mtimes = registry_mtimes()
+        if _snapshot is not None and _snapshot.version == version and _snapshot_mtimes == mtimes:
+            _checked_at = time.monotonic()
+            return _snapshot
+        snap = RegistrySnapshot(
+            version, json_db.load_teachers(), json_db.load_groups(), json_db.load_teacher_groups()
+        )
+        _snapshot, _snapshot_mtimes, _checked_at = snap, mtimes, time.monotonic()
+        return snap
+
+def publish():
+    """
+    Storage writer, after a registry commit: load the new snapshot, swap it
+    in, and only then bump the registry version, so readers never see a
+    version without its snapshot. The version is bumped even if loading
+    fails, so report caches are still invalidated.
+    """
+    global _snapshot, _snapshot_mtimes, _checked_at
+    try:
+        with _lock:
+            mtimes = registry_mtimes()
+            snap = RegistrySnapshot(
+                report_cache.registry_version() + 1,
+                json_db.load_teachers(), json_db.load_groups(), json_db.load_teacher_groups()
+            )
+            _snapshot, _snapshot_mtimes, _checked_at = snap, mtimes, time.monotonic()
+    finally:
+        report_cache.bump_registry_version()
+
+_refresh_pending = False
+
+def _refresh_in_background():
+    global _refresh_pending
+    try:
+        refresh()
+    except Exception as e:
+        logger.error(f"Failed to refresh registry snapshot: {e}")
+    finally:
+        _refresh_pending = False
+
+def _schedule_refresh() -> bool:
+    """On the event loop, start refresh() on the read pool; False when not on the loop."""
+    global _refresh_pending
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    if not _refresh_pending:
+        _refresh_pending = True
+        from storage import async_db  # async_db -> writer -> registry_cache
+        async_db.schedule_io(_refresh_in_background)
+    return True
+
+def get_snapshot() -> RegistrySnapshot:
+    """
+    Return the current snapshot; normally just a reference, no I/O. On the
+    event loop a stale snapshot is still returned while a refresh runs on the
+    read pool; worker threads refresh in place.
+    """
+    global _checked_at
+    snap = _snapshot
+    if snap is None:
+        return refresh()
+    if snap.version != report_cache.registry_version():
+        if _schedule_refresh():
+            return snap
+        return refresh()
+    if time.monotonic() - _checked_at >= EXTERNAL_CHECK_INTERVAL:
+        _checked_at = time.monotonic()
+        if _schedule_refresh():
+            return snap
+        if registry_mtimes() != _snapshot_mtimes:
+            return refresh()
+    return snap
@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from config import REPORT_CACHE_TTL, REPORT_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# DATA VERSIONS
+# ============================================================================
+# Monotonic counters bumped on every change to stats or to the registry
+# (teachers, groups, assignments). Report keys include the registry version,
+# so a change makes older entries unreachable; TTL/LRU eviction drops them
+# later. The stats version is per process: reports key on the files they
+# read instead (stats_store.data_key) and only fall back to it with Redis.
+
+_version_lock = threading.Lock()
+_stats_version = 0
+_registry_version = 0
+
+def bump_stats_version():
+    """Call after any counter change."""
+    global _stats_version
+    with _version_lock:
+        _stats_version += 1
+
+def bump_registry_version():
+    """Call after any teacher/group/assignment change."""
+    global _registry_version
+    with _version_lock:
+        _registry_version += 1
+
+def registry_version() -> int:
+    return _registry_version
+
+def data_version() -> tuple:
+    """(stats_version, registry_version) snapshot."""
+    with _version_lock:
+        return _stats_version, _registry_version
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+class ReportCache:
+    """LRU cache with per-entry TTL and a maximum number of entries."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached value or None if missing/expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def discard_where(self, predicate):
+        """Drop every entry whose key matches `predicate(key)`."""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+_cache = ReportCache(REPORT_CACHE_TTL, REPORT_CACHE_MAX_ENTRIES)
+
+def get_or_compute(key: tuple, compute, valid=None):
+    """
+    Return the cached result for `key` at the current registry version,
+    computing and storing it on a miss. `key` must identify the stats the
+    result reads (see stats_store.data_key), so a counter change only drops
+    the entries that actually cover it. `valid(value)` can reject a stale hit
+    (e.g. an export file that was deleted from disk).
+    """
+    full_key = key + (registry_version(),)
+    value = _cache.get(full_key)
+    if value is not None and (valid is None or valid(value)):
+        return value
+
+    value = compute()
+    if value is not None:
+        _cache.put(full_key, value)
+    return value
+
+def get_cache_stats() -> dict:
+    """Counters for diagnostics."""
+    stats_v, registry_v = data_version()
+    return {
+        "entries": len(_cache),
+        "hits": _cache.hits,
+        "misses": _cache.misses,
+        "stats_version": stats_v,
+        "registry_version": registry_v,
+    }
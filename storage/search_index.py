@@ -0,0 +1,133 @@
+import logging
+import threading
+from storage import json_db
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# TRIGRAM INDEX
+# ============================================================================
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+def trigrams(text: str) -> set:
+    """Character trigrams of a padded, lowercased string."""
+    padded = f"  {_normalize(text)} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SearchIndex:
+    """
+    In-memory fuzzy index over teachers (full_name, teacher_id) and groups
+    (title, chat_id).
+
+    Entries are keyed by (kind, id) with kind "t" or "g". Callers keep it in
+    sync through add()/remove() next to the matching json_db mutation, so the
+    index never has to be rebuilt from disk after startup.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}   # trigram -> set of (kind, id)
+        self._entries = {}    # (kind, id) -> (label, searchable text, trigram set)
+
+    def add(self, kind: str, entity_id: str, label: str, *fields):
+        """Insert or replace an entry; `fields` are the searchable strings."""
+        key = (kind, str(entity_id))
+        text = _normalize(" ".join(str(f) for f in fields if f))
+        grams = trigrams(text)
+        with self._lock:
+            self._remove_locked(key)
+            self._entries[key] = (label, text, grams)
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(key)
+
+    def remove(self, kind: str, entity_id: str):
+        with self._lock:
+            self._remove_locked((kind, str(entity_id)))
+
+    def _remove_locked(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for gram in entry[2]:
+            keys = self._postings.get(gram)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def search(self, query: str, kind: str = None, limit: int = 20) -> list:
+        """
+        Return up to `limit` (kind, id, label) tuples, best match first.
+
+        Substring matches (including ID prefixes) rank above purely fuzzy
+        ones; fuzzy ranking is by shared trigrams (Jaccard similarity).
+        """
+        query = _normalize(query)
+        if not query:
+            return []
+        q_grams = trigrams(query)
+
+        with self._lock:
+            shared = {}
+            for gram in q_grams:
+                for key in self._postings.get(gram, ()):
+                    if kind is None or key[0] == kind:
+                        shared[key] = shared.get(key, 0) + 1
+
+            scored = []
+            for key, count in shared.items():
+                label, text, grams = self._entries[key]
+                score = count / (len(q_grams) + len(grams) - count)
+                if query in text:
+                    score += 1.0
+                scored.append((score, label, key))
+
+        # Drop weak fuzzy matches (less than a third of the query's trigrams)
+        min_shared = max(1, len(q_grams) // 3)
+        scored = [
+            item for item in scored
+            if item[0] >= 1.0 or shared[item[2]] >= min_shared
+        ]
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [(key[0], key[1], label) for _, label, key in scored[:limit]]
+
+    def __len__(self):
+        return len(self._entries)
+
+# ============================================================================
+# PROCESS-WIDE INDEX
+# ============================================================================
+
+_index = None
+_init_lock = threading.Lock()
+
+def get_index() -> SearchIndex:
+    """Return the shared index, building it from the registry on first use."""
+    global _index
+    with _init_lock:
+        if _index is None:
+            index = SearchIndex()
+            for t_id, t_data in json_db.load_teachers().items():
+                index.add("t", t_id, t_data.get("full_name", t_id), t_data.get("full_name"), t_id)
+            for g_id, g_data in json_db.load_groups().items():
+                index.add("g", g_id, g_data.get("title", g_id), g_data.get("title"), g_id)
+            _index = index
+        return _index
+
+def index_teacher(teacher_id: str):
+    """Refresh one teacher after add_teacher/update_teacher_name."""
+    teacher = json_db.get_teacher(teacher_id)
+    if teacher:
+        get_index().add("t", teacher_id, teacher["full_name"], teacher["full_name"], teacher_id)
+    else:
+        get_index().remove("t", teacher_id)
+
+def index_group(chat_id_str: str):
+    """Refresh one group after add_group/update_group_title."""
+    group = json_db.get_group(chat_id_str)
+    if group:
+        get_index().add("g", chat_id_str, group["title"], group["title"], chat_id_str)
+    else:
+        get_index().remove("g", chat_id_str)
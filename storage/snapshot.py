@@ -0,0 +1,189 @@
+"""
+Point-in-time, incremental backups of DATA_DIR.
+
+A snapshot is a manifest (BACKUP_DIR/snapshots/<id>.json) mapping every
+data file to the SHA-256 of its content; contents live once each in a
+content-addressed store (BACKUP_DIR/objects/ab/abcd....gz). A new snapshot
+only reads files whose size or mtime changed since the previous one and
+only stores contents that are not already in the store, so closed days and
+archived months are never copied twice.
+
+Snapshots taken by the bot run on the storage writer thread with the stats
+lock held, so no counter or registry write can land halfway through.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import zlib
+from datetime import datetime
+from config import DATA_DIR, BACKUP_DIR, BACKUP_KEEP
+from storage import stats_store
+
+logger = logging.getLogger(__name__)
+
+OBJECTS_DIR = os.path.join(BACKUP_DIR, "objects")
+SNAPSHOTS_DIR = os.path.join(BACKUP_DIR, "snapshots")
+
+# Lock files and half-written temp files are never part of the data
+_SKIP_SUFFIXES = (".lock", ".tmp")
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def _data_files(root: str):
+    """Relative (forward-slash) paths of all data files under root."""
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.endswith(_SKIP_SUFFIXES):
+                continue
+            rel = os.path.relpath(os.path.join(dirpath, name), root)
+            yield rel.replace(os.sep, "/")
+
+def _object_path(digest: str) -> str:
+    return os.path.join(OBJECTS_DIR, digest[:2], f"{digest}.gz")
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _manifest_path(snapshot_id: str) -> str:
+    return os.path.join(SNAPSHOTS_DIR, f"{snapshot_id}.json")
+
+def load_manifest(snapshot_id: str) -> dict:
+    with open(_manifest_path(snapshot_id), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def list_snapshots() -> list:
+    """Snapshot IDs, oldest first."""
+    try:
+        names = os.listdir(SNAPSHOTS_DIR)
+    except OSError:
+        return []
+    return sorted(n[:-5] for n in names if n.endswith(".json"))
+
+# ============================================================================
+# SNAPSHOT
+# ============================================================================
+
+def take_snapshot() -> dict:
+    """Snapshot DATA_DIR and return a summary of what was stored."""
+    snapshots = list_snapshots()
+    previous = load_manifest(snapshots[-1])["files"] if snapshots else {}
+
+    snapshot_id = datetime.now().strftime("%Y%m%d-%H%M%S")
+    suffix = 1
+    while os.path.exists(_manifest_path(snapshot_id)):
+        snapshot_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{suffix}"
+        suffix += 1
+
+    files = {}
+    new_objects = 0
+    new_bytes = 0
+    with stats_store.STATS_LOCK:
+        for rel in sorted(_data_files(DATA_DIR)):
+            path = os.path.join(DATA_DIR, rel)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+
+            old = previous.get(rel)
+            if (
+                old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns
+                and os.path.exists(_object_path(old["sha256"]))
+            ):
+                files[rel] = old
+                continue
+
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            obj = _object_path(digest)
+            if not os.path.exists(obj):
+                _write_atomic(obj, gzip.compress(data))
+                new_objects += 1
+                new_bytes += len(data)
+            files[rel] = {"sha256": digest, "size": len(data), "mtime_ns": st.st_mtime_ns}
+
+    manifest = {
+        "id": snapshot_id,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "files": files,
+    }
+    _write_atomic(_manifest_path(snapshot_id), json.dumps(manifest, ensure_ascii=False).encode('utf-8'))
+    prune_snapshots()
+
+    return {
+        "id": snapshot_id,
+        "files": len(files),
+        "total_bytes": sum(entry["size"] for entry in files.values()),
+        "new_objects": new_objects,
+        "new_bytes": new_bytes,
+    }
+
+def prune_snapshots(keep: int = BACKUP_KEEP) -> int:
+    """Keep the newest `keep` snapshots and drop objects no longer referenced."""
+    snapshots = list_snapshots()
+    if keep <= 0 or len(snapshots) <= keep:
+        return 0
+
+    for snapshot_id in snapshots[:-keep]:
+        os.remove(_manifest_path(snapshot_id))
+
+    referenced = set()
+    for snapshot_id in snapshots[-keep:]:
+        referenced.update(entry["sha256"] for entry in load_manifest(snapshot_id)["files"].values())
+
+    removed = 0
+    for dirpath, _, filenames in os.walk(OBJECTS_DIR):
+        for name in filenames:
+            if name.endswith(".gz") and name[:-3] not in referenced:
+                os.remove(os.path.join(dirpath, name))
+                removed += 1
+    return removed
+
+# ============================================================================
+# RESTORE
+# ============================================================================
+
+def _read_object(rel: str, digest: str) -> bytes:
+    try:
+        with open(_object_path(digest), 'rb') as f:
+            data = gzip.decompress(f.read())
+    except (OSError, EOFError, zlib.error) as e:
+        raise ValueError(f"Backup object for {rel} is unreadable: {e}")
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError(f"Backup object for {rel} is corrupted")
+    return data
+
+def restore_snapshot(snapshot_id: str, target: str = DATA_DIR, clean: bool = False) -> int:
+    """
+    Write a snapshot's files into `target`. Every object is verified before
+    anything is written, so a damaged backup leaves the target untouched.
+    With `clean` (only allowed for DATA_DIR itself), data files that are not
+    in the snapshot are removed, giving an exact point-in-time copy.
+    Stop the bot before restoring into its live DATA_DIR.
+    """
+    if clean and os.path.realpath(target) != os.path.realpath(DATA_DIR):
+        raise ValueError("clean restore is only allowed into DATA_DIR")
+    files = load_manifest(snapshot_id)["files"]
+
+    for rel, entry in files.items():
+        _read_object(rel, entry["sha256"])
+
+    for rel, entry in files.items():
+        _write_atomic(os.path.join(target, *rel.split("/")), _read_object(rel, entry["sha256"]))
+
+    if clean:
+        for rel in list(_data_files(target)):
+            if rel not in files:
+                os.remove(os.path.join(target, *rel.split("/")))
+    return len(files)
@@ -0,0 +1,445 @@
+import contextlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from filelock import FileLock
+from config import STATS_DIR, EXPORT_DIR, DATA_DIR, WORKER_ID, COUNTER_BACKEND, REDIS_URL, STATS_RETENTION_DAYS
+from storage import json_db, archive, report_cache
+from storage.counters import Counters, MESSAGE_TYPES, sum_days
+
+logger = logging.getLogger(__name__)
+
+# Windows (in days) that the nightly job pre-aggregates; see precompute_windows()
+STANDARD_WINDOWS = (1, 7, 30)
+PRECOMPUTED_DIR = os.path.join(EXPORT_DIR, "precomputed")
+
+# One lock for all day files, taken once per writer batch (see merge_days)
+STATS_LOCK = FileLock(os.path.join(DATA_DIR, "stats.lock"))
+
+# Per-worker counter shards: stats/shards/<worker>/<date>.json. A worker only
+# ever writes its own shard, so no lock is shared between processes; readers
+# add every shard to the main day file.
+SHARDS_DIR = os.path.join(STATS_DIR, "shards")
+
+# ============================================================================
+# COUNTER BACKEND
+# ============================================================================
+# Day files by default; COUNTER_BACKEND=redis keeps counters in Redis behind
+# the same read_day/read_days/merge_days calls.
+
+_backend = None
+
+def get_backend():
+    """Return the Redis backend when configured, else None (JSON day files)."""
+    global _backend
+    if _backend is None and COUNTER_BACKEND == "redis":
+        from storage.redis_counters import RedisCounters
+        _backend = RedisCounters.from_url(REDIS_URL)
+        if _daily_dates() or archive.list_months():
+            logger.warning(f"COUNTER_BACKEND=redis: existing day files and archives in {STATS_DIR} are not read")
+    return _backend
+
+def set_backend(backend):
+    """Use a specific backend object (e.g. RedisCounters over fakeredis), or None for JSON."""
+    global _backend
+    _backend = backend
+
+# ============================================================================
+# DAILY FILES
+# ============================================================================
+
+def day_path(date_str: str) -> str:
+    """Path of the stats file for one day (YYYY-MM-DD)."""
+    return os.path.join(STATS_DIR, f"{date_str}.json")
+
+def shard_path(date_str: str, worker_id: str) -> str:
+    """Path of one worker's counter shard for one day."""
+    return os.path.join(SHARDS_DIR, worker_id, f"{date_str}.json")
+
+def _read_file(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to read stats file {path}: {e}")
+        return {}
+
+def _shard_workers() -> list:
+    try:
+        return sorted(os.listdir(SHARDS_DIR))
+    except OSError:
+        return []
+
+def _daily_paths(date_str: str) -> list:
+    """Main day file and every worker shard path of one day (existing or not)."""
+    return [day_path(date_str)] + [shard_path(date_str, w) for w in _shard_workers()]
+
+def _signature(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+def _is_folded(path: str, folded: dict) -> bool:
+    """True if this exact version of a day file is already in the monthly archive."""
+    recorded = folded.get(os.path.relpath(path, STATS_DIR))
+    return recorded is not None and _signature(path) == recorded
+
+def _read_parts(date_str: str) -> list:
+    """
+    Non-empty parts of one day: monthly archive, main day file, worker shards.
+    Day files already folded into the archive are skipped.
+    """
+    folded = archive.folded(date_str)
+    parts = [archive.read_day(date_str)]
+    parts += [_read_file(path) for path in _daily_paths(date_str) if not (folded and _is_folded(path, folded))]
+    return [part for part in parts if part]
+
+def fingerprint(dates: list):
+    """
+    Cheap signature of the files behind `dates` (size and mtime of archives,
+    day files and shards); it changes whenever any of those days does.
+    None with the Redis backend, which has no files to look at.
+    """
+    if get_backend() is not None:
+        return None
+    paths = {archive.archive_path(d[:7]) for d in dates}
+    workers = _shard_workers()
+    for date_str in dates:
+        paths.add(day_path(date_str))
+        paths.update(shard_path(date_str, w) for w in workers)
+    signature = []
+    for path in sorted(paths):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        signature.append((os.path.relpath(path, STATS_DIR), st.st_size, st.st_mtime_ns))
+    return tuple(signature)
+
+def data_key(days: int, windows: int = 1) -> tuple:
+    """
+    Cache key for results computed from the last `windows` windows of `days`
+    days: the fingerprint of the closed days plus today's. It changes only
+    when a file behind one of those days does, whichever worker or import
+    wrote it. With Redis there are no files; the in-process stats version
+    stands in for both.
+    """
+    dates = [d for window in window_dates(days, windows) for d in window]
+    closed = fingerprint(dates[1:])
+    if closed is None:
+        return (dates[0], report_cache.data_version()[0])
+    return (dates[0], closed, fingerprint(dates[:1]))
+
+def read_day(date_str: str) -> dict:
+    """Load one day of counters: chat_id -> teacher_id -> counters (all parts merged)."""
+    backend = get_backend()
+    if backend is not None:
+        return backend.read_day(date_str)
+
+    parts = _read_parts(date_str)
+    if len(parts) == 1:
+        return parts[0]
+    return sum_days(parts)
+
+def read_days(dates: list) -> list:
+    """read_day() for several dates; the Redis backend fetches them in one pipeline."""
+    backend = get_backend()
+    if backend is not None:
+        return backend.read_days(dates)
+    return [read_day(date_str) for date_str in dates]
+
+def iter_days(dates: list, chunk: int = 31):
+    """Yield (date_str, day stats) lazily, reading at most `chunk` days at a time."""
+    for i in range(0, len(dates), chunk):
+        batch = dates[i:i + chunk]
+        yield from zip(batch, read_days(batch))
+
+def today_date():
+    """Current date in the configured timezone."""
+    return datetime.now(json_db.local_tz).date()
+
+def window_dates(days: int, windows: int = 1, end=None) -> list:
+    """
+    Return date strings for `windows` adjacent windows of `days` days each,
+    newest first. Window 0 ends at `end` (default today, the same range as
+    json_db.aggregate_stats).
+    """
+    end = end or today_date()
+    return [
+        [(end - timedelta(days=w * days + i)).strftime("%Y-%m-%d") for i in range(days)]
+        for w in range(windows)
+    ]
+
+def _write_day(path: str, day: dict):
+    """Atomic, durable replace: tmp file, fsync, rename."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(day, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def merge_days(deltas: dict, shared: bool = False):
+    """
+    Add counter deltas to day files: date -> chat_id -> teacher_id -> {type: n}.
+
+    Each touched day is read and rewritten once, however many increments it
+    received. With WORKER_ID set the deltas go to this worker's shard, which
+    no other process writes; otherwise (or with `shared`, for writers outside
+    the bot such as import_history.py) to the shared day file under a single
+    acquisition of STATS_LOCK.
+    """
+    backend = get_backend()
+    if backend is not None:
+        backend.merge_days(deltas)
+        return
+
+    worker_id = None if shared else WORKER_ID
+    if worker_id:
+        os.makedirs(os.path.join(SHARDS_DIR, worker_id), exist_ok=True)
+    with (contextlib.nullcontext() if worker_id else STATS_LOCK):
+        for date_str, chats in deltas.items():
+            path = shard_path(date_str, worker_id) if worker_id else day_path(date_str)
+            folded = archive.folded(date_str)
+            # A file left over from an interrupted compaction is already archived: start afresh
+            day = {} if folded and _is_folded(path, folded) else _read_file(path)
+            for chat_id_str, teachers in chats.items():
+                chat = day.setdefault(chat_id_str, {})
+                for teacher_id, counts in teachers.items():
+                    counters = chat.setdefault(teacher_id, {k: 0 for k in MESSAGE_TYPES})
+                    for msg_type, n in counts.items():
+                        counters[msg_type] = counters.get(msg_type, 0) + n
+            _write_day(path, day)
+
+# ============================================================================
+# AGGREGATION
+# ============================================================================
+
+def add_day(target: dict, day_stats: dict):
+    """Add one day of counters (dicts or Counters) into an aggregate of Counters in place."""
+    for chat_id, t_stats in day_stats.items():
+        chat_agg = target.setdefault(chat_id, {})
+        for t_id, counters in t_stats.items():
+            agg = chat_agg.get(t_id)
+            if agg is None:
+                agg = chat_agg[t_id] = Counters()
+            agg.add(counters)
+
+def to_json(stats: dict) -> dict:
+    """Aggregate of Counters -> plain nested dicts."""
+    return {
+        chat_id: {t_id: counters.to_dict() for t_id, counters in t_stats.items()}
+        for chat_id, t_stats in stats.items()
+    }
+
+def from_json(stats: dict) -> dict:
+    """Plain nested dicts -> aggregate of Counters."""
+    return {
+        chat_id: {t_id: Counters.from_dict(counters) for t_id, counters in t_stats.items()}
+        for chat_id, t_stats in stats.items()
+    }
+
+def aggregate_windows(days: int, windows: int = 2, end=None) -> list:
+    """
+    Aggregate several adjacent windows in a single pass over the stats files.
+
+    Returns a list of `windows` dicts shaped like json_db.aggregate_stats()
+    (chat_id -> teacher_id -> Counters), index 0 being the current window, 1 the one before it, and so on.
+    Windows ending today reuse the nightly pre-aggregate when one exists, so
+    only today's file is read.
+    """
+    if end is None:
+        cached = load_precomputed(days, windows)
+        if cached is not None:
+            return cached
+
+    return [sum_days(read_days(dates)) for dates in window_dates(days, windows, end)]
+
+def aggregate_stats(days: int) -> dict:
+    """Drop-in for json_db.aggregate_stats() that uses the pre-aggregates."""
+    return aggregate_windows(days, 1)[0]
+
+def entity_totals(days: int, entity, end=None) -> dict:
+    """
+    Counters per entity over the last `days` days, folded while streaming the
+    day files. `entity(chat_id, teacher_id)` names the bucket each row adds to
+    (None skips the row), so only a few days and the per-entity totals are in
+    memory, never the window's whole chat -> teacher map.
+    """
+    totals = {}
+    for _, day in iter_days(window_dates(days, 1, end)[0], chunk=7):
+        for chat_id_str, t_stats in day.items():
+            for t_id, counters in t_stats.items():
+                key = entity(chat_id_str, t_id)
+                if key is None:
+                    continue
+                agg = totals.get(key)
+                if agg is None:
+                    agg = totals[key] = Counters()
+                agg.add(counters)
+    return totals
+
+def teacher_summary(teacher_id: str, days: int = 7) -> Counters:
+    """One teacher's counters over the last `days` days, summed over all groups."""
+    total = Counters()
+    for t_stats in aggregate_stats(days).values():
+        counters = t_stats.get(teacher_id)
+        if counters is not None:
+            total.add(counters)
+    return total
+
+# ============================================================================
+# PRE-AGGREGATED WINDOWS
+# ============================================================================
+
+def _precomputed_path(days: int) -> str:
+    return os.path.join(PRECOMPUTED_DIR, f"window_{days}.json")
+
+def _closed_fingerprint(dates: list):
+    """fingerprint() of every day in the windows except today, JSON-shaped (or None)."""
+    signature = fingerprint([d for window in dates for d in window][1:])
+    return None if signature is None else [list(entry) for entry in signature]
+
+def precompute_windows(days: int, windows: int = 2):
+    """
+    Aggregate the closed days of a standard window and store them.
+
+    Everything except today's file is normally final once the day is over,
+    so the stored result stays valid until midnight; readers add today's
+    file on top. The fingerprint of the closed days' files is stored too, so
+    a late change to them (an import, a restored backup) invalidates it.
+    """
+    dates = window_dates(days, windows)
+    # Window 0 starts with today, which is still changing
+    result = [sum_days(read_days(window[1:] if w == 0 else window)) for w, window in enumerate(dates)]
+    signature = _closed_fingerprint(dates)
+
+    os.makedirs(PRECOMPUTED_DIR, exist_ok=True)
+    path = _precomputed_path(days)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "date": dates[0][0], "fingerprint": signature, "windows": [to_json(w) for w in result]
+        }, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def load_precomputed(days: int, windows: int = 1):
+    """Return today's windows from the pre-aggregate, or None if unavailable."""
+    path = _precomputed_path(days)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to read precomputed window {path}: {e}")
+        return None
+
+    today_str = today_date().strftime("%Y-%m-%d")
+    if data.get("date") != today_str or len(data.get("windows", [])) < windows:
+        return None
+    if data.get("fingerprint") != _closed_fingerprint(window_dates(days, len(data["windows"]))):
+        logger.info(f"Precomputed {days}-day window is stale, aggregating from the stats files")
+        return None
+
+    result = [from_json(w) for w in data["windows"][:windows]]
+    add_day(result[0], read_day(today_str))
+    return result
+
+# ============================================================================
+# RETENTION
+# ============================================================================
+
+# A month is archived once its last day is at least this many days old
+ARCHIVE_GRACE_DAYS = 2
+
+def _daily_dates() -> set:
+    """Dates that still have a main day file or a worker shard."""
+    dirs = [STATS_DIR] + [os.path.join(SHARDS_DIR, w) for w in _shard_workers()]
+    dates = set()
+    for directory in dirs:
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        dates.update(n[:-5] for n in names if n.endswith(".json") and len(n) == 15)
+    return dates
+
+def _remove_daily(date_str: str):
+    for path in _daily_paths(date_str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def compact_stats(today=None) -> dict:
+    """
+    Fold the day files of closed months into monthly archives, then drop
+    data older than STATS_RETENTION_DAYS (0 keeps everything).
+
+    Late writes into an archived month (e.g. an import) land in a new day
+    file and are folded into the archive on the next run. The archive
+    records which day file versions it contains, so a run interrupted
+    between writing the archive and removing the day files only removes
+    them next time instead of adding them again. Returns counts for logging.
+    """
+    summary = {"archived_months": 0, "archived_days": 0, "pruned_days": 0, "pruned_months": 0}
+    if get_backend() is not None:
+        return summary
+
+    today = today or today_date()
+    closed_before = (today - timedelta(days=ARCHIVE_GRACE_DAYS)).strftime("%Y-%m")
+    keep_from = (today - timedelta(days=STATS_RETENTION_DAYS)).strftime("%Y-%m-%d") if STATS_RETENTION_DAYS else None
+
+    with STATS_LOCK:
+        by_month = {}
+        for date_str in _daily_dates():
+            if date_str[:7] < closed_before:
+                by_month.setdefault(date_str[:7], []).append(date_str)
+
+        for month, dates in sorted(by_month.items()):
+            days = archive.read_month(month)
+            folded = {}
+            for date_str in dates:
+                already = archive.folded(date_str)
+                merged = {}
+                add_day(merged, days.get(date_str, {}))
+                for path in _daily_paths(date_str):
+                    signature = _signature(path)
+                    if signature is None:
+                        continue
+                    if not _is_folded(path, already):
+                        add_day(merged, _read_file(path))
+                    folded.setdefault(date_str, {})[os.path.relpath(path, STATS_DIR)] = signature
+                days[date_str] = to_json(merged)
+            archive.write_archive(month, days, folded=folded)
+            for date_str in dates:
+                _remove_daily(date_str)
+            summary["archived_months"] += 1
+            summary["archived_days"] += len(dates)
+
+        if keep_from:
+            for date_str in _daily_dates():
+                if date_str < keep_from:
+                    _remove_daily(date_str)
+                    summary["pruned_days"] += 1
+            for month in archive.list_months():
+                if month < keep_from[:7]:
+                    archive.delete_month(month)
+                    summary["pruned_months"] += 1
+
+    return summary
+
+def storage_summary() -> dict:
+    """File counts for diagnostics."""
+    months = archive.list_months()
+    return {
+        "day_files": len(_daily_dates()),
+        "archived_months": len(months),
+        "archive_bytes": sum(os.path.getsize(archive.archive_path(m)) for m in months),
+    }
@@ -0,0 +1,228 @@
+"""
+Single storage writer.
+
+Every mutation is sent to one asyncio task as a typed command. The task
+collects whatever arrived within WRITE_LINGER_MS (up to WRITE_BATCH_SIZE
+commands) and commits the batch on its own thread:
+
+- increments are summed per day file and written once, with one fsync;
+- consecutive assignment changes are applied to one copy of
+  teacher_groups.json and written once;
+- any other json_db mutation runs as-is, in submission order.
+
+After a batch that changed the registry, the registry snapshot is rebuilt
+once on the same thread and swapped in before the registry version is
+bumped, so the event loop never has to load it itself.
+"""
+import asyncio
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from config import WRITE_BATCH_SIZE, WRITE_LINGER_MS
+from storage import json_db, stats_store, report_cache, registry_cache, membership
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# COMMANDS
+# ============================================================================
+
+Increment = namedtuple("Increment", "date_str chat_id_str teacher_id msg_type")
+# assigned=None toggles, True/False sets the assignment explicitly
+SetAssignment = namedtuple("SetAssignment", "teacher_id chat_id_str assigned")
+# Any other json_db mutation; `registry` marks teacher/group/assignment changes
+Call = namedtuple("Call", "func args registry")
+
+# ============================================================================
+# BATCH COMMIT (runs on the writer thread)
+# ============================================================================
+
+def _apply_assignments(commands: list) -> list:
+    tg = json_db.load_teacher_groups()
+    results = []
+    changed = False
+    for cmd in commands:
+        groups = tg.setdefault(cmd.teacher_id, [])
+        present = cmd.chat_id_str in groups
+        want = (not present) if cmd.assigned is None else cmd.assigned
+        if want and not present:
+            groups.append(cmd.chat_id_str)
+            changed = True
+        elif present and not want:
+            groups.remove(cmd.chat_id_str)
+            changed = True
+        results.append((True, "✅ Assigned" if want else "❌ Unassigned"))
+    if changed:
+        json_db._write_json(json_db.TEACHER_GROUPS_FILE, tg)
+    return results
+
+# Counter deltas whose commit failed; merged into the next batch's deltas
+# (only the writer thread touches this)
+_unsaved = {}
+_unsaved_count = 0
+
+def _merge_deltas(target: dict, deltas: dict):
+    for date_str, chats in deltas.items():
+        for chat_id_str, teachers in chats.items():
+            for teacher_id, counts in teachers.items():
+                target_counts = target.setdefault(date_str, {}).setdefault(chat_id_str, {}).setdefault(teacher_id, {})
+                for msg_type, n in counts.items():
+                    target_counts[msg_type] = target_counts.get(msg_type, 0) + n
+
+def commit_batch(commands: list) -> list:
+    """
+    Apply a batch and return one result per command (an Exception instance
+    on failure). Increments touch only day files, so they are committed
+    together at the end without reordering anything observable. If that
+    commit fails, the increments get the exception and their counts are
+    kept and retried with the next batch.
+    """
+    global _unsaved, _unsaved_count
+    results = [None] * len(commands)
+    deltas = {}
+    increments = []
+    registry_changed = False
+
+    i = 0
+    while i < len(commands):
+        cmd = commands[i]
+        if isinstance(cmd, Increment):
+            counts = deltas.setdefault(cmd.date_str, {}).setdefault(cmd.chat_id_str, {}).setdefault(cmd.teacher_id, {})
+            counts[cmd.msg_type] = counts.get(cmd.msg_type, 0) + 1
+            increments.append(i)
+            i += 1
+        elif isinstance(cmd, SetAssignment):
+            j = i
+            while j < len(commands) and isinstance(commands[j], SetAssignment):
+                j += 1
+            try:
+                results[i:j] = _apply_assignments(commands[i:j])
+            except Exception as e:
+                results[i:j] = [e] * (j - i)
+            registry_changed = True
+            i = j
+        else:
+            try:
+                results[i] = cmd.func(*cmd.args)
+            except Exception as e:
+                results[i] = e
+            registry_changed = registry_changed or cmd.registry
+            i += 1
+
+    if _unsaved:
+        _merge_deltas(deltas, _unsaved)
+    if deltas:
+        try:
+            stats_store.merge_days(deltas)
+        except Exception as e:
+            _unsaved = deltas
+            _unsaved_count += len(increments)
+            logger.error(f"Failed to commit counters, {_unsaved_count} increments kept for retry: {e}")
+            for k in increments:
+                results[k] = e
+        else:
+            _unsaved = {}
+            _unsaved_count = 0
+            report_cache.bump_stats_version()
+    try:
+        # Roster changes of the whole batch, in one write
+        membership.flush()
+    except Exception as e:
+        logger.error(f"Failed to save membership roster: {e}")
+    if registry_changed:
+        try:
+            registry_cache.publish()
+        except Exception as e:
+            logger.error(f"Failed to rebuild registry snapshot: {e}")
+    return results
+
+# ============================================================================
+# WRITER TASK
+# ============================================================================
+
+class StorageWriter:
+    """Owns the mutation queue and the thread that commits it."""
+
+    def __init__(self, batch_size: int = WRITE_BATCH_SIZE, linger_ms: int = WRITE_LINGER_MS):
+        self.batch_size = batch_size
+        self.linger = linger_ms / 1000
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-write")
+        self._task = None
+        self.batches = 0
+        self.commands = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Commit everything queued so far, then stop the task."""
+        if self._task is None or self._task.done():
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        if _unsaved_count:
+            logger.error(f"Stopping with {_unsaved_count} increments that could not be saved")
+
+    def submit(self, command) -> asyncio.Future:
+        """Queue a command; the returned future resolves after its batch commits."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((command, future))
+        return future
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            if self.linger > 0:
+                await asyncio.sleep(self.linger)
+            while len(batch) < self.batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            commands = [cmd for cmd, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, commit_batch, commands)
+            except Exception as e:
+                logger.error(f"Storage batch failed: {e}")
+                results = [e] * len(batch)
+            self.batches += 1
+            self.commands += len(batch)
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+_writer = None
+
+def get_writer() -> StorageWriter:
+    global _writer
+    if _writer is None:
+        _writer = StorageWriter()
+    return _writer
+
+def get_writer_stats() -> dict:
+    """Counters for diagnostics."""
+    writer = get_writer()
+    return {
+        "queued": writer.queue_depth(),
+        "batches": writer.batches,
+        "commands": writer.commands,
+        "unsaved": _unsaved_count,
+    }
@@ -0,0 +1,23 @@
+from handlers.pagination import paginate_blocks, text_length, strip_html
+
+def test_pages_are_measured_in_utf16_units():
+    # 60 units each but only 30 characters: len() would fit twice as many
+    blocks = ["🏆" * 30 for _ in range(20)]
+    pages = paginate_blocks(blocks, header="H\n", limit=200)
+
+    assert all(text_length(page) <= 200 for page in pages)
+    assert len(pages) == 7  # three 60-unit blocks per page after the header
+    assert "".join(page[2:] for page in pages) == "".join(blocks)
+
+def test_oversized_block_is_cut_at_a_line_and_stays_well_formed():
+    block = "<b>" + "".join(f"📊 line {i}\n" for i in range(40)) + "</b>"
+    pages = paginate_blocks([block], prefix="<pre>", suffix="</pre>", limit=120)
+
+    assert len(pages) == 1
+    page = pages[0]
+    assert text_length(page) <= 120
+    assert page.endswith("\n</b></pre>")
+    assert page.count("<b>") == page.count("</b>")
+
+def test_strip_html_drops_every_tag():
+    assert strip_html("<b>A</b> <i>b</i> <code>1</code> &lt;x&gt; &amp;") == "A b 1 <x> &"
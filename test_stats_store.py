@@ -0,0 +1,48 @@
+import os
+from datetime import date
+
+import pytest
+
+from storage import stats_store
+
+TODAY = date(2026, 3, 1)  # January is closed and gets archived
+
+def _text(day: dict, chat="-100", teacher="T1") -> int:
+    return day[chat][teacher]["text"]
+
+def test_compaction_folds_each_day_file_once(stats_dir):
+    stats_store.merge_days({"2026-01-05": {"-100": {"T1": {"text": 3}}}})
+
+    summary = stats_store.compact_stats(today=TODAY)
+    assert summary["archived_days"] == 1
+    assert not os.path.exists(stats_store.day_path("2026-01-05"))
+    assert _text(stats_store.read_day("2026-01-05")) == 3
+
+    # A late write lands in a new day file and is added on the next run
+    stats_store.merge_days({"2026-01-05": {"-100": {"T1": {"text": 2}}}})
+    assert _text(stats_store.read_day("2026-01-05")) == 5
+    stats_store.compact_stats(today=TODAY)
+    assert _text(stats_store.read_day("2026-01-05")) == 5
+
+def test_interrupted_compaction_is_not_counted_twice(stats_dir, monkeypatch):
+    stats_store.merge_days({"2026-01-05": {"-100": {"T1": {"text": 3}}}})
+
+    def crash(date_str):
+        raise OSError("killed before the day files were removed")
+
+    monkeypatch.setattr(stats_store, "_remove_daily", crash)
+    with pytest.raises(OSError):
+        stats_store.compact_stats(today=TODAY)
+    monkeypatch.undo()
+
+    # Archive written, day file still there: it must not be read on top
+    assert os.path.exists(stats_store.day_path("2026-01-05"))
+    assert _text(stats_store.read_day("2026-01-05")) == 3
+
+    # A write in between starts a fresh day file instead of re-adding the old one
+    stats_store.merge_days({"2026-01-05": {"-100": {"T1": {"text": 1}}}})
+    assert _text(stats_store.read_day("2026-01-05")) == 4
+
+    stats_store.compact_stats(today=TODAY)
+    assert not os.path.exists(stats_store.day_path("2026-01-05"))
+    assert _text(stats_store.read_day("2026-01-05")) == 4
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from storage import writer, stats_store, json_db, registry_cache, membership
+from storage.writer import Increment, SetAssignment, Call, StorageWriter, commit_batch
+
+@pytest.fixture
+def storage(monkeypatch):
+    """Record what a batch writes instead of touching the data files."""
+    calls = {"merge_days": [], "writes": [], "publish": 0}
+    teacher_groups = {"T1": ["-100"]}
+
+    def publish():
+        calls["publish"] += 1
+
+    monkeypatch.setattr(stats_store, "merge_days", lambda deltas: calls["merge_days"].append(deltas))
+    monkeypatch.setattr(json_db, "load_teacher_groups", lambda: teacher_groups)
+    monkeypatch.setattr(json_db, "_write_json", lambda path, data: calls["writes"].append(data))
+    monkeypatch.setattr(registry_cache, "publish", publish)
+    monkeypatch.setattr(membership, "flush", lambda: None)
+    monkeypatch.setattr(writer, "_unsaved", {})
+    monkeypatch.setattr(writer, "_unsaved_count", 0)
+    return calls
+
+def test_increments_are_summed_into_one_merge(storage):
+    results = commit_batch([
+        Increment("2026-01-05", "-100", "T1", "text"),
+        Increment("2026-01-05", "-100", "T1", "text"),
+        Increment("2026-01-05", "-100", "T1", "photo"),
+        Increment("2026-01-06", "-200", "T2", "video"),
+    ])
+
+    assert results == [None] * 4
+    assert storage["merge_days"] == [{
+        "2026-01-05": {"-100": {"T1": {"text": 2, "photo": 1}}},
+        "2026-01-06": {"-200": {"T2": {"video": 1}}},
+    }]
+    assert storage["publish"] == 0
+
+def test_consecutive_assignments_are_written_once(storage):
+    results = commit_batch([
+        SetAssignment("T1", "-200", True),
+        SetAssignment("T1", "-100", False),
+        SetAssignment("T2", "-100", None),
+    ])
+
+    assert results == [(True, "✅ Assigned"), (True, "❌ Unassigned"), (True, "✅ Assigned")]
+    assert storage["writes"] == [{"T1": ["-200"], "T2": ["-100"]}]
+    assert storage["publish"] == 1
+
+def test_failed_merge_is_retried_with_next_batch(storage, monkeypatch):
+    def failing(deltas):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(stats_store, "merge_days", failing)
+    results = commit_batch([
+        Increment("2026-01-05", "-100", "T1", "text"),
+        Increment("2026-01-05", "-100", "T1", "text"),
+    ])
+    assert all(isinstance(r, OSError) for r in results)
+    assert writer.get_writer_stats()["unsaved"] == 2
+
+    monkeypatch.setattr(stats_store, "merge_days", lambda deltas: storage["merge_days"].append(deltas))
+    results = commit_batch([Increment("2026-01-05", "-100", "T1", "text")])
+    assert results == [None]
+    assert storage["merge_days"] == [{"2026-01-05": {"-100": {"T1": {"text": 3}}}}]
+    assert writer.get_writer_stats()["unsaved"] == 0
+
+def test_results_fan_out_to_each_command(storage):
+    def fail():
+        raise ValueError("bad teacher")
+
+    async def run():
+        w = StorageWriter(batch_size=10, linger_ms=0)
+        futures = [
+            w.submit(Increment("2026-01-05", "-100", "T1", "text")),
+            w.submit(Call(lambda a, b: a + b, (2, 3), False)),
+            w.submit(Call(fail, (), True)),
+            w.submit(SetAssignment("T1", "-200", True)),
+        ]
+        await w.stop()
+        return w, await asyncio.gather(*futures, return_exceptions=True)
+
+    w, results = asyncio.run(run())
+
+    assert w.batches == 1
+    assert results[0] is None
+    assert results[1] == 5
+    assert isinstance(results[2], ValueError)
+    assert results[3] == (True, "✅ Assigned")
+    assert storage["publish"] == 1